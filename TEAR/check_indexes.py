@@ -0,0 +1,85 @@
+import os
+import sqlite3
+import sys
+import tempfile
+from database import init_db, db, DB_NAME
+from components.paginated_table import keyset_query
+from views.repairs_view import REPAIRS_QUERY
+from views.vehicles_view import VEHICLES_QUERY, HISTORY_FIRST_PAGE, HISTORY_NEXT_PAGE
+from views.invoices_view import INVOICES_QUERY, UNINVOICED_REPAIRS_QUERY
+from views.dashboard_view import KPI_QUERY, MONTHLY_INCOME_QUERY
+from utils.repair_loader import REPAIR_AGGREGATE
+from utils.reports import PERIOD_TOTALS, ROLLUPS_QUERY, INVOICE_ENTRIES_QUERY, OTHER_INCOME_QUERY
+from utils.photo_store import GARBAGE_QUERY
+
+PERIOD = ("2025-01-01", "2025-01-31")
+
+# Queries issued by the views and reports, imported from the modules that run
+# them, with the only tables each one is allowed to read with a full scan (the
+# table that drives an unfiltered list). Every other table access must be a
+# SEARCH through an index or primary key.
+QUERIES = [
+    ("Lista de reparaciones", *keyset_query(REPAIRS_QUERY, ("r.id", "id", True), None, 50, id_column="r.id"), {"r"}),
+    ("Lista de automóviles", *keyset_query(VEHICLES_QUERY, ("v.id", "id", True), None, 50, id_column="v.id"), {"v"}),
+    ("Lista de facturas", *keyset_query(INVOICES_QUERY, ("i.id", "id", True), None, 50, id_column="i.id"), {"i"}),
+    ("Reparaciones completadas sin factura", UNINVOICED_REPAIRS_QUERY, (), set()),
+    ("Reparación con sus servicios, refacciones y gastos", f"{REPAIR_AGGREGATE} WHERE r.id = ? ORDER BY r.id", (1,), set()),
+    ("Indicadores del dashboard", KPI_QUERY, (), {"kpi_counters"}),
+    ("Ingresos mensuales", MONTHLY_INCOME_QUERY, (), {"monthly_income"}),
+    # The single row of scalar subqueries is the CONSTANT ROW scan
+    ("Totales de un periodo", PERIOD_TOTALS, {"start": PERIOD[0], "end": PERIOD[1]}, {"CONSTANT"}),
+    ("Resúmenes de periodos cerrados", ROLLUPS_QUERY, ("2025-01-01", "2025-12-31"), set()),
+    ("Facturas del periodo", INVOICE_ENTRIES_QUERY, PERIOD, set()),
+    ("Otros ingresos del periodo", OTHER_INCOME_QUERY, PERIOD, set()),
+    ("Historial de un vehículo", HISTORY_FIRST_PAGE, (1, 20), set()),
+    ("Historial de un vehículo (siguiente página)", HISTORY_NEXT_PAGE, (1, "2025-01-31 00:00:00", 1000, 20), set()),
+    ("Fotos sin referencias", GARBAGE_QUERY, ("-86400 seconds",), set()),
+]
+
+def copy_database(source, target):
+    """Copies a database, including its WAL, without writing to the source."""
+    with sqlite3.connect(f"file:{source}?mode=ro", uri=True) as src, sqlite3.connect(target) as dst:
+        src.backup(dst)
+
+def check_indexes(db_path=DB_NAME):
+    """
+    Prints the query plan of every query on a temporary copy of the database,
+    so pending migrations are applied to the copy and never to db_path.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        copy = os.path.join(directory, "tear.db")
+        copy_database(db_path, copy)
+        db.use_database(copy)
+        try:
+            return _check_plans()
+        finally:
+            db.close_all()
+
+def _check_plans():
+    init_db()
+    failures = 0
+    with db.read() as cursor:
+        for name, query, params, allowed_scans in QUERIES:
+            cursor.execute("EXPLAIN QUERY PLAN " + query, params)
+            plan = [row["detail"] for row in cursor.fetchall()]
+            # "SCAN x USING (COVERING) INDEX" walks an index in order and is fine,
+            # and "SCAN (subquery-N)" reads a subquery's rows, not a table
+            scans = [
+                detail for detail in plan
+                if detail.startswith("SCAN ") and "INDEX" not in detail
+                and not detail.split()[1].startswith("(")
+                and detail.split()[1] not in allowed_scans
+            ]
+            status = "OK" if not scans else "FALLA"
+            if scans:
+                failures += 1
+            print(f"[{status}] {name}")
+            for detail in plan:
+                print(f"    {detail}")
+
+    print(f"\n{len(QUERIES) - failures}/{len(QUERIES)} consultas usan índices.")
+    return failures == 0
+
+if __name__ == "__main__":
+    # Usage: python check_indexes.py [ruta/a/tear.db]
+    sys.exit(0 if check_indexes(*sys.argv[1:2]) else 1)
@@ -0,0 +1,77 @@
+import flet as ft
+from components.search_controller import SearchController
+
+class Autocomplete:
+    """
+    Text field that suggests the best matches of an indexed search as the user
+    types, replacing a Dropdown with one option per catalog row. The dialog
+    only ever holds `limit` suggestions, however large the catalog grows.
+    The selected key is read and set through `value`, like a Dropdown's.
+    """
+
+    def __init__(self, label, suggest, describe, on_change=None, limit=20, expand=None):
+        """
+        :param suggest: Function (text, limit) -> keys, best match first; runs on a worker thread.
+        :param describe: Function (key) -> text shown for it, or None when the key no longer exists.
+        :param on_change: Function (key) called after the user picks a suggestion.
+        """
+        self.suggest = suggest
+        self.describe = describe
+        self.on_change = on_change
+        self.limit = limit
+        self._value = None
+
+        self.field = ft.TextField(label=label, expand=expand, suffix_icon="search")
+        self.suggestions = ft.Column(spacing=0, tight=True, visible=False)
+        self.control = ft.Column([self.field, self.suggestions], spacing=0, tight=True, expand=expand)
+
+        self.controller = SearchController(self.field, self._fetch, self._render, delay=0.2)
+        schedule = self.field.on_change
+        def typed(e):
+            # Editing the text drops the selection until a suggestion is picked
+            self._value = None
+            schedule(e)
+        self.field.on_change = typed
+
+    @property
+    def value(self):
+        """Selected key as a string, or None."""
+        return self._value
+
+    @value.setter
+    def value(self, key):
+        text = self.describe(key) if key is not None else None
+        self._value = str(key) if text is not None else None
+        self.field.value = text or ""
+        self.field.error_text = None
+        # Bump the search generation so a pending suggestion list is dropped
+        self.controller.cancel()
+        self.suggestions.controls = []
+        self.suggestions.visible = False
+
+    def _fetch(self, text):
+        return [(key, self.describe(key)) for key in self.suggest(text, self.limit)]
+
+    def _render(self, matches):
+        self.suggestions.controls = [
+            ft.ListTile(title=ft.Text(text), dense=True, on_click=lambda e, key=key: self._pick(key))
+            for key, text in matches if text is not None
+        ]
+        self.suggestions.visible = bool(self.suggestions.controls)
+        if self.field.value and not self.suggestions.visible:
+            self.field.error_text = "Sin coincidencias"
+        else:
+            self.field.error_text = None
+        if self.control.page:
+            self.control.update()
+
+    def _pick(self, key):
+        self.value = key
+        if self._value is None:
+            # Deleted between showing the suggestion and clicking it
+            self.field.error_text = "No encontrado"
+            self.control.update()
+            return
+        self.control.update()
+        if self.on_change:
+            self.on_change(self._value)
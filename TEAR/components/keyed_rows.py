@@ -0,0 +1,61 @@
+class KeyedRows:
+    """
+    Keeps a DataTable's rows indexed by primary key so a single insert, edit
+    or delete patches one DataRow and sends only that control to the client,
+    instead of clearing and rebuilding the whole table.
+    """
+
+    def __init__(self, table, build_row, fetch_row=None, key="id"):
+        """
+        :param table: ft.DataTable whose rows are managed.
+        :param build_row: Function (row) -> ft.DataRow.
+        :param fetch_row: Function (key) -> row or None, used by refresh().
+        :param key: Row field holding the primary key.
+        """
+        self.table = table
+        self.build_row = build_row
+        self.fetch_row = fetch_row
+        self.key = key
+        self._controls = {}
+
+    def __contains__(self, key):
+        return key in self._controls
+
+    def replace(self, rows):
+        """Shows exactly these rows, e.g. after a search. Does not update the page."""
+        self._controls = {}
+        self.table.rows = []
+        self.extend(rows)
+
+    def extend(self, rows):
+        """Appends rows, skipping any that is already shown. Does not update the page."""
+        for row in rows:
+            if row[self.key] not in self._controls:
+                control = self.build_row(row)
+                self._controls[row[self.key]] = control
+                self.table.rows.append(control)
+
+    def upsert(self, row):
+        """Replaces the row with the same key in place, or adds it at the top."""
+        control = self.build_row(row)
+        old = self._controls.get(row[self.key])
+        if old is not None:
+            self.table.rows[self.table.rows.index(old)] = control
+        else:
+            self.table.rows.insert(0, control)
+        self._controls[row[self.key]] = control
+        self.table.update()
+
+    def remove(self, key):
+        old = self._controls.pop(key, None)
+        if old is not None:
+            self.table.rows.remove(old)
+            self.table.update()
+
+    def refresh(self, key):
+        """Re-reads one record after it was written and patches its row."""
+        row = self.fetch_row(key)
+        if row is None:
+            self.remove(key)
+        else:
+            self.upsert(row)
@@ -0,0 +1,145 @@
+import threading
+import flet as ft
+from components.keyed_rows import KeyedRows
+
+def keyset_query(base_query, sort, after, limit, id_column="id"):
+    """
+    Appends keyset pagination to a SELECT without WHERE/ORDER BY clauses.
+    Rows are ordered by the sort column with the id as tie-breaker, and the
+    next page starts right after the last row already shown, so SQLite never
+    has to skip over (OFFSET) the rows of earlier pages.
+    :param sort: (sql column, row field, descending)
+    :param after: Last row of the previous page, or None for the first page.
+    :return: (sql, params)
+    """
+    column, field, descending = sort
+    direction = "DESC" if descending else "ASC"
+    operator = "<" if descending else ">"
+    params = []
+
+    if column == id_column:
+        order_by = f" ORDER BY {id_column} {direction}"
+        if after is not None:
+            base_query += f" WHERE {id_column} {operator} ?"
+            params.append(after[field])
+    else:
+        order_by = f" ORDER BY {column} {direction}, {id_column} {direction}"
+        if after is not None:
+            base_query += f" WHERE ({column}, {id_column}) {operator} (?, ?)"
+            params.extend([after[field], after["id"]])
+
+    return base_query + order_by + " LIMIT ?", params + [limit]
+
+class PaginatedTable:
+    """
+    DataTable that only fetches and renders one page of rows at a time.
+    The next page is requested when the user scrolls near the end of the list
+    (or presses "Cargar más"), and clicking a sortable header re-queries the
+    database in that order instead of sorting in Python. Single records are
+    patched in place with refresh()/remove() after they are written.
+    """
+
+    def __init__(self, page, columns, fetch_page, build_row, sort_columns, fetch_row=None, sort_index=0, descending=True, page_size=50):
+        """
+        :param columns: Header labels.
+        :param fetch_page: Function (sort, after, limit, search_query) -> rows. With a
+            search query it returns the best `limit` matches and is not paged further.
+        :param build_row: Function (row) -> ft.DataRow.
+        :param sort_columns: {column index: (sql column, row field)} for sortable headers.
+        :param fetch_row: Function (id) -> row or None, used by refresh().
+        """
+        self.page = page
+        self.fetch_page = fetch_page
+        self.sort_columns = sort_columns
+        self.sort_index = sort_index
+        self.descending = descending
+        self.page_size = page_size
+        self.search_query = None
+        self._last_row = None
+        self._has_more = False
+        self._loading = False
+        self._lock = threading.Lock()
+
+        self.table = ft.DataTable(
+            columns=[
+                ft.DataColumn(ft.Text(label), on_sort=self._on_sort if index in sort_columns else None)
+                for index, label in enumerate(columns)
+            ],
+            rows=[],
+            sort_column_index=sort_index,
+            sort_ascending=not descending,
+        )
+        self.rows = KeyedRows(self.table, build_row, fetch_row)
+        self.load_more_button = ft.TextButton("Cargar más", icon="expand_more", visible=False, on_click=lambda e: self.load_more())
+        self.control = ft.Column(
+            [self.table, ft.Row([self.load_more_button], alignment=ft.MainAxisAlignment.CENTER)],
+            tight=True,
+        )
+
+    @property
+    def sort(self):
+        column, field = self.sort_columns[self.sort_index]
+        return column, field, self.descending
+
+    def fetch(self, search_query=None):
+        """Fetches the first page for a search text. Safe to run on a worker thread."""
+        search_query = search_query or None
+        return search_query, self.fetch_page(self.sort, None, self.page_size, search_query)
+
+    def show(self, result):
+        """Replaces the table contents with a result returned by fetch()."""
+        search_query, rows = result
+        with self._lock:
+            self.search_query = search_query
+            self.rows.replace(rows)
+            self._last_row = None
+            self._advance(rows)
+        self.page.update()
+
+    def reload(self):
+        self.show(self.fetch(self.search_query))
+
+    def load_more(self):
+        with self._lock:
+            if self._loading or not self._has_more:
+                return
+            self._loading = True
+            sort, after = self.sort, self._last_row
+
+        try:
+            rows = self.fetch_page(sort, after, self.page_size, None)
+            with self._lock:
+                # Drop the page if the list was re-sorted or searched meanwhile
+                if after is self._last_row:
+                    self.rows.extend(rows)
+                    self._advance(rows)
+        finally:
+            self._loading = False
+        self.page.update()
+
+    def refresh(self, row_id):
+        """Patches the row of a record that was just inserted or edited."""
+        with self._lock:
+            self.rows.refresh(row_id)
+
+    def remove(self, row_id):
+        with self._lock:
+            self.rows.remove(row_id)
+
+    def on_scroll(self, e):
+        """Scroll handler for the view's scrollable Column."""
+        if e.max_scroll_extent and e.pixels >= e.max_scroll_extent - 300:
+            self.load_more()
+
+    def _advance(self, rows):
+        self._last_row = rows[-1] if rows else self._last_row
+        # Searches show only their best matches
+        self._has_more = self.search_query is None and len(rows) == self.page_size
+        self.load_more_button.visible = self._has_more
+
+    def _on_sort(self, e):
+        self.sort_index = e.column_index
+        self.descending = not e.ascending
+        self.table.sort_column_index = e.column_index
+        self.table.sort_ascending = e.ascending
+        self.reload()
@@ -0,0 +1,62 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Shared by every list view so searches reuse the workers' pooled DB connections
+_search_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="search")
+
+class SearchController:
+    """
+    Debounces a search TextField and runs its query off the UI event thread.
+    Only the latest keystroke is queried; results that arrive after a newer
+    keystroke are discarded instead of being rendered.
+    """
+
+    def __init__(self, search_field, fetch, render, delay=0.3):
+        """
+        :param search_field: TextField whose on_change is taken over.
+        :param fetch: Function (search_text) -> result, runs on a worker thread.
+        :param render: Function (result) that updates the controls and the page.
+        :param delay: Seconds without typing before the query runs.
+        """
+        self.fetch = fetch
+        self.render = render
+        self.delay = delay
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._timer = None
+        search_field.on_change = lambda e: self.schedule(e.control.value)
+
+    def schedule(self, text):
+        with self._lock:
+            self._generation += 1
+            if self._timer is not None:
+                self._timer.cancel()
+            self._timer = threading.Timer(self.delay, self._submit, args=(text, self._generation))
+            self._timer.daemon = True
+            self._timer.start()
+
+    def cancel(self):
+        """Drops the pending query, and its result if it is already running."""
+        with self._lock:
+            self._generation += 1
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+    def _submit(self, text, generation):
+        if generation == self._generation:
+            _search_executor.submit(self._run, text, generation)
+
+    def _run(self, text, generation):
+        if generation != self._generation:
+            return
+        try:
+            result = self.fetch(text)
+        except Exception as ex:
+            print(f"Error en búsqueda: {ex}")
+            return
+
+        # Render under the lock so a stale result can never overwrite a newer one
+        with self._lock:
+            if generation == self._generation:
+                self.render(result)
@@ -1,20 +1,157 @@
+import re
 import sqlite3
-import os
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from utils.money import to_cents
 
 DB_NAME = "tear.db"
 
-def get_db_connection():
-    conn = sqlite3.connect(DB_NAME, check_same_thread=False, timeout=30.0)
-    conn.row_factory = sqlite3.Row
-    return conn
+# Table written by an INSERT/REPLACE/UPDATE/DELETE statement
+_WRITE_TARGET = re.compile(
+    r"^\s*(?:INSERT|REPLACE|UPDATE|DELETE)(?:\s+OR\s+\w+)?(?:\s+INTO|\s+FROM)?\s+[\"`\[]?(\w+)",
+    re.IGNORECASE
+)
 
-def init_db():
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    # Enable Write-Ahead Logging for better concurrency
-    cursor.execute("PRAGMA journal_mode=WAL;")
-    
+class _TrackingCursor:
+    """Cursor proxy that records the tables written through it."""
+
+    def __init__(self, cursor, written):
+        self._cursor = cursor
+        self._written = written
+
+    def _track(self, sql):
+        match = _WRITE_TARGET.match(sql)
+        if match:
+            self._written.add(match.group(1).lower())
+
+    def execute(self, sql, parameters=()):
+        self._track(sql)
+        self._cursor.execute(sql, parameters)
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        self._track(sql)
+        self._cursor.executemany(sql, seq_of_parameters)
+        return self
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+class ConnectionManager:
+    """
+    Keeps one SQLite connection per thread and serializes writers.
+    Connections are opened lazily and reused for the lifetime of the thread,
+    so the connect/schema-parse cost is paid once instead of on every query.
+    Committed writes bump a per-table version, see data_version().
+    """
+
+    def __init__(self, db_name):
+        self.db_name = db_name
+        self._local = threading.local()
+        self._write_lock = threading.RLock()
+        self._registry_lock = threading.Lock()
+        self._connections = {}
+        self._versions = {}
+
+    def _connect(self):
+        # Autocommit mode: transactions are opened explicitly by write()
+        conn = sqlite3.connect(self.db_name, check_same_thread=False, timeout=30.0, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        # Enable Write-Ahead Logging for better concurrency
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def connection(self):
+        """Returns the connection owned by the calling thread, opening it if needed."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._connect()
+            self._local.conn = conn
+            with self._registry_lock:
+                self._prune_dead_threads()
+                self._connections[threading.get_ident()] = (threading.current_thread(), conn)
+        return conn
+
+    def _prune_dead_threads(self):
+        for ident, (thread, conn) in list(self._connections.items()):
+            if not thread.is_alive():
+                conn.close()
+                del self._connections[ident]
+
+    @contextmanager
+    def read(self):
+        """Yields a cursor for read-only queries."""
+        cursor = self.connection().cursor()
+        try:
+            yield cursor
+        finally:
+            cursor.close()
+
+    @contextmanager
+    def write(self):
+        """
+        Yields a cursor inside a BEGIN IMMEDIATE transaction.
+        Commits on success and rolls back if the block or the commit raises.
+        Nested calls on the same thread join the outer transaction.
+        """
+        conn = self.connection()
+        with self._write_lock:
+            if conn.in_transaction:
+                yield _TrackingCursor(conn.cursor(), self._local.written)
+                return
+
+            self._local.written = set()
+            conn.execute("BEGIN IMMEDIATE")
+            cursor = _TrackingCursor(conn.cursor(), self._local.written)
+            try:
+                yield cursor
+            except BaseException:
+                conn.rollback()
+                raise
+            else:
+                try:
+                    conn.commit()
+                except BaseException:
+                    # A failed COMMIT (SQLITE_BUSY, I/O error) can leave the
+                    # transaction open, and the next write() would join it
+                    # and never commit
+                    conn.rollback()
+                    raise
+                # Still under the write lock, so versions move in commit order
+                for table in self._local.written:
+                    self._versions[table] = self._versions.get(table, 0) + 1
+            finally:
+                cursor.close()
+
+    def data_version(self, tables):
+        """
+        Change counters for these tables, bumped by every committed write()
+        that targeted them directly (rows written by triggers are not seen).
+        Compare two results to know whether data read earlier may be stale.
+        """
+        return tuple(self._versions.get(table, 0) for table in tables)
+
+    def close_all(self):
+        with self._registry_lock:
+            for thread, conn in self._connections.values():
+                conn.close()
+            self._connections.clear()
+        self._local = threading.local()
+
+    def use_database(self, db_name):
+        """Points every later connection at another database file, e.g. a copy for a diagnostic."""
+        self.close_all()
+        self.db_name = db_name
+        self._versions = {}
+
+db = ConnectionManager(DB_NAME)
+
+def _migration_base_schema(cursor):
     # Users (Admins and Technicians)
     cursor.execute('''
     CREATE TABLE IF NOT EXISTS users (
@@ -176,7 +313,7 @@ def init_db():
         description TEXT
     )
     ''')
-    
+
     # Seed default admin user if not exists
     cursor.execute("SELECT * FROM users WHERE username = 'admin'")
     if not cursor.fetchone():
@@ -203,8 +340,658 @@ def init_db():
     )
     ''')
 
-    conn.commit()
-    conn.close()
+def _migration_indexes(cursor):
+    # Join keys and date filters used by the views and reports.
+    # The repair_* and transactions indexes include the selected columns so
+    # those lookups are answered from the index alone.
+    statements = [
+        "CREATE INDEX IF NOT EXISTS idx_vehicles_client_id ON vehicles (client_id)",
+        "CREATE INDEX IF NOT EXISTS idx_repairs_vehicle_id ON repairs (vehicle_id)",
+        "CREATE INDEX IF NOT EXISTS idx_repairs_status ON repairs (status)",
+        "CREATE INDEX IF NOT EXISTS idx_repair_services_repair_id ON repair_services (repair_id, service_id, price_at_moment)",
+        "CREATE INDEX IF NOT EXISTS idx_repair_parts_repair_id ON repair_parts (repair_id, part_id, quantity, price_at_moment)",
+        "CREATE INDEX IF NOT EXISTS idx_repair_expenses_repair_id ON repair_expenses (repair_id)",
+        "CREATE INDEX IF NOT EXISTS idx_invoices_repair_id ON invoices (repair_id)",
+        "CREATE INDEX IF NOT EXISTS idx_invoices_issue_date ON invoices (issue_date)",
+        "CREATE INDEX IF NOT EXISTS idx_transactions_type_date ON transactions (type, date, amount)",
+        "CREATE INDEX IF NOT EXISTS idx_expenses_date ON expenses (date)",
+        "CREATE INDEX IF NOT EXISTS idx_vehicle_history_vehicle_id ON vehicle_history (vehicle_id, created_at)",
+    ]
+    for statement in statements:
+        cursor.execute(statement)
+
+# search_index rowids encode their source row as id * SEARCH_KIND_SLOTS + kind,
+# so triggers can find and replace an entry without scanning the index.
+SEARCH_KIND_SLOTS = 8
+SEARCH_KIND_CLIENT = 0
+SEARCH_KIND_VEHICLE = 1
+SEARCH_KIND_REPAIR = 2
+SEARCH_KIND_HISTORY = 3
+SEARCH_KIND_PART = 4
+SEARCH_KIND_SERVICE = 5
+
+# (kind, table, column expressions for name/phone/plate/details)
+_SEARCH_SOURCES = [
+    (SEARCH_KIND_CLIENT, "clients", "{row}.first_name || ' ' || {row}.last_name", "{row}.phone", "NULL", "NULL"),
+    (SEARCH_KIND_VEHICLE, "vehicles", "{row}.brand || ' ' || {row}.model", "NULL", "{row}.plate", "NULL"),
+    (SEARCH_KIND_REPAIR, "repairs", "NULL", "NULL", "NULL", "{row}.general_details"),
+    (SEARCH_KIND_HISTORY, "vehicle_history", "NULL", "NULL", "NULL", "{row}.description"),
+]
+
+def _migration_search_index(cursor):
+    cursor.execute('''
+    CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5(
+        name, phone, plate, details,
+        tokenize = 'unicode61 remove_diacritics 2',
+        prefix = '1 2 3'
+    )
+    ''')
+
+    for kind, table, *columns in _SEARCH_SOURCES:
+        _index_search_source(cursor, kind, table, columns)
+
+def _index_search_source(cursor, kind, table, columns, update_of=None):
+    """
+    Indexes a table's rows in search_index and keeps them current with triggers.
+    :param update_of: Columns whose updates re-index a row; None for any update.
+    """
+    new_values = ", ".join(c.format(row="NEW") for c in columns)
+    old_rowid = f"OLD.id * {SEARCH_KIND_SLOTS} + {kind}"
+    new_rowid = f"NEW.id * {SEARCH_KIND_SLOTS} + {kind}"
+    update_event = f"UPDATE OF {', '.join(update_of)}" if update_of else "UPDATE"
+
+    cursor.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS {table}_search_insert AFTER INSERT ON {table} BEGIN
+        INSERT INTO search_index (rowid, name, phone, plate, details) VALUES ({new_rowid}, {new_values});
+    END
+    ''')
+    cursor.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS {table}_search_update AFTER {update_event} ON {table} BEGIN
+        DELETE FROM search_index WHERE rowid = {old_rowid};
+        INSERT INTO search_index (rowid, name, phone, plate, details) VALUES ({new_rowid}, {new_values});
+    END
+    ''')
+    cursor.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS {table}_search_delete AFTER DELETE ON {table} BEGIN
+        DELETE FROM search_index WHERE rowid = {old_rowid};
+    END
+    ''')
+
+    # Index the rows that existed before the triggers
+    existing_values = ", ".join(c.format(row=table) for c in columns)
+    cursor.execute(
+        f"INSERT INTO search_index (rowid, name, phone, plate, details) "
+        f"SELECT id * {SEARCH_KIND_SLOTS} + {kind}, {existing_values} FROM {table}"
+    )
+
+# Dashboard figures kept current by triggers: (counter, table, condition on a row)
+_KPI_COUNTERS = [
+    ("clients", "clients", "1"),
+    ("vehicles", "vehicles", "1"),
+    ("active_repairs", "repairs", "{row}.status = 'En Proceso'"),
+]
+
+def _income_change(row, sign, amount):
+    # Adds (sign=1) or removes (sign=-1) one income transaction from the rollups.
+    # `amount` names the money column of transactions and monthly_income.
+    return f'''
+            UPDATE kpi_counters SET value = value + {sign} * {row}.{amount}
+            WHERE name = 'income' AND {row}.type = 'Income';
+            INSERT INTO monthly_income (month, {amount}, transactions)
+            SELECT strftime('%Y-%m', {row}.date), {sign} * {row}.{amount}, {sign}
+            WHERE {row}.type = 'Income'
+            ON CONFLICT (month) DO UPDATE SET
+                {amount} = {amount} + excluded.{amount},
+                transactions = transactions + excluded.transactions;
+            DELETE FROM monthly_income
+            WHERE month = strftime('%Y-%m', {row}.date) AND transactions = 0;
+    '''
+
+def _create_income_triggers(cursor, amount):
+    for event, changes in [
+        ("INSERT", [("NEW", 1)]),
+        ("DELETE", [("OLD", -1)]),
+        ("UPDATE", [("OLD", -1), ("NEW", 1)]),
+    ]:
+        body = "".join(_income_change(row, sign, amount) for row, sign in changes)
+        cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS transactions_kpi_{event.lower()} AFTER {event} ON transactions BEGIN
+            {body}
+        END
+        ''')
+
+def rebuild_kpis(cursor):
+    """
+    Re-derives kpi_counters and monthly_income from the source tables and
+    drops the report rollups, which the next reports recompute.
+    """
+    _rebuild_kpis(cursor, "amount_cents")
+    cursor.execute("DELETE FROM report_rollups")
+
+def _rebuild_kpis(cursor, amount):
+    cursor.execute("DELETE FROM kpi_counters")
+    for name, table, condition in _KPI_COUNTERS:
+        cursor.execute(
+            f"INSERT INTO kpi_counters (name, value) "
+            f"SELECT ?, COUNT(*) FROM {table} WHERE {condition.format(row=table)}",
+            (name,)
+        )
+    cursor.execute(
+        "INSERT INTO kpi_counters (name, value) "
+        f"SELECT 'income', COALESCE(SUM({amount}), 0) FROM transactions WHERE type = 'Income'"
+    )
+
+    cursor.execute("DELETE FROM monthly_income")
+    cursor.execute(f'''
+        INSERT INTO monthly_income (month, {amount}, transactions)
+        SELECT strftime('%Y-%m', date), SUM({amount}), COUNT(*)
+        FROM transactions
+        WHERE type = 'Income'
+        GROUP BY 1
+    ''')
+
+def sync_children(cursor, table, parent_column, parent_id, columns, rows):
+    """
+    Makes the child rows of one parent match `rows`, writing only what changed.
+    Rows are compared by value; unchanged ones are left alone, changed ones are
+    updated in place and the rest inserted or deleted, each kind in a single
+    executemany. Call it inside db.write() so the whole save is one transaction.
+    :param columns: Child columns to write, excluding parent_column.
+    :param rows: Tuples of values in the order of `columns`.
+    :return: (inserted, updated, deleted) row counts.
+    """
+    column_list = ", ".join(columns)
+    cursor.execute(f"SELECT rowid, {column_list} FROM {table} WHERE {parent_column} = ?", (parent_id,))
+    existing = {}
+    for row in cursor.fetchall():
+        existing.setdefault(tuple(row)[1:], []).append(row[0])
+
+    added = []
+    for values in map(tuple, rows):
+        if existing.get(values):
+            existing[values].pop()
+        else:
+            added.append(values)
+    removed = [rowid for rowids in existing.values() for rowid in rowids]
+
+    # Reuse the rows being removed for the new values before inserting or deleting
+    updated = list(zip(added, removed))
+    added, removed = added[len(updated):], removed[len(updated):]
+
+    if updated:
+        assignments = ", ".join(f"{column} = ?" for column in columns)
+        cursor.executemany(
+            f"UPDATE {table} SET {assignments} WHERE rowid = ?",
+            [values + (rowid,) for values, rowid in updated]
+        )
+    if added:
+        placeholders = ", ".join("?" * (len(columns) + 1))
+        cursor.executemany(
+            f"INSERT INTO {table} ({parent_column}, {column_list}) VALUES ({placeholders})",
+            [(parent_id,) + values for values in added]
+        )
+    if removed:
+        cursor.executemany(f"DELETE FROM {table} WHERE rowid = ?", [(rowid,) for rowid in removed])
+    return len(added), len(updated), len(removed)
+
+def _migration_kpis(cursor):
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS kpi_counters (
+        name TEXT PRIMARY KEY,
+        value NUMERIC NOT NULL DEFAULT 0
+    ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS monthly_income (
+        month TEXT PRIMARY KEY,
+        amount REAL NOT NULL DEFAULT 0,
+        transactions INTEGER NOT NULL DEFAULT 0
+    ) WITHOUT ROWID
+    ''')
+
+    for name, table, condition in _KPI_COUNTERS:
+        new_condition = condition.format(row="NEW")
+        old_condition = condition.format(row="OLD")
+        cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS {table}_kpi_insert AFTER INSERT ON {table}
+        WHEN {new_condition} BEGIN
+            UPDATE kpi_counters SET value = value + 1 WHERE name = '{name}';
+        END
+        ''')
+        cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS {table}_kpi_delete AFTER DELETE ON {table}
+        WHEN {old_condition} BEGIN
+            UPDATE kpi_counters SET value = value - 1 WHERE name = '{name}';
+        END
+        ''')
+        if condition != "1":
+            cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_kpi_update AFTER UPDATE ON {table}
+            WHEN ({old_condition}) IS NOT ({new_condition}) BEGIN
+                UPDATE kpi_counters SET value = value - ({old_condition}) + ({new_condition})
+                WHERE name = '{name}';
+            END
+            ''')
+
+    _create_income_triggers(cursor, "amount")
+    _rebuild_kpis(cursor, "amount")
+
+# Money columns converted from REAL to INTEGER cents by _migration_money_cents
+_MONEY_COLUMNS = [
+    ("services", "price"),
+    ("parts", "base_price"),
+    ("repairs", "total_cost"),
+    ("repair_services", "price_at_moment"),
+    ("repair_parts", "price_at_moment"),
+    ("repair_expenses", "amount"),
+    ("invoices", "total_amount"),
+    ("transactions", "amount"),
+    ("expenses", "amount"),
+]
+
+def _migration_money_cents(cursor):
+    # Decimal rounding in Python: ROUND(x * 100) in SQL turns 0.285 into 28
+    cursor.connection.create_function("to_cents", 1, lambda value: to_cents(value or 0), deterministic=True)
+
+    # Indexes and triggers on the old columns block DROP COLUMN
+    for index in ["idx_repair_services_repair_id", "idx_repair_parts_repair_id", "idx_transactions_type_date"]:
+        cursor.execute(f"DROP INDEX IF EXISTS {index}")
+    for event in ["insert", "update", "delete"]:
+        cursor.execute(f"DROP TRIGGER IF EXISTS transactions_kpi_{event}")
+
+    for table, column in _MONEY_COLUMNS:
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column}_cents INTEGER NOT NULL DEFAULT 0")
+        cursor.execute(f"UPDATE {table} SET {column}_cents = to_cents({column})")
+        cursor.execute(f"ALTER TABLE {table} DROP COLUMN {column}")
+
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_repair_services_repair_id ON repair_services (repair_id, service_id, price_at_moment_cents)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_repair_parts_repair_id ON repair_parts (repair_id, part_id, quantity, price_at_moment_cents)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_transactions_type_date ON transactions (type, date, amount_cents)")
+
+    # The rollups only hold derived data, so they are rebuilt in cents
+    cursor.execute("DROP TABLE IF EXISTS monthly_income")
+    cursor.execute('''
+    CREATE TABLE monthly_income (
+        month TEXT PRIMARY KEY,
+        amount_cents INTEGER NOT NULL DEFAULT 0,
+        transactions INTEGER NOT NULL DEFAULT 0
+    ) WITHOUT ROWID
+    ''')
+    _create_income_triggers(cursor, "amount_cents")
+    _rebuild_kpis(cursor, "amount_cents")
+
+# How a repair's status affects the parts on it: 'En Proceso' reserves them,
+# 'Completada' takes them out of stock and 'Cancelada' releases them.
+def _reserved_qty(status, quantity):
+    return f"(CASE WHEN {status} = 'En Proceso' THEN {quantity} ELSE 0 END)"
+
+def _consumed_qty(status, quantity):
+    return f"(CASE WHEN {status} = 'Completada' THEN {quantity} ELSE 0 END)"
+
+def _repair_part_movement(part, sign, reason):
+    # Ledger entry that applies (sign=1) or reverses (sign=-1) one repair_parts row
+    return f'''
+            INSERT INTO stock_movements (part_id, repair_id, on_hand_delta, reserved_delta, reason)
+            SELECT {part}.part_id, {part}.repair_id,
+                   {-sign} * {_consumed_qty("r.status", f"{part}.quantity")},
+                   {sign} * {_reserved_qty("r.status", f"{part}.quantity")},
+                   '{reason}'
+            FROM repairs r
+            WHERE r.id = {part}.repair_id AND r.status IN ('En Proceso', 'Completada');
+    '''
+
+def rebuild_stock(cursor):
+    """Re-derives the cached parts.stock and parts.reserved from stock_movements."""
+    cursor.execute('''
+        UPDATE parts SET
+            stock = COALESCE((SELECT SUM(on_hand_delta) FROM stock_movements m WHERE m.part_id = parts.id), 0),
+            reserved = COALESCE((SELECT SUM(reserved_delta) FROM stock_movements m WHERE m.part_id = parts.id), 0)
+    ''')
+
+def _migration_stock_ledger(cursor):
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS stock_movements (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        part_id INTEGER NOT NULL,
+        repair_id INTEGER,
+        on_hand_delta INTEGER NOT NULL DEFAULT 0,
+        reserved_delta INTEGER NOT NULL DEFAULT 0,
+        reason TEXT NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (part_id) REFERENCES parts (id),
+        FOREIGN KEY (repair_id) REFERENCES repairs (id)
+    )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_stock_movements_part_id ON stock_movements (part_id, created_at)")
+    cursor.execute("ALTER TABLE parts ADD COLUMN reserved INTEGER NOT NULL DEFAULT 0")
+
+    # Opening balances: the counted stock, plus reservations for open repairs.
+    # Completed repairs are assumed to be reflected in the counted stock already.
+    cursor.execute('''
+        INSERT INTO stock_movements (part_id, on_hand_delta, reason)
+        SELECT id, stock, 'Saldo inicial' FROM parts WHERE stock != 0
+    ''')
+    cursor.execute('''
+        INSERT INTO stock_movements (part_id, repair_id, reserved_delta, reason)
+        SELECT rp.part_id, rp.repair_id, rp.quantity, 'Saldo inicial'
+        FROM repair_parts rp
+        JOIN repairs r ON r.id = rp.repair_id
+        WHERE r.status = 'En Proceso'
+    ''')
+    rebuild_stock(cursor)
+
+    # Every change to the ledger moves the cached columns, so reads never re-sum it
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS stock_movements_apply AFTER INSERT ON stock_movements BEGIN
+        UPDATE parts SET
+            stock = stock + NEW.on_hand_delta,
+            reserved = reserved + NEW.reserved_delta
+        WHERE id = NEW.part_id;
+    END
+    ''')
+    # Aborts the whole save when it would use more units than are available
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS parts_stock_check AFTER UPDATE OF stock, reserved ON parts
+    WHEN NEW.stock - NEW.reserved < 0 AND NEW.stock - NEW.reserved < OLD.stock - OLD.reserved BEGIN
+        SELECT RAISE(ABORT, 'Stock insuficiente para la refacción');
+    END
+    ''')
+
+    cursor.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS repair_parts_stock_insert AFTER INSERT ON repair_parts BEGIN
+        {_repair_part_movement("NEW", 1, "Reparación")}
+    END
+    ''')
+    cursor.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS repair_parts_stock_update AFTER UPDATE OF part_id, quantity ON repair_parts
+    WHEN OLD.part_id IS NOT NEW.part_id OR OLD.quantity IS NOT NEW.quantity BEGIN
+        {_repair_part_movement("OLD", -1, "Reparación editada")}
+        {_repair_part_movement("NEW", 1, "Reparación editada")}
+    END
+    ''')
+    cursor.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS repair_parts_stock_delete AFTER DELETE ON repair_parts BEGIN
+        {_repair_part_movement("OLD", -1, "Reparación editada")}
+    END
+    ''')
+
+    # Status changes move the repair's parts between reserved, consumed and free
+    cursor.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS repairs_stock_status AFTER UPDATE OF status ON repairs
+    WHEN OLD.status IS NOT NEW.status BEGIN
+        INSERT INTO stock_movements (part_id, repair_id, on_hand_delta, reserved_delta, reason)
+        SELECT part_id, repair_id,
+               {_consumed_qty("OLD.status", "quantity")} - {_consumed_qty("NEW.status", "quantity")},
+               {_reserved_qty("NEW.status", "quantity")} - {_reserved_qty("OLD.status", "quantity")},
+               'Reparación ' || NEW.status
+        FROM repair_parts
+        WHERE repair_id = NEW.id
+          AND (OLD.status IN ('En Proceso', 'Completada') OR NEW.status IN ('En Proceso', 'Completada'));
+    END
+    ''')
+    cursor.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS repairs_stock_delete AFTER DELETE ON repairs
+    WHEN OLD.status IN ('En Proceso', 'Completada') BEGIN
+        INSERT INTO stock_movements (part_id, repair_id, on_hand_delta, reserved_delta, reason)
+        SELECT part_id, repair_id,
+               {_consumed_qty("OLD.status", "quantity")},
+               -{_reserved_qty("OLD.status", "quantity")},
+               'Reparación eliminada'
+        FROM repair_parts
+        WHERE repair_id = OLD.id;
+    END
+    ''')
+
+# Tables whose photo_path column holds a reference to a stored photo blob
+_PHOTO_REFERENCES = ["vehicles", "vehicle_history"]
+
+# Photo paths saved before the photo store, which no blob stands for
+LEGACY_PHOTOS_QUERY = " UNION ".join(
+    f"SELECT photo_path FROM {table} WHERE photo_path IS NOT NULL" for table in _PHOTO_REFERENCES
+) + " EXCEPT SELECT path FROM photo_blobs"
+
+def rebuild_photo_refs(cursor):
+    """Re-derives photo_blobs.refcount from the rows that point at each blob."""
+    counts = " + ".join(
+        f"(SELECT COUNT(*) FROM {table} WHERE photo_path = photo_blobs.path)"
+        for table in _PHOTO_REFERENCES
+    )
+    cursor.execute(f"UPDATE photo_blobs SET refcount = {counts}")
+
+def _migration_photo_blobs(cursor):
+    # Content-addressed photo store: one file per distinct SHA-256, shared by
+    # every row that points at it. Blobs with refcount 0 are left for the
+    # garbage collector (gc_photos.py) once they are older than its grace period.
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS photo_blobs (
+        sha256 TEXT PRIMARY KEY,
+        path TEXT NOT NULL UNIQUE,
+        size INTEGER NOT NULL,
+        refcount INTEGER NOT NULL DEFAULT 0,
+        stored_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_photo_blobs_unreferenced ON photo_blobs (stored_at) WHERE refcount = 0")
+
+    for table in _PHOTO_REFERENCES:
+        cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS {table}_photo_ref_insert AFTER INSERT ON {table}
+        WHEN NEW.photo_path IS NOT NULL BEGIN
+            UPDATE photo_blobs SET refcount = refcount + 1 WHERE path = NEW.photo_path;
+        END
+        ''')
+        cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS {table}_photo_ref_update AFTER UPDATE OF photo_path ON {table}
+        WHEN OLD.photo_path IS NOT NEW.photo_path BEGIN
+            UPDATE photo_blobs SET refcount = refcount - 1 WHERE path = OLD.photo_path;
+            UPDATE photo_blobs SET refcount = refcount + 1 WHERE path = NEW.photo_path;
+        END
+        ''')
+        cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS {table}_photo_ref_delete AFTER DELETE ON {table}
+        WHEN OLD.photo_path IS NOT NULL BEGIN
+            UPDATE photo_blobs SET refcount = refcount - 1 WHERE path = OLD.photo_path;
+        END
+        ''')
+
+def _migration_invoice_pdf_status(cursor):
+    # Invoice PDFs are rendered by a background queue after the invoice row is
+    # committed: 'Pendiente' until the PDF is written, then 'Lista' or 'Fallida'
+    cursor.execute("ALTER TABLE invoices ADD COLUMN pdf_status TEXT NOT NULL DEFAULT 'Pendiente'")
+    cursor.execute("ALTER TABLE invoices ADD COLUMN pdf_error TEXT")
+    cursor.execute("UPDATE invoices SET pdf_status = 'Lista' WHERE pdf_path IS NOT NULL")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_invoices_pdf_pending ON invoices (id) WHERE pdf_status = 'Pendiente'")
+
+# Catalogs searched by the autocomplete pickers: (kind, table, name/phone/plate/details, columns that re-index).
+# Parts are only re-indexed when renamed, not on every stock movement.
+_CATALOG_SEARCH_SOURCES = [
+    (SEARCH_KIND_PART, "parts", ["{row}.name", "NULL", "NULL", "NULL"], ["name"]),
+    (SEARCH_KIND_SERVICE, "services", ["{row}.name", "NULL", "NULL", "{row}.description"], ["name", "description"]),
+]
+
+def _migration_search_catalogs(cursor):
+    for kind, table, columns, update_of in _CATALOG_SEARCH_SOURCES:
+        _index_search_source(cursor, kind, table, columns, update_of)
+
+# Figures of the financial report: (metric, table, date column, amount column,
+# condition on a row, columns whose updates move it)
+REPORT_METRICS = [
+    ("invoices", "invoices", "issue_date", "total_amount_cents", "1", ["issue_date", "total_amount_cents"]),
+    ("other_income", "transactions", "date", "amount_cents", "{row}.type = 'Income' AND {row}.related_repair_id IS NULL",
+     ["type", "date", "amount_cents", "related_repair_id"]),
+    ("expenses", "expenses", "date", "amount_cents", "1", ["date", "amount_cents"]),
+]
+
+def _migration_report_rollups(cursor):
+    # Totals of closed periods (past months and weeks), filled in lazily by
+    # utils.reports. A closed period never changes unless a row dated inside
+    # it is written afterwards; the triggers below drop its rollup when that
+    # happens, and the next report recomputes it.
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS report_rollups (
+        period_start TEXT NOT NULL,
+        period_end TEXT NOT NULL,
+        metric TEXT NOT NULL,
+        amount_cents INTEGER NOT NULL,
+        PRIMARY KEY (period_start, period_end, metric)
+    ) WITHOUT ROWID
+    ''')
+
+    for metric, table, date_column, amount, condition, columns in REPORT_METRICS:
+        for event, rows in [
+            ("INSERT", ["NEW"]),
+            ("DELETE", ["OLD"]),
+            (f"UPDATE OF {', '.join(columns)}", ["OLD", "NEW"]),
+        ]:
+            body = "".join(
+                f'''
+            DELETE FROM report_rollups
+            WHERE period_start <= {row}.{date_column} AND period_end >= {row}.{date_column};'''
+                for row in rows
+            )
+            cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_rollup_{event.split()[0].lower()} AFTER {event} ON {table} BEGIN
+                {body}
+            END
+            ''')
+
+# expenses.period_type values that repeat from `date` (until end_date, when set)
+# instead of counting once on it
+RECURRING_EXPENSE_PERIODS = ("Semanal", "Mensual")
+# The same values as an SQL list, for `period_type IN (...)`
+RECURRING_EXPENSE_PERIODS_SQL = ", ".join(f"'{period}'" for period in RECURRING_EXPENSE_PERIODS)
+
+def _expense_rollups_touched(row):
+    # Every period a recurring expense can fall in, or the day of a one-time one
+    return f'''
+            DELETE FROM report_rollups
+            WHERE period_end >= {row}.date
+              AND period_start <= CASE WHEN {row}.period_type IN ({RECURRING_EXPENSE_PERIODS_SQL})
+                                       THEN COALESCE({row}.end_date, '9999-12-31') ELSE {row}.date END;'''
+
+def _migration_recurring_expenses(cursor):
+    cursor.execute("ALTER TABLE expenses ADD COLUMN end_date TEXT")
+    cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_expenses_recurring ON expenses (date) WHERE period_type IN ({RECURRING_EXPENSE_PERIODS_SQL})")
+
+    # One row per day, filled in on demand by utils.recurrence, so recurring
+    # expenses are expanded by a join instead of row by row in Python
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS calendar (
+        date TEXT PRIMARY KEY,
+        weekday INTEGER NOT NULL, -- 0 = Sunday, as strftime('%w')
+        day INTEGER NOT NULL,
+        month_days INTEGER NOT NULL
+    ) WITHOUT ROWID
+    ''')
+
+    # A recurring expense changes every period after its date, not only its own
+    for event in ["insert", "update", "delete"]:
+        cursor.execute(f"DROP TRIGGER IF EXISTS expenses_rollup_{event}")
+    for event, rows in [
+        ("INSERT", ["NEW"]),
+        ("DELETE", ["OLD"]),
+        ("UPDATE OF date, amount_cents, period_type, end_date", ["OLD", "NEW"]),
+    ]:
+        body = "".join(_expense_rollups_touched(row) for row in rows)
+        cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS expenses_rollup_{event.split()[0].lower()} AFTER {event} ON expenses BEGIN
+            {body}
+        END
+        ''')
+
+    # Rollups stored so far counted recurring expenses once
+    cursor.execute("DELETE FROM report_rollups")
+
+def _migration_unique_invoice_per_repair(cursor):
+    # Before this index a repair could be invoiced twice when the manual and
+    # bulk paths raced. Invoices already issued are never deleted: every later
+    # invoice of a repair is marked as a duplicate of its first one, keeps its
+    # PDF, number and income, and is left out of the unique index.
+    cursor.execute("ALTER TABLE invoices ADD COLUMN duplicate_of INTEGER REFERENCES invoices(id)")
+    cursor.execute('''
+        UPDATE invoices
+        SET duplicate_of = (SELECT MIN(first.id) FROM invoices first WHERE first.repair_id = invoices.repair_id)
+        WHERE EXISTS (SELECT 1 FROM invoices first WHERE first.repair_id = invoices.repair_id AND first.id < invoices.id)
+    ''')
+    cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_invoices_one_per_repair ON invoices (repair_id) WHERE duplicate_of IS NULL")
+
+    cursor.execute('''
+        SELECT repair_id, GROUP_CONCAT(id, ', ') AS invoice_ids FROM invoices
+        WHERE repair_id IN (SELECT repair_id FROM invoices WHERE duplicate_of IS NOT NULL)
+        GROUP BY repair_id ORDER BY repair_id
+    ''')
+    for row in cursor.fetchall():
+        print(f"Reparación #{row['repair_id']} facturada más de una vez (facturas {row['invoice_ids']}); revise las duplicadas.")
+
+# Ways dates were typed into the expense dialog before it validated them
+_LEGACY_DATE_FORMATS = ["%Y-%m-%d", "%Y-%m-%d %H:%M:%S", "%Y/%m/%d", "%d/%m/%Y", "%d-%m-%Y", "%d/%m/%y"]
+
+def _iso_date(value):
+    for date_format in _LEGACY_DATE_FORMATS:
+        try:
+            return datetime.strptime(value.strip(), date_format).strftime("%Y-%m-%d")
+        except (AttributeError, ValueError):
+            pass
+    return value
+
+def _migration_iso_expense_dates(cursor):
+    # Recurring expenses are expanded from their dates, so rewrite the ones
+    # stored as free text; any that cannot be read stay as they are and are
+    # skipped by utils.recurrence
+    cursor.connection.create_function("iso_date", 1, _iso_date, deterministic=True)
+    cursor.execute("UPDATE expenses SET date = iso_date(date) WHERE date(date) IS NOT date")
+    cursor.execute("UPDATE expenses SET end_date = iso_date(end_date) WHERE end_date IS NOT NULL AND date(end_date) IS NOT end_date")
+
+def _migration_import_legacy_photos(cursor):
+    # The vehicle history shows a photo only when its blob is in photo_blobs,
+    # so photos saved before the store existed are imported into it first.
+    cursor.execute(LEGACY_PHOTOS_QUERY)
+    if cursor.fetchone() is None:
+        return
+    # Imported lazily: utils.image_pipeline needs Pillow and this module
+    from utils.image_pipeline import import_legacy_photos
+    imported, found = import_legacy_photos(cursor)
+    if found:
+        print(f"Fotos importadas al almacén: {imported} de {found}")
+
+# Schema migrations in the order they must run. PRAGMA user_version stores how
+# many of them a database has already applied, so init_db() only runs new ones.
+# Never reorder or edit a released migration; append a new one instead.
+MIGRATIONS = [
+    _migration_base_schema,
+    _migration_indexes,
+    _migration_search_index,
+    _migration_kpis,
+    _migration_money_cents,
+    _migration_stock_ledger,
+    _migration_photo_blobs,
+    _migration_invoice_pdf_status,
+    _migration_search_catalogs,
+    _migration_report_rollups,
+    _migration_recurring_expenses,
+    _migration_unique_invoice_per_repair,
+    _migration_iso_expense_dates,
+    _migration_import_legacy_photos,
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+def get_schema_version(cursor):
+    cursor.execute("PRAGMA user_version")
+    return cursor.fetchone()[0]
+
+def init_db():
+    with db.read() as cursor:
+        if get_schema_version(cursor) >= SCHEMA_VERSION:
+            return
+
+    for number, migration in enumerate(MIGRATIONS, start=1):
+        with db.write() as cursor:
+            # Another instance may have applied it while we waited for the lock
+            if get_schema_version(cursor) >= number:
+                continue
+            migration(cursor)
+            cursor.execute(f"PRAGMA user_version = {number}")
 
 if __name__ == "__main__":
     init_db()
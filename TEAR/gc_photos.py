@@ -0,0 +1,30 @@
+import glob
+import os
+import time
+from database import init_db, db, rebuild_photo_refs
+from utils.photo_store import collect_garbage
+
+PHOTOS_DIR = os.path.join("assets", "vehicle_photos")
+
+# Same as the camera bridge's DURACION_SESION: older QR images belong to dead sessions
+QR_MAX_AGE = 30 * 60
+
+def gc():
+    """Deletes stored photos no vehicle or history entry uses anymore, and stale QR images."""
+    init_db()
+    with db.write() as cursor:
+        rebuild_photo_refs(cursor)
+    blobs, freed = collect_garbage()
+    print(f"Fotos sin referencias eliminadas: {blobs} ({freed / (1024 * 1024):.1f} MB)")
+
+    # QR images of capture sessions that already expired
+    stale = [
+        path for path in glob.glob(os.path.join(PHOTOS_DIR, "temp_qr_code_*.png"))
+        if os.path.getmtime(path) < time.time() - QR_MAX_AGE
+    ]
+    for path in stale:
+        os.remove(path)
+    print(f"Códigos QR temporales eliminados: {len(stale)}")
+
+if __name__ == "__main__":
+    gc()
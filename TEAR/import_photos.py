@@ -0,0 +1,16 @@
+from database import init_db, db
+from utils.image_pipeline import import_legacy_photos
+
+def import_photos():
+    """
+    Stores the vehicle photos that still point outside the photo store.
+    init_db() already imports them once (_migration_import_legacy_photos);
+    this re-runs it, e.g. after restoring old photo files from a backup.
+    """
+    init_db()
+    with db.write() as cursor:
+        imported, found = import_legacy_photos(cursor)
+    print(f"Fotos importadas al almacén: {imported} de {found}")
+
+if __name__ == "__main__":
+    import_photos()
@@ -0,0 +1,154 @@
+import argparse
+import http.client
+import os
+import secrets
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import urlsplit
+
+from utils.camera_bridge import GestorCamaraMovil, TRABAJADORES
+
+# Load test for the phone photo bridge: opens one capture session per upload
+# and has N clients send their photo at the same moment, like N phones
+# scanning their QR codes at once. Runs its own server on a spare port, so it
+# does not touch the app's photos or the one listening on port 5000.
+# By default the clients use the resumable block protocol of the mobile page;
+# --cortes makes each one drop its connection mid-block once and resume.
+
+def _multipart(nombre, contenido):
+    boundary = secrets.token_hex(16)
+    cuerpo = b"".join([
+        f"--{boundary}\r\n".encode(),
+        f'Content-Disposition: form-data; name="file"; filename="{nombre}"\r\n'.encode(),
+        b"Content-Type: image/jpeg\r\n\r\n",
+        contenido,
+        f"\r\n--{boundary}--\r\n".encode(),
+    ])
+    return cuerpo, f"multipart/form-data; boundary={boundary}"
+
+def _pedir(puerto, metodo, ruta, cuerpo=None, cabeceras=None):
+    conexion = http.client.HTTPConnection("127.0.0.1", puerto, timeout=120)
+    try:
+        conexion.request(metodo, ruta, body=cuerpo, headers=cabeceras or {})
+        respuesta = conexion.getresponse()
+        respuesta.read()
+        return respuesta
+    finally:
+        conexion.close()
+
+def _cortar_bloque(puerto, ruta, offset, bloque):
+    """Sends half of a PATCH body and closes the socket, like a phone losing Wi-Fi."""
+    conexion = http.client.HTTPConnection("127.0.0.1", puerto, timeout=120)
+    conexion.putrequest("PATCH", ruta)
+    conexion.putheader("Upload-Offset", str(offset))
+    conexion.putheader("Content-Length", str(len(bloque)))
+    conexion.endheaders(bloque[:len(bloque) // 2])
+    conexion.close()
+
+def _subir_formulario(puerto, ruta, contenido, tamano_bloque, cortar):
+    cuerpo, tipo = _multipart("foto.jpg", contenido)
+    return _pedir(puerto, "POST", ruta, cuerpo, {"Content-Type": tipo}).status
+
+def _subir_por_bloques(puerto, ruta, contenido, tamano_bloque, cortar):
+    creada = _pedir(puerto, "POST", ruta + "/subidas", cabeceras={"Upload-Length": str(len(contenido))})
+    if creada.status != 201:
+        return creada.status
+    url = creada.getheader("Location")
+    offset = 0
+    while offset < len(contenido):
+        bloque = contenido[offset:offset + tamano_bloque]
+        if cortar:
+            _cortar_bloque(puerto, url, offset, bloque)
+            cortar = False
+            respuesta = None
+        else:
+            respuesta = _pedir(puerto, "PATCH", url, bloque, {
+                "Upload-Offset": str(offset),
+                "Content-Type": "application/offset+octet-stream",
+            })
+        if respuesta is not None and respuesta.status == 204:
+            offset = int(respuesta.getheader("Upload-Offset"))
+        elif respuesta is None or respuesta.status == 409:
+            # Same recovery as the mobile page: ask how much arrived and resume
+            time.sleep(0.05)
+            offset = int(_pedir(puerto, "HEAD", url).getheader("Upload-Offset"))
+        else:
+            return respuesta.status
+    return 200
+
+def _subir(enviar, puerto, ruta, contenido, tamano_bloque, cortar, salida, inicio):
+    inicio.wait()
+    t0 = time.perf_counter()
+    try:
+        estado = enviar(puerto, ruta, contenido, tamano_bloque, cortar)
+    except OSError as e:
+        estado = str(e)
+    salida.append((estado, time.perf_counter() - t0))
+
+def run(subidas, tamano_kb, trabajadores, puerto, bloque_kb=512, cortes=False, formulario=False):
+    directorio = tempfile.mkdtemp(prefix="tear_camara_")
+    # Photos are handed straight to the callback: this measures the transport,
+    # without the image pipeline or writes to the photo store and database
+    gestor = GestorCamaraMovil(
+        directorio_guardado=directorio,
+        puerto=puerto,
+        trabajadores=trabajadores,
+        al_recibir=lambda ruta, callback: callback(ruta),
+    )
+    recibidas = []
+    contenido = os.urandom(tamano_kb * 1024)
+
+    hilos, resultados = [], []
+    inicio = threading.Barrier(subidas)
+    enviar = _subir_formulario if formulario else _subir_por_bloques
+    for i in range(subidas):
+        _, url, _ = gestor.iniciar_servicio(f"foto_{i}.jpg", recibidas.append)
+        hilos.append(threading.Thread(
+            target=_subir,
+            args=(enviar, puerto, urlsplit(url).path, contenido, bloque_kb * 1024, cortes, resultados, inicio)
+        ))
+
+    t0 = time.perf_counter()
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    total = time.perf_counter() - t0
+
+    t1 = time.perf_counter()
+    gestor.detener_servicio()
+    cierre = time.perf_counter() - t1
+
+    tiempos = sorted(t for estado, t in resultados if estado == 200)
+    fallidas = [estado for estado, _ in resultados if estado != 200]
+    completas = [r for r in recibidas if os.path.getsize(r) == len(contenido)]
+    shutil.rmtree(directorio, ignore_errors=True)
+
+    modo = "formulario" if formulario else f"bloques de {bloque_kb} KB" + (" con cortes" if cortes else "")
+    print(f"{subidas} subidas de {tamano_kb} KB ({modo}) con {trabajadores} trabajadores")
+    if tiempos:
+        print(f"  Tiempo total:  {total:.2f} s ({subidas * tamano_kb / 1024 / total:.1f} MB/s)")
+        print(f"  Latencia p50:  {tiempos[len(tiempos) // 2]:.3f} s")
+        print(f"  Latencia p95:  {tiempos[min(len(tiempos) - 1, int(len(tiempos) * 0.95))]:.3f} s")
+        print(f"  Latencia máx:  {tiempos[-1]:.3f} s")
+    print(f"  Cierre limpio: {cierre:.2f} s")
+    print(f"  Fotos completas recibidas: {len(completas)}/{subidas}")
+    if fallidas:
+        print(f"  Fallidas: {len(fallidas)} ({', '.join(sorted(set(map(str, fallidas))))})")
+    return not fallidas and len(completas) == subidas
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Prueba de carga del puente de fotos del celular.")
+    parser.add_argument("-n", "--subidas", type=int, default=20, help="Subidas simultáneas")
+    parser.add_argument("--tamano-kb", type=int, default=2048, help="Tamaño de cada foto en KB")
+    parser.add_argument("--trabajadores", type=int, default=TRABAJADORES, help="Hilos del servidor")
+    parser.add_argument("--puerto", type=int, default=5055)
+    parser.add_argument("--bloque-kb", type=int, default=512, help="Tamaño de cada PATCH en KB")
+    parser.add_argument("--cortes", action="store_true", help="Cortar la conexión una vez a media subida")
+    parser.add_argument("--formulario", action="store_true", help="Enviar la foto completa en un POST multipart")
+    args = parser.parse_args()
+    ok = run(args.subidas, args.tamano_kb, args.trabajadores, args.puerto, args.bloque_kb, args.cortes, args.formulario)
+    sys.exit(0 if ok else 1)
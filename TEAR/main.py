@@ -1,17 +1,29 @@
+import importlib
+import multiprocessing
 import flet as ft
-from database import init_db, get_db_connection
+from database import init_db, db
 from components.sidebar import Sidebar
-from views.dashboard_view import DashboardView
-from views.users_view import UsersView
-from views.clients_view import ClientsView
-from views.vehicles_view import VehiclesView
-from views.services_view import ServicesView
-from views.parts_view import PartsView
-from views.technicians_view import TechniciansView
-from views.tools_view import ToolsView
-from views.repairs_view import RepairsView
-from views.invoices_view import InvoicesView
-from views.finances_view import FinancesView
+
+# route: (module, view function, tables whose changes make a built view stale).
+# Modules are imported on first visit, so Flask, qrcode and fpdf are only
+# loaded when a view that needs them is opened.
+ROUTES = {
+    "/dashboard": ("views.dashboard_view", "DashboardView", ["clients", "vehicles", "repairs", "transactions"]),
+    "/users": ("views.users_view", "UsersView", ["users"]),
+    "/clients": ("views.clients_view", "ClientsView", ["clients"]),
+    "/vehicles": ("views.vehicles_view", "VehiclesView", ["vehicles", "clients", "vehicle_history"]),
+    "/services": ("views.services_view", "ServicesView", ["services"]),
+    "/parts": ("views.parts_view", "PartsView", ["parts", "repairs", "repair_parts", "stock_movements"]),
+    "/technicians": ("views.technicians_view", "TechniciansView", ["technicians"]),
+    "/tools": ("views.tools_view", "ToolsView", ["tools"]),
+    "/repairs": ("views.repairs_view", "RepairsView", ["repairs", "vehicles", "clients"]),
+    "/invoices": ("views.invoices_view", "InvoicesView", ["invoices", "repairs", "vehicles", "clients"]),
+    "/finances": ("views.finances_view", "FinancesView", ["transactions", "expenses"]),
+}
+
+def _view_function(route):
+    module_name, function_name, _ = ROUTES[route]
+    return getattr(importlib.import_module(module_name), function_name)
 
 def main(page: ft.Page):
     # Initialize Database
@@ -37,6 +49,9 @@ def main(page: ft.Page):
         )
     )
 
+    # route -> (data versions it was built with, ft.View), reused while unchanged
+    view_cache = {}
+
     def navigate(route):
         page.go(route)
 
@@ -47,16 +62,15 @@ def main(page: ft.Page):
         import hashlib
         hashed_password = hashlib.sha256(password.encode()).hexdigest()
         
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM users WHERE username = ? AND password_hash = ?", (username, hashed_password))
-        user = cursor.fetchone()
-        conn.close()
+        with db.read() as cursor:
+            cursor.execute("SELECT * FROM users WHERE username = ? AND password_hash = ?", (username, hashed_password))
+            user = cursor.fetchone()
 
         if user:
             page.session.set("user_id", user["id"])
             page.session.set("role", user["role"])
             page.session.set("full_name", user["full_name"])
+            view_cache.clear()
             page.go("/dashboard")
         else:
             page.snack_bar = ft.SnackBar(ft.Text("Credenciales incorrectas"))
@@ -70,6 +84,9 @@ def main(page: ft.Page):
         content = ft.Container(expand=True)
         
         if page.route == "/":
+            # Views show data of the signed-in user, so drop them on logout
+            view_cache.clear()
+
             # Login View (Full Screen, no Sidebar)
             username_field = ft.TextField(label="Usuario", width=300)
             password_field = ft.TextField(label="Contraseña", password=True, can_reveal_password=True, width=300)
@@ -119,51 +136,41 @@ def main(page: ft.Page):
                 # Change route to dashboard instead of navigating, to avoid blank screen
                 page.route = "/dashboard"
 
+            # Reuse the view built on an earlier visit if its data has not changed
+            route_info = ROUTES.get(page.route)
+            versions = db.data_version(route_info[2]) if route_info else None
+            cached = view_cache.get(page.route)
+            if cached and cached[0] == versions:
+                page.views.append(cached[1])
+                page.update()
+                return
+
             # Main App Layout (Sidebar + Content)
-            if page.route == "/dashboard":
-                content = DashboardView(page)
-            elif page.route == "/users":
-                content = UsersView(page)
-            elif page.route == "/clients":
-                content = ClientsView(page)
-            elif page.route == "/vehicles":
-                content = VehiclesView(page)
-            elif page.route == "/services":
-                content = ServicesView(page)
-            elif page.route == "/parts":
-                content = PartsView(page)
-            elif page.route == "/technicians":
-                content = TechniciansView(page)
-            elif page.route == "/tools":
-                content = ToolsView(page)
-            elif page.route == "/repairs":
-                content = RepairsView(page)
-            elif page.route == "/invoices":
-                content = InvoicesView(page)
-            elif page.route == "/finances":
-                content = FinancesView(page)
+            if route_info:
+                content = _view_function(page.route)(page)
             else:
                 content = ft.Text(f"Ruta no encontrada: {page.route}")
 
-            page.views.append(
-                ft.View(
-                    page.route,
-                    [
-                        ft.Row(
-                            [
-                                Sidebar(page, navigate),
-                                ft.VerticalDivider(width=1),
-                                ft.Container(content=content, expand=True, padding=0)
-                            ],
-                            expand=True,
-                            spacing=0,
-                            vertical_alignment=ft.CrossAxisAlignment.STRETCH
-                        )
-                    ],
-                    padding=0,
-                    bgcolor="background"
-                )
+            view = ft.View(
+                page.route,
+                [
+                    ft.Row(
+                        [
+                            Sidebar(page, navigate),
+                            ft.VerticalDivider(width=1),
+                            ft.Container(content=content, expand=True, padding=0)
+                        ],
+                        expand=True,
+                        spacing=0,
+                        vertical_alignment=ft.CrossAxisAlignment.STRETCH
+                    )
+                ],
+                padding=0,
+                bgcolor="background"
             )
+            if route_info:
+                view_cache[page.route] = (versions, view)
+            page.views.append(view)
         
         page.update()
 
@@ -181,6 +188,8 @@ def main(page: ft.Page):
     page.go(page.route)
 
 if __name__ == "__main__":
+    # Bulk invoicing renders PDFs in worker processes; needed when packaged as an .exe
+    multiprocessing.freeze_support()
     ft.app(
         target=main,
         view=ft.AppView.FLET_APP,
@@ -0,0 +1,16 @@
+from database import init_db, db, rebuild_kpis
+
+def rebuild():
+    """Recomputes the dashboard counters and monthly income from the source tables."""
+    init_db()
+    with db.write() as cursor:
+        rebuild_kpis(cursor)
+        cursor.execute("SELECT name, value FROM kpi_counters ORDER BY name")
+        for row in cursor.fetchall():
+            print(f"{row['name']}: {row['value']}")
+        cursor.execute("SELECT COUNT(*) FROM monthly_income")
+        print(f"Meses con ingresos: {cursor.fetchone()[0]}")
+    print("Indicadores del dashboard reconstruidos.")
+
+if __name__ == "__main__":
+    rebuild()
@@ -0,0 +1,70 @@
+import os
+import tempfile
+from contextlib import contextmanager
+from database import init_db, db, rebuild_stock
+from utils.inventory import adjust_stock
+
+# Checks that stock edited by hand lives in stock_movements, so re-deriving
+# the cached parts.stock/parts.reserved from the ledger never loses it.
+# Runs on an empty temporary database: python test_stock_ledger.py (or pytest).
+
+@contextmanager
+def empty_database():
+    with tempfile.TemporaryDirectory() as directory:
+        db.use_database(os.path.join(directory, "tear.db"))
+        try:
+            init_db()
+            yield
+        finally:
+            db.close_all()
+
+def new_part(cursor, name, stock):
+    # Same writes as PartsView.save_new_part
+    cursor.execute("INSERT INTO parts (name, base_price_cents) VALUES (?, ?)", (name, 10000))
+    part_id = cursor.lastrowid
+    adjust_stock(cursor, part_id, stock, "Saldo inicial")
+    return part_id
+
+def stock_of(part_id):
+    with db.read() as cursor:
+        cursor.execute("SELECT stock, reserved FROM parts WHERE id = ?", (part_id,))
+        return tuple(cursor.fetchone())
+
+def test_manual_edit_survives_rebuild():
+    with empty_database():
+        with db.write() as cursor:
+            part_id = new_part(cursor, "Alternador", 10)
+        # Same write as PartsView.update_part
+        with db.write() as cursor:
+            adjust_stock(cursor, part_id, 7)
+        assert stock_of(part_id) == (7, 0)
+
+        with db.write() as cursor:
+            rebuild_stock(cursor)
+        assert stock_of(part_id) == (7, 0)
+
+def test_reservations_survive_rebuild():
+    with empty_database():
+        with db.write() as cursor:
+            part_id = new_part(cursor, "Batería", 5)
+            cursor.execute("INSERT INTO clients (first_name, last_name, phone) VALUES ('Ana', 'López', '5550000')")
+            cursor.execute("INSERT INTO vehicles (client_id, brand, model, year, plate) VALUES (?, 'Nissan', 'Tsuru', 2010, 'ABC-123')", (cursor.lastrowid,))
+            vehicle_id = cursor.lastrowid
+            cursor.execute("INSERT INTO technicians (first_name, last_name, phone) VALUES ('Luis', 'Reyes', '5551111')")
+            cursor.execute(
+                "INSERT INTO repairs (vehicle_id, technician_id, status, general_details, start_date) VALUES (?, ?, 'En Proceso', '', '2025-01-01')",
+                (vehicle_id, cursor.lastrowid)
+            )
+            cursor.execute(
+                "INSERT INTO repair_parts (repair_id, part_id, quantity, price_at_moment_cents) VALUES (?, ?, 2, 10000)",
+                (cursor.lastrowid, part_id)
+            )
+        with db.write() as cursor:
+            adjust_stock(cursor, part_id, 4)
+            rebuild_stock(cursor)
+        assert stock_of(part_id) == (4, 2)
+
+if __name__ == "__main__":
+    test_manual_edit_survives_rebuild()
+    test_reservations_survive_rebuild()
+    print("Los ajustes manuales de stock sobreviven a rebuild_stock().")
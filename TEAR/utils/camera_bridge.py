@@ -1,25 +1,108 @@
 import os
+import io
+import base64
 import socket
 import threading
+import secrets
+import time
+import atexit
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 import qrcode
-from flask import Flask, request
+from flask import Flask, Response, request
+from werkzeug.exceptions import ClientDisconnected
+from werkzeug.serving import BaseWSGIServer
 import logging
+from utils.image_pipeline import process_in_background
 
 # Desactivar logs molestos de Flask en la consola
 log = logging.getLogger('werkzeug')
 log.setLevel(logging.ERROR)
 
+# Segundos que una sesión de captura sigue aceptando fotos si nadie la cierra
+DURACION_SESION = 30 * 60
+
+# Hilos que atienden subidas a la vez; las conexiones extra esperan en la cola del socket
+TRABAJADORES = 8
+
+# Segundos sin recibir datos antes de cortar una conexión (evita que un celular
+# que perdió la red ocupe un trabajador para siempre)
+TIEMPO_ESPERA_SOCKET = 60
+
+# Tamaño máximo de una foto; Flask responde 413 antes de leer el cuerpo si lo excede
+MAX_TAMANO_FOTO = 25 * 1024 * 1024
+
+# Bytes que se leen del socket por vuelta al escribir un bloque en disco
+TAMANO_LECTURA = 64 * 1024
+
+SESION_VENCIDA = "La sesión de captura no existe o ya expiró. Genera un nuevo código QR."
+
+# QR de las sesiones más recientes que se guardan en memoria
+QR_EN_CACHE = 32
+
+@lru_cache(maxsize=QR_EN_CACHE)
+def qr_png(url):
+    """PNG del código QR de una URL, generado en memoria (nunca se escribe a disco)."""
+    buffer = io.BytesIO()
+    qrcode.make(url).save(buffer)
+    return buffer.getvalue()
+
+class _ServidorConPool(BaseWSGIServer):
+    """
+    Servidor WSGI de werkzeug que atiende cada conexión en un pool de hilos de
+    tamaño fijo, en lugar de un hilo nuevo por conexión como app.run(threaded=True).
+    """
+
+    def __init__(self, host, puerto, app, trabajadores):
+        super().__init__(host, puerto, app)
+        self.pool = ThreadPoolExecutor(max_workers=trabajadores, thread_name_prefix="camara")
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self._atender, request, client_address)
+
+    def _atender(self, request, client_address):
+        request.settimeout(TIEMPO_ESPERA_SOCKET)
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        # Deja terminar las subidas en curso antes de cerrar el socket
+        self.pool.shutdown(wait=True)
+        super().server_close()
+
 class GestorCamaraMovil:
-    def __init__(self, directorio_guardado="evidencias"):
+    """
+    Servidor web que recibe fotos tomadas con el celular.
+    Un solo servidor atiende a todo el proceso; cada captura abre una sesión
+    con su propio token en la URL del QR, así varios celulares pueden subir
+    fotos al mismo tiempo y cada foto llega a su propio archivo y callback.
+    """
+
+    def __init__(self, directorio_guardado="evidencias", puerto=5000, trabajadores=TRABAJADORES,
+                 al_recibir=process_in_background):
         """
         Inicializa el gestor.
-        :param directorio_guardado: Carpeta donde se guardarán las fotos.
+        :param directorio_guardado: Carpeta por defecto donde se guardarán las fotos.
+        :param puerto: Puerto donde escucha el servidor.
+        :param trabajadores: Cuántas subidas se atienden al mismo tiempo.
+        :param al_recibir: Función (ruta_foto, callback) que procesa cada foto completa
+            y luego llama al callback con la ruta final.
         """
         self.app = Flask(__name__)
+        # werkzeug lee el multipart por partes y pasa a un archivo temporal lo
+        # que no cabe en memoria, así que una foto grande no se carga completa en RAM
+        self.app.config["MAX_CONTENT_LENGTH"] = MAX_TAMANO_FOTO
         self.directorio = directorio_guardado
-        self.puerto = 5000
-        self.callback_exito = None # Función a ejecutar cuando llega la foto
-        self.nombre_archivo_actual = "evidencia_temp.jpg"
+        self.puerto = puerto
+        self.trabajadores = trabajadores
+        self.al_recibir = al_recibir
+        # token -> {"directorio", "nombre_archivo", "callback", "url", "expira", "subidas"}
+        self.sesiones = {}
+        self._lock = threading.Lock()
         
         # Crear directorio si no existe
         os.makedirs(self.directorio, exist_ok=True)
@@ -27,7 +110,8 @@ class GestorCamaraMovil:
         # Configurar rutas de Flask
         self._configurar_rutas()
         
-        # Variable para controlar el hilo del servidor
+        # Servidor y el hilo que corre su ciclo de aceptación
+        self.servidor = None
         self.server_thread = None
 
     def _obtener_ip_local(self):
@@ -45,6 +129,14 @@ class GestorCamaraMovil:
 
     def _configurar_rutas(self):
         """Define qué pasa cuando el celular entra a la web"""
+
+        HTML_LISTO = """
+                    <div style="text-align:center; padding:50px; font-family:sans-serif;">
+                        <h1 style="color:green;">✅ ¡Listo!</h1>
+                        <p>La foto se ha guardado en el sistema.</p>
+                        <p>Ya puedes cerrar esta ventana.</p>
+                    </div>
+                    """
         
         # HTML simple con botón gigante para el celular
         HTML_TEMPLATE = """
@@ -128,7 +220,7 @@ class GestorCamaraMovil:
             <h3>Nueva Evidencia</h3>
             <p style="color:#aaa;">Paso 1: Captura la imagen</p>
             
-            <form method="post" enctype="multipart/form-data">
+            <form id="upload-form" method="post" enctype="multipart/form-data">
                 <label for="file-upload" class="custom-file-upload">
                     Tocar aquí para tomar foto
                 </label>
@@ -159,13 +251,94 @@ class GestorCamaraMovil:
                         submitBtn.style.display = "inline-block";
                     }
                 }
+
+                // Subida por bloques: si se cae el Wi-Fi se pregunta al servidor
+                // cuántos bytes ya tiene y se continúa desde ahí.
+                var TAMANO_BLOQUE = 512 * 1024;
+
+                function Fatal(mensaje) { this.mensaje = mensaje; }
+
+                function esperar(ms) {
+                    return new Promise(function (resolver) { setTimeout(resolver, ms); });
+                }
+
+                async function revisar(respuesta) {
+                    // 409: otra conexión sigue escribiendo o el offset no coincide; se reintenta
+                    if (respuesta.status >= 400 && respuesta.status < 500 && respuesta.status !== 409) {
+                        throw new Fatal((await respuesta.text()) || 'La sesión de captura ya expiró. Genera un nuevo código QR.');
+                    }
+                    if (!respuesta.ok) throw new Error('HTTP ' + respuesta.status);
+                    return respuesta;
+                }
+
+                async function subir(archivo) {
+                    var estado = document.getElementById('file-name');
+                    var base = window.location.pathname + '/subidas';
+                    var url = null, offset = 0, intentos = 0;
+
+                    while (url === null || offset < archivo.size) {
+                        try {
+                            if (url === null) {
+                                var creada = await revisar(await fetch(base, {
+                                    method: 'POST',
+                                    headers: {'Upload-Length': String(archivo.size)}
+                                }));
+                                url = creada.headers.get('Location');
+                            } else if (intentos > 0) {
+                                var actual = await revisar(await fetch(url, {method: 'HEAD', cache: 'no-store'}));
+                                offset = parseInt(actual.headers.get('Upload-Offset'), 10);
+                            }
+                            if (offset < archivo.size) {
+                                var enviada = await revisar(await fetch(url, {
+                                    method: 'PATCH',
+                                    headers: {
+                                        'Upload-Offset': String(offset),
+                                        'Content-Type': 'application/offset+octet-stream'
+                                    },
+                                    body: archivo.slice(offset, Math.min(offset + TAMANO_BLOQUE, archivo.size))
+                                }));
+                                offset = parseInt(enviada.headers.get('Upload-Offset'), 10);
+                            }
+                            intentos = 0;
+                            estado.textContent = 'Subiendo... ' + Math.floor(offset * 100 / archivo.size) + '%';
+                        } catch (e) {
+                            if (e instanceof Fatal) {
+                                estado.textContent = e.mensaje;
+                                return;
+                            }
+                            intentos++;
+                            estado.textContent = 'Conexión perdida, reintentando (' + intentos + ')...';
+                            await esperar(Math.min(1000 * Math.pow(2, intentos - 1), 15000));
+                        }
+                    }
+                    document.body.innerHTML = document.getElementById('listo').innerHTML;
+                }
+
+                document.getElementById('upload-form').addEventListener('submit', function (ev) {
+                    var input = document.getElementById('file-upload');
+                    // Sin fetch se usa el envío normal del formulario
+                    if (!window.fetch || !input.files || input.files.length === 0) return;
+                    ev.preventDefault();
+                    document.getElementById('submit-btn').disabled = true;
+                    subir(input.files[0]);
+                });
             </script>
+            <template id="listo">""" + HTML_LISTO + """</template>
         </body>
         </html>
         """
 
         @self.app.route('/', methods=['GET', 'POST'])
         def index():
+            return "Escanea el código QR que muestra el sistema para subir una foto.", 404
+
+        @self.app.route('/s/<token>', methods=['GET', 'POST'])
+        def sesion(token):
+            sesion_actual = self._obtener_sesion(token)
+            if sesion_actual is None:
+                return SESION_VENCIDA, 404
+
+            # Envío normal del formulario, para navegadores sin fetch
             if request.method == 'POST':
                 if 'file' not in request.files:
                     return "No se encontró archivo"
@@ -174,53 +347,222 @@ class GestorCamaraMovil:
                     return "No seleccionaste archivo"
                 
                 if file:
-                    ruta_completa = os.path.join(self.directorio, self.nombre_archivo_actual)
-                    file.save(ruta_completa)
-                    
-                    # Notificar a Flet que ya tenemos la foto
-                    if self.callback_exito:
-                        self.callback_exito(ruta_completa)
-                        
-                    return """
-                    <div style="text-align:center; padding:50px; font-family:sans-serif;">
-                        <h1 style="color:green;">✅ ¡Listo!</h1>
-                        <p>La foto se ha guardado en el sistema.</p>
-                        <p>Ya puedes cerrar esta ventana.</p>
-                    </div>
-                    """
+                    id_subida = secrets.token_urlsafe(12)
+                    ruta_parcial = self._ruta_parcial(sesion_actual, token, id_subida)
+                    file.save(ruta_parcial)
+                    self._entregar(sesion_actual, id_subida, ruta_parcial)
+                    return HTML_LISTO
             return HTML_TEMPLATE
 
-    def iniciar_servicio(self, nombre_archivo_destino, callback):
+        # El mismo QR que muestra la app, por si se quiere abrir en otra pantalla
+        @self.app.route('/s/<token>/qr.png')
+        def qr_sesion(token):
+            sesion_actual = self._obtener_sesion(token)
+            if sesion_actual is None:
+                return SESION_VENCIDA, 404
+            return Response(qr_png(sesion_actual["url"]), mimetype="image/png")
+
+        # Protocolo de subida reanudable (parecido a tus): POST crea la subida con
+        # su tamaño total, HEAD dice cuántos bytes ya llegaron y cada PATCH agrega
+        # un bloque a partir de Upload-Offset. Los bytes van directo a un archivo
+        # temporal en la carpeta destino y se renombran al completar.
+        @self.app.route('/s/<token>/subidas', methods=['POST'])
+        def crear_subida(token):
+            sesion_actual = self._obtener_sesion(token)
+            if sesion_actual is None:
+                return SESION_VENCIDA, 404
+            longitud = request.headers.get('Upload-Length', type=int)
+            if not longitud or longitud < 0:
+                return "No seleccionaste archivo", 400
+            if longitud > MAX_TAMANO_FOTO:
+                return "La foto es demasiado grande.", 413
+
+            id_subida = secrets.token_urlsafe(12)
+            subida_nueva = {
+                "ruta": self._ruta_parcial(sesion_actual, token, id_subida),
+                "longitud": longitud,
+                "offset": 0,
+                "completa": False,
+                "lock": threading.Lock(),
+            }
+            open(subida_nueva["ruta"], 'wb').close()
+            with self._lock:
+                sesion_actual["subidas"][id_subida] = subida_nueva
+            cabeceras = self._cabeceras_subida(subida_nueva)
+            cabeceras["Location"] = f"/s/{token}/subidas/{id_subida}"
+            return "", 201, cabeceras
+
+        @self.app.route('/s/<token>/subidas/<id_subida>', methods=['HEAD', 'PATCH'])
+        def subida(token, id_subida):
+            sesion_actual = self._obtener_sesion(token)
+            subida_actual = sesion_actual["subidas"].get(id_subida) if sesion_actual else None
+            if subida_actual is None:
+                return SESION_VENCIDA, 404
+            if request.method == 'HEAD':
+                return "", 200, self._cabeceras_subida(subida_actual)
+
+            # Si la conexión anterior sigue abierta (el Wi-Fi se cayó a medio bloque)
+            # el celular recibe 409 y vuelve a preguntar el offset más tarde
+            if not subida_actual["lock"].acquire(blocking=False):
+                return "", 409, self._cabeceras_subida(subida_actual)
+            try:
+                if request.headers.get('Upload-Offset', type=int) != subida_actual["offset"]:
+                    return "", 409, self._cabeceras_subida(subida_actual)
+                if not subida_actual["completa"]:
+                    self._recibir_bloque(subida_actual)
+                    if subida_actual["offset"] == subida_actual["longitud"]:
+                        self._entregar(sesion_actual, id_subida, subida_actual["ruta"])
+                        subida_actual["completa"] = True
+            finally:
+                subida_actual["lock"].release()
+            return "", 204, self._cabeceras_subida(subida_actual)
+
+    def _ruta_parcial(self, sesion_actual, token, id_subida):
+        # En la misma carpeta que la foto final, para que os.replace sea atómico
+        return os.path.join(sesion_actual["directorio"], f".{token}_{id_subida}.parcial")
+
+    def _cabeceras_subida(self, subida_actual):
+        return {
+            "Upload-Offset": str(subida_actual["offset"]),
+            "Upload-Length": str(subida_actual["longitud"]),
+            "Cache-Control": "no-store",
+        }
+
+    def _recibir_bloque(self, subida_actual):
         """
-        Arranca el servidor y genera el QR.
-        :param nombre_archivo_destino: Ej: 'cliente_juan_golpe1.jpg'
-        :param callback: Función que recibe (ruta_foto) cuando termina
-        :return: Ruta de la imagen del código QR generado
+        Copia el cuerpo del PATCH al archivo temporal por partes, sin cargarlo en
+        memoria. Si el celular se desconecta, lo recibido hasta ahí se conserva.
         """
-        self.nombre_archivo_actual = nombre_archivo_destino
-        self.callback_exito = callback
+        restante = subida_actual["longitud"] - subida_actual["offset"]
+        with open(subida_actual["ruta"], 'r+b') as destino:
+            destino.seek(subida_actual["offset"])
+            try:
+                while restante:
+                    bloque = request.stream.read(min(TAMANO_LECTURA, restante))
+                    if not bloque:
+                        break
+                    destino.write(bloque)
+                    subida_actual["offset"] += len(bloque)
+                    restante -= len(bloque)
+            except (ClientDisconnected, OSError):
+                pass
+            destino.flush()
+            os.fsync(destino.fileno())
+
+    def _entregar(self, sesion_actual, id_subida, ruta_parcial):
+        """
+        Mueve la foto completa a su nombre final y la manda a procesar (orientación,
+        metadatos, tamaño, miniaturas y almacén por contenido) fuera del hilo que
+        atiende la subida.
+        """
+        # La sesión sigue abierta tras la primera foto (para repetirla, o desde
+        # otro celular), así que cada subida tiene su propio nombre final y no
+        # pisa a otra que el pipeline todavía esté procesando
+        raiz, extension = os.path.splitext(sesion_actual["nombre_archivo"])
+        ruta_completa = os.path.join(sesion_actual["directorio"], f"{raiz}_{id_subida}{extension}")
+        os.replace(ruta_parcial, ruta_completa)
+        
+        # Notificar a Flet (a la vista que abrió esta sesión) cuando la foto ya esté procesada
+        self.al_recibir(ruta_completa, sesion_actual["callback"])
+        return ruta_completa
+
+    def _obtener_sesion(self, token):
+        """Devuelve la sesión del token si sigue vigente, descartando las expiradas."""
+        ahora = time.time()
+        with self._lock:
+            for vencido in [t for t, s in self.sesiones.items() if s["expira"] < ahora]:
+                self._descartar(vencido)
+            return self.sesiones.get(token)
+
+    def _descartar(self, token):
+        sesion_actual = self.sesiones.pop(token, None)
+        if sesion_actual is None:
+            return
+        for ruta in [s["ruta"] for s in sesion_actual["subidas"].values() if not s["completa"]]:
+            try:
+                os.remove(ruta)
+            except OSError:
+                pass
+
+    def iniciar_servicio(self, nombre_archivo_destino, callback, directorio=None):
+        """
+        Abre una sesión de captura, arranca el servidor si hace falta y genera el QR.
+        :param nombre_archivo_destino: Ej: 'cliente_juan_golpe1.jpg'; cada foto recibida
+            se guarda como 'cliente_juan_golpe1_<id de subida>.jpg'
+        :param callback: Función que recibe (ruta_foto) cuando llega una foto de esta sesión
+        :param directorio: Carpeta de la foto; por defecto la del gestor.
+        :return: (QR como PNG en base64 para ft.Image(src_base64=...), url de la sesión,
+            token para cerrar_sesion)
+        """
+        token = secrets.token_urlsafe(16)
+        directorio = directorio or self.directorio
+        os.makedirs(directorio, exist_ok=True)
         
         ip = self._obtener_ip_local()
-        url = f"http://{ip}:{self.puerto}"
+        url = f"http://{ip}:{self.puerto}/s/{token}"
         
-        # Generar QR
-        qr = qrcode.make(url)
-        # Usar timestamp para evitar caché del navegador/Flet
-        import time
-        timestamp_qr = int(time.time())
-        ruta_qr = os.path.join(self.directorio, f"temp_qr_code_{timestamp_qr}.png")
-        qr.save(ruta_qr)
+        # Generar QR en memoria (queda en caché por URL para /s/<token>/qr.png)
+        qr_base64 = base64.b64encode(qr_png(url)).decode("ascii")
+
+        with self._lock:
+            self.sesiones[token] = {
+                "directorio": directorio,
+                "nombre_archivo": nombre_archivo_destino,
+                "callback": callback,
+                "url": url,
+                "expira": time.time() + DURACION_SESION,
+                "subidas": {},
+            }
         
-        # Iniciar Flask en hilo secundario si no está corriendo
-        # Nota: Flask no se detiene fácilmente, así que usamos daemon=True
-        # para que se cierre cuando cierres la app principal.
-        if self.server_thread is None or not self.server_thread.is_alive():
-            self.server_thread = threading.Thread(
-                target=lambda: self.app.run(host='0.0.0.0', port=self.puerto, use_reloader=False),
-                daemon=True
-            )
-            self.server_thread.start()
-            print(f"--- Servidor escuchando en {url} ---")
+        with self._lock:
+            if self.servidor is None:
+                self._arrancar_servidor()
+                print(f"--- Servidor escuchando en http://{ip}:{self.puerto} ({self.trabajadores} trabajadores) ---")
             
-        return ruta_qr, url
+        return qr_base64, url, token
+
+    def _arrancar_servidor(self):
+        # El socket se abre aquí mismo, así un puerto ocupado se reporta al que
+        # pidió la sesión en lugar de morir en silencio dentro del hilo
+        self.servidor = _ServidorConPool('0.0.0.0', self.puerto, self.app, self.trabajadores)
+        self.server_thread = threading.Thread(
+            target=self.servidor.serve_forever,
+            name="camara-servidor",
+            daemon=True
+        )
+        self.server_thread.start()
+
+    def detener_servicio(self, espera=TIEMPO_ESPERA_SOCKET):
+        """
+        Deja de aceptar conexiones, espera a que terminen las subidas en curso
+        y libera el puerto. Se puede volver a iniciar con iniciar_servicio.
+        """
+        with self._lock:
+            servidor, hilo = self.servidor, self.server_thread
+            self.servidor = self.server_thread = None
+        if servidor is None:
+            return
+        servidor.shutdown()
+        # serve_forever cierra el servidor (y su pool) al salir del ciclo
+        hilo.join(espera)
+
+    def cerrar_sesion(self, token):
+        """Deja de aceptar fotos para esta sesión y borra sus subidas incompletas."""
+        with self._lock:
+            self._descartar(token)
+
+_gestor_compartido = None
+_gestor_lock = threading.Lock()
+
+def obtener_gestor():
+    """
+    Devuelve el gestor compartido por todo el proceso, creándolo la primera vez.
+    Solo puede haber un servidor escuchando en el puerto 5000.
+    """
+    global _gestor_compartido
+    with _gestor_lock:
+        if _gestor_compartido is None:
+            _gestor_compartido = GestorCamaraMovil(directorio_guardado="assets/vehicle_photos")
+            atexit.register(_gestor_compartido.detener_servicio)
+        return _gestor_compartido
         
\ No newline at end of file
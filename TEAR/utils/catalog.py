@@ -0,0 +1,61 @@
+import threading
+from database import db
+
+class CatalogCache:
+    """
+    In-process copy of a small reference table (services, parts, ...) used to
+    fill dropdowns and look up prices. It is re-read only when db.data_version()
+    reports a committed write to one of its tables since the last load, so
+    opening a dialog or picking an item normally never touches SQLite.
+    Writes made by other processes are not seen until this process writes to
+    the same tables; the catalogs are only edited from the app itself.
+    """
+
+    def __init__(self, query, tables, key="id"):
+        """
+        :param query: SELECT returning the catalog rows.
+        :param tables: Tables whose writes can change the result.
+        :param key: Row field used by get().
+        """
+        self.query = query
+        self.tables = tables
+        self.key = key
+        self._versions = None
+        self._rows = []
+        self._by_key = {}
+        self._lock = threading.Lock()
+
+    def rows(self):
+        """
+        The catalog rows as plain dicts. The same list object is returned
+        until the data changes, so callers can skip rebuilding their options.
+        """
+        with self._lock:
+            # Versions are taken before reading: a write that commits during
+            # the read leaves them behind, and the next call reloads again
+            versions = db.data_version(self.tables)
+            if versions != self._versions:
+                with db.read() as cursor:
+                    cursor.execute(self.query)
+                    self._rows = [dict(row) for row in cursor.fetchall()]
+                self._by_key = {row[self.key]: row for row in self._rows}
+                self._versions = versions
+            return self._rows
+
+    def get(self, key):
+        """Row with this key (as int or the string value of a dropdown), or None."""
+        self.rows()
+        return self._by_key.get(int(key))
+
+vehicles = CatalogCache(
+    "SELECT v.id, v.brand, v.model, v.plate, c.first_name, c.last_name FROM vehicles v JOIN clients c ON v.client_id = c.id",
+    ["vehicles", "clients"],
+)
+clients = CatalogCache("SELECT id, first_name, last_name, phone FROM clients", ["clients"])
+technicians = CatalogCache("SELECT id, first_name, last_name FROM technicians", ["technicians"])
+services = CatalogCache("SELECT id, name, price_cents FROM services", ["services"])
+# Availability moves with the stock ledger, which repairs and their parts write to
+parts = CatalogCache(
+    "SELECT id, name, base_price_cents, stock - reserved AS available FROM parts",
+    ["parts", "stock_movements", "repair_parts", "repairs"],
+)
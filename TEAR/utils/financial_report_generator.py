@@ -1,6 +1,7 @@
 from fpdf import FPDF
 import os
 from datetime import datetime
+from utils.money import format_money
 
 class FinancialReportPDF(FPDF):
     def header(self):
@@ -19,28 +20,14 @@ class FinancialReportPDF(FPDF):
         self.set_font('Arial', 'I', 8)
         self.cell(0, 10, f'Página {self.page_no()}', 0, 0, 'C')
 
-from database import get_db_connection
+from utils.reports import totals_by_period, report_entries
 
-def generate_financial_report(start_date, end_date, repair_income_ignored, transactions_raw, expenses, period_name):
-    # --- Fetch Invoices Data (Ingresos por Reparaciones) ---
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT i.issue_date as date, i.total_amount as amount, i.id, 
-               c.first_name, c.last_name, v.brand, v.model
-        FROM invoices i
-        JOIN repairs r ON i.repair_id = r.id
-        JOIN vehicles v ON r.vehicle_id = v.id
-        JOIN clients c ON v.client_id = c.id
-        WHERE i.issue_date >= ? AND i.issue_date <= ?
-    ''', (start_date, end_date))
-    invoices_data = [dict(row) for row in cursor.fetchall()]
-    conn.close()
-
-    # --- Filter Transactions (Otros Ingresos) ---
-    # Exclude transactions that are related to repairs (related_repair_id IS NOT NULL)
-    # This ensures "Otros Ingresos" are truly extra income.
-    other_income_transactions = [t for t in transactions_raw if not t.get('related_repair_id')]
+def generate_financial_report(start_date, end_date, period_name):
+    # --- Period totals, from the rollups of closed months and weeks ---
+    periods = totals_by_period(start_date, end_date)
+    total_invoices_income = sum(p["invoices"] for p in periods)
+    total_other_income = sum(p["other_income"] for p in periods)
+    total_expenses = sum(p["expenses"] for p in periods)
 
     pdf = FinancialReportPDF()
     pdf.add_page()
@@ -53,11 +40,6 @@ def generate_financial_report(start_date, end_date, repair_income_ignored, trans
     pdf.ln(5)
     
     # --- Data Processing ---
-    # Calculate totals
-    total_invoices_income = sum(i['amount'] for i in invoices_data)
-    total_other_income = sum(t['amount'] for t in other_income_transactions)
-    total_expenses = sum(e['amount'] for e in expenses)
-    
     total_income = total_invoices_income + total_other_income
     net_balance = total_income - total_expenses
     
@@ -77,7 +59,7 @@ def generate_financial_report(start_date, end_date, repair_income_ignored, trans
         else: pdf.set_text_color(0, 0, 0)
             
         pdf.cell(140, 8, label, 1)
-        pdf.cell(50, 8, f"${amount:,.2f}", 1, 1, 'R')
+        pdf.cell(50, 8, format_money(amount), 1, 1, 'R')
         
         pdf.set_text_color(0, 0, 0) # Reset
 
@@ -92,7 +74,32 @@ def generate_financial_report(start_date, end_date, repair_income_ignored, trans
     pdf.ln(10)
     
     # --- Detailed Sections ---
-    
+
+    # Reports spanning several months list one line per month instead of
+    # every invoice, income and expense
+    if len(periods) > 1:
+        pdf.set_font('Arial', 'B', 12)
+        pdf.set_fill_color(230, 230, 230)
+        pdf.cell(0, 10, 'Resumen por Mes', 1, 1, 'L', fill=True)
+
+        pdf.set_font('Arial', 'B', 10)
+        pdf.cell(30, 8, 'Mes', 1)
+        pdf.cell(40, 8, 'Facturas', 1, 0, 'R')
+        pdf.cell(40, 8, 'Otros Ingresos', 1, 0, 'R')
+        pdf.cell(40, 8, 'Gastos', 1, 0, 'R')
+        pdf.cell(40, 8, 'Balance', 1, 1, 'R')
+
+        pdf.set_font('Arial', '', 9)
+        for p in periods:
+            pdf.cell(30, 8, p['start'][:7], 1)
+            pdf.cell(40, 8, format_money(p['invoices']), 1, 0, 'R')
+            pdf.cell(40, 8, format_money(p['other_income']), 1, 0, 'R')
+            pdf.cell(40, 8, format_money(p['expenses']), 1, 0, 'R')
+            pdf.cell(40, 8, format_money(p['invoices'] + p['other_income'] - p['expenses']), 1, 1, 'R')
+        return _save(pdf)
+
+    invoices_data, other_income_transactions, expenses = report_entries(start_date, end_date)
+
     # 1. Invoices Detail
     pdf.set_font('Arial', 'B', 12)
     pdf.set_fill_color(230, 230, 230)
@@ -110,7 +117,7 @@ def generate_financial_report(start_date, end_date, repair_income_ignored, trans
             pdf.cell(30, 8, i['date'], 1)
             pdf.cell(60, 8, f"{i['brand']} {i['model']}", 1)
             pdf.cell(60, 8, f"{i['first_name']} {i['last_name']}", 1)
-            pdf.cell(40, 8, f"${i['amount']:,.2f}", 1, 1, 'R')
+            pdf.cell(40, 8, format_money(i['amount_cents']), 1, 1, 'R')
     else:
         pdf.set_font('Arial', 'I', 10)
         pdf.cell(0, 10, 'No hay facturas registradas en este periodo.', 1, 1, 'C')
@@ -137,7 +144,7 @@ def generate_financial_report(start_date, end_date, repair_income_ignored, trans
             if len(desc) > 75: desc = desc[:72] + "..."
             pdf.cell(120, 8, desc, 1)
             
-            pdf.cell(40, 8, f"${t['amount']:,.2f}", 1, 1, 'R')
+            pdf.cell(40, 8, format_money(t['amount_cents']), 1, 1, 'R')
     else:
         pdf.set_font('Arial', 'I', 10)
         pdf.cell(0, 10, 'No hay otros ingresos registrados en este periodo.', 1, 1, 'C')
@@ -166,12 +173,14 @@ def generate_financial_report(start_date, end_date, repair_income_ignored, trans
             if len(desc) > 55: desc = desc[:52] + "..."
             pdf.cell(90, 8, desc, 1)
             
-            pdf.cell(40, 8, f"${e['amount']:,.2f}", 1, 1, 'R')
+            pdf.cell(40, 8, format_money(e['amount_cents']), 1, 1, 'R')
     else:
         pdf.set_font('Arial', 'I', 10)
         pdf.cell(0, 10, 'No hay gastos registrados en este periodo.', 1, 1, 'C')
 
-    # --- Save PDF ---
+    return _save(pdf)
+
+def _save(pdf):
     if not os.path.exists("reports"):
         os.makedirs("reports")
         
@@ -0,0 +1,119 @@
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image, ImageOps
+from database import LEGACY_PHOTOS_QUERY
+from utils.photo_store import store_photo
+
+# Longest side of the stored photo; phone originals are re-encoded down to this
+MAX_SIDE = 2048
+JPEG_QUALITY = 85
+
+# Thumbnail sizes (longest side, px): 200 for the history list, 400 for the photo dialog
+THUMBNAIL_SIZES = (200, 400)
+THUMBNAIL_DIR = "thumbs"
+
+# Two workers are enough for a shop's phones and keep decoding off the upload threads
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="image-pipeline")
+
+def thumbnail_file(path, size):
+    """Where the `size` px thumbnail of a photo is written, whether it exists or not."""
+    directory, name = os.path.split(path)
+    return os.path.join(directory, THUMBNAIL_DIR, f"{os.path.splitext(name)[0]}_{size}.jpg")
+
+def thumbnail_path(path, size):
+    """
+    Path of the `size` px thumbnail of a photo, or the photo itself when the
+    thumbnail does not exist yet (older photos, or still being processed).
+    """
+    thumb = thumbnail_file(path, size)
+    return thumb if os.path.exists(thumb) else path
+
+def has_thumbnails(path):
+    return all(os.path.exists(thumbnail_file(path, size)) for size in THUMBNAIL_SIZES)
+
+def _save_jpeg(image, path):
+    # Written next to the target and renamed, so a reader never sees half a file.
+    # No exif= argument: the GPS, camera and orientation tags are dropped.
+    temp = f"{path}.tmp"
+    image.save(temp, "JPEG", quality=JPEG_QUALITY, optimize=True)
+    os.replace(temp, path)
+
+def normalize_photo(path):
+    """
+    Rotates the photo upright from its EXIF orientation, strips its metadata
+    and re-encodes it in place as a JPEG no larger than MAX_SIDE.
+    """
+    with Image.open(path) as original:
+        image = ImageOps.exif_transpose(original).convert("RGB")
+    image.thumbnail((MAX_SIDE, MAX_SIDE))
+    _save_jpeg(image, path)
+
+def write_thumbnails(path):
+    os.makedirs(os.path.join(os.path.dirname(path), THUMBNAIL_DIR), exist_ok=True)
+    with Image.open(path) as image:
+        for size in THUMBNAIL_SIZES:
+            thumb = image.copy()
+            thumb.thumbnail((size, size))
+            _save_jpeg(thumb, thumbnail_file(path, size))
+
+def ingest_photo(path):
+    """
+    Normalizes a photo, moves it into the content-addressed store and makes
+    sure its thumbnails exist. Returns the stored path. A file Pillow cannot
+    read is stored as it arrived.
+    """
+    try:
+        normalize_photo(path)
+    except (OSError, Image.DecompressionBombError) as e:
+        print(f"No se pudo procesar la foto {path}: {e}")
+        return store_photo(path)
+
+    # Normalizing is deterministic, so a re-sent photo hashes to the same blob
+    # and already has its thumbnails
+    path = store_photo(path)
+    if not has_thumbnails(path):
+        write_thumbnails(path)
+    return path
+
+def import_legacy_photos(cursor):
+    """
+    Stores the vehicle photos saved before the photo store (normalized,
+    deduplicated and with thumbnails) and points their rows at the stored
+    blob. A copy of each file is ingested and the original is left in place,
+    so a transaction that rolls back still has every photo it pointed at.
+    :return: (photos imported, legacy photo paths found)
+    """
+    cursor.execute(LEGACY_PHOTOS_QUERY)
+    paths = [row["photo_path"] for row in cursor.fetchall()]
+
+    imported = 0
+    for path in paths:
+        if not os.path.exists(path):
+            continue
+        root, extension = os.path.splitext(path)
+        copy = f"{root}_import{extension}"
+        shutil.copyfile(path, copy)
+        # store_photo's write() joins the caller's transaction
+        stored = ingest_photo(copy)
+        # The refcount triggers count the new references
+        cursor.execute("UPDATE vehicles SET photo_path = ? WHERE photo_path = ?", (stored, path))
+        cursor.execute("UPDATE vehicle_history SET photo_path = ? WHERE photo_path = ?", (stored, path))
+        imported += 1
+    return imported, len(paths)
+
+def process_in_background(path, on_done=None):
+    """
+    Runs ingest_photo on the pipeline's worker threads and then calls
+    on_done(stored_path).
+    """
+    def run():
+        try:
+            stored = ingest_photo(path)
+        except Exception as e:
+            print(f"No se pudo guardar la foto {path}: {e}")
+            return
+        if on_done:
+            on_done(stored)
+
+    return _executor.submit(run)
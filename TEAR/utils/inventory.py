@@ -0,0 +1,15 @@
+def adjust_stock(cursor, part_id, counted_stock, reason="Ajuste manual"):
+    """
+    Records a stock_movements entry that brings a part's on-hand stock to
+    `counted_stock`. The ledger trigger updates the cached parts.stock, so this
+    must run inside db.write() like any other write.
+    :return: The change applied to the stock (0 when it already matched).
+    """
+    cursor.execute("SELECT stock FROM parts WHERE id = ?", (part_id,))
+    delta = counted_stock - cursor.fetchone()["stock"]
+    if delta:
+        cursor.execute(
+            "INSERT INTO stock_movements (part_id, on_hand_delta, reason) VALUES (?, ?, ?)",
+            (part_id, delta, reason)
+        )
+    return delta
@@ -0,0 +1,160 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from datetime import datetime
+from database import db
+from utils.pdf_generator import generate_invoice_pdf
+from utils.repair_loader import load_repair, load_repairs
+
+# invoices.pdf_status values
+PDF_PENDING = "Pendiente"
+PDF_READY = "Lista"
+PDF_FAILED = "Fallida"
+
+# fpdf renders in pure Python; two workers keep the UI responsive without
+# competing with it for the GIL
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="invoice-pdf")
+_queued = set()
+_queued_lock = threading.Lock()
+
+def _render(invoice_id):
+    # Read, render and record the result as three separate steps: the write
+    # lock is only held for the final UPDATE, never while fpdf runs
+    try:
+        with db.read() as cursor:
+            cursor.execute("SELECT repair_id FROM invoices WHERE id = ?", (invoice_id,))
+            repair = load_repair(cursor, cursor.fetchone()["repair_id"])
+        pdf_path = generate_invoice_pdf(repair, repair["services"], repair["parts"], repair["expenses"], invoice_id)
+        status, error = PDF_READY, None
+    except Exception as e:
+        pdf_path, status, error = None, PDF_FAILED, str(e)
+
+    with db.write() as cursor:
+        cursor.execute(
+            "UPDATE invoices SET pdf_path = ?, pdf_status = ?, pdf_error = ? WHERE id = ?",
+            (pdf_path, status, error, invoice_id)
+        )
+    return status
+
+def enqueue_invoice_pdf(invoice_id, on_done=None):
+    """
+    Renders an already committed invoice's PDF on a worker thread, then stores
+    pdf_path and pdf_status and calls on_done(invoice_id, pdf_status).
+    An invoice that is already queued is not queued twice.
+    """
+    with _queued_lock:
+        if invoice_id in _queued:
+            return
+        _queued.add(invoice_id)
+
+    def run():
+        try:
+            status = _render(invoice_id)
+        finally:
+            with _queued_lock:
+                _queued.discard(invoice_id)
+        if on_done:
+            on_done(invoice_id, status)
+
+    _executor.submit(run)
+
+def retry_invoice_pdf(invoice_id, on_done=None):
+    """Puts a failed invoice back to pending and queues its PDF again."""
+    with db.write() as cursor:
+        cursor.execute(
+            "UPDATE invoices SET pdf_status = ?, pdf_error = NULL WHERE id = ?",
+            (PDF_PENDING, invoice_id)
+        )
+    enqueue_invoice_pdf(invoice_id, on_done)
+
+def count_uninvoiced():
+    with db.read() as cursor:
+        cursor.execute('''
+            SELECT COUNT(*) FROM repairs r
+            WHERE r.status = 'Completada'
+              AND NOT EXISTS (SELECT 1 FROM invoices i WHERE i.repair_id = r.id)
+        ''')
+        return cursor.fetchone()[0]
+
+def issue_all_uninvoiced(on_progress=None):
+    """
+    Invoices every completed repair that has no invoice yet.
+    The invoices and their income transactions are written with set-based
+    INSERT ... SELECT statements in one transaction, which also reads all
+    their line items with one aggregate query; the PDFs are then
+    rendered in parallel on a process pool (one worker per CPU core) and
+    their paths and statuses stored in a second transaction.
+    :param on_progress: Function (pdfs done, total), called from this thread.
+    :return: (invoices issued, PDFs that failed)
+    """
+    issue_date = datetime.now().strftime("%Y-%m-%d")
+    with db.write() as cursor:
+        cursor.execute("SELECT COALESCE(MAX(id), 0) FROM invoices")
+        last_invoice_id = cursor.fetchone()[0]
+        # NOT EXISTS runs inside this write transaction, so a repair invoiced
+        # from the dialog meanwhile is skipped; the unique index on
+        # invoices.repair_id (idx_invoices_one_per_repair) is the backstop for
+        # both paths
+        cursor.execute('''
+            INSERT INTO invoices (repair_id, issue_date, total_amount_cents)
+            SELECT r.id, ?, r.total_cost_cents
+            FROM repairs r
+            WHERE r.status = 'Completada'
+              AND NOT EXISTS (SELECT 1 FROM invoices i WHERE i.repair_id = r.id)
+            ORDER BY r.id
+        ''', (issue_date,))
+        cursor.execute('''
+            INSERT INTO transactions (type, amount_cents, description, date, related_repair_id)
+            SELECT 'Income', total_amount_cents,
+                   'Factura #' || id || ' - Reparación #' || repair_id, issue_date, repair_id
+            FROM invoices
+            WHERE id > ?
+            ORDER BY id
+        ''', (last_invoice_id,))
+        # Every new invoice's repair and line items in a single query
+        cursor.execute("SELECT id, repair_id FROM invoices WHERE id > ?", (last_invoice_id,))
+        invoice_ids = {row["repair_id"]: row["id"] for row in cursor.fetchall()}
+        repairs = load_repairs(cursor, "r.id IN (SELECT repair_id FROM invoices WHERE id > ?)", (last_invoice_id,))
+        jobs = [
+            (repair, repair["services"], repair["parts"], repair["expenses"], invoice_ids[repair["id"]])
+            for repair in repairs
+        ]
+
+    if not jobs:
+        return 0, 0
+
+    invoice_ids = [job[-1] for job in jobs]
+    # Keep the thread queue (resume_pending) away from these while they render
+    with _queued_lock:
+        _queued.update(invoice_ids)
+    results = []
+    try:
+        with ProcessPoolExecutor(max_workers=min(len(jobs), os.cpu_count() or 1)) as pool:
+            futures = {pool.submit(generate_invoice_pdf, *job): job[-1] for job in jobs}
+            for done, future in enumerate(as_completed(futures), start=1):
+                try:
+                    results.append((future.result(), PDF_READY, None, futures[future]))
+                except Exception as e:
+                    results.append((None, PDF_FAILED, str(e), futures[future]))
+                if on_progress:
+                    on_progress(done, len(jobs))
+
+        with db.write() as cursor:
+            cursor.executemany(
+                "UPDATE invoices SET pdf_path = ?, pdf_status = ?, pdf_error = ? WHERE id = ?",
+                results
+            )
+    finally:
+        with _queued_lock:
+            _queued.difference_update(invoice_ids)
+
+    return len(jobs), sum(1 for result in results if result[1] == PDF_FAILED)
+
+def resume_pending(on_done=None):
+    """Queues the PDFs left pending when the app was closed mid-render."""
+    with db.read() as cursor:
+        cursor.execute("SELECT id FROM invoices WHERE pdf_status = ?", (PDF_PENDING,))
+        pending = [row["id"] for row in cursor.fetchall()]
+    for invoice_id in pending:
+        enqueue_invoice_pdf(invoice_id, on_done)
+    return len(pending)
@@ -0,0 +1,33 @@
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+# Amounts are stored and added up as integer cents (columns ending in _cents),
+# so totals are exact both in Python and in SQLite's SUM().
+CENT = Decimal("0.01")
+
+def to_cents(value):
+    """
+    Converts user input or a Decimal/int/float amount to integer cents,
+    rounding half up, e.g. '12.5' -> 1250.
+    Raises ValueError when the text is not a number.
+    """
+    if isinstance(value, str):
+        value = value.strip().replace(",", "").lstrip("$")
+    try:
+        amount = Decimal(str(value))
+    except InvalidOperation:
+        raise ValueError(f"Monto inválido: {value!r}")
+    if not amount.is_finite():
+        raise ValueError(f"Monto inválido: {value!r}")
+    return int((amount * 100).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+def from_cents(cents):
+    """Integer cents as a Decimal with two places, e.g. 1250 -> Decimal('12.50')."""
+    return (Decimal(cents or 0) / 100).quantize(CENT)
+
+def format_money(cents):
+    """Integer cents as display text, e.g. 123450 -> '$1,234.50'."""
+    return f"${from_cents(cents):,.2f}"
+
+def money_input(cents):
+    """Integer cents as the plain text used to pre-fill an amount TextField."""
+    return f"{from_cents(cents):.2f}"
@@ -1,6 +1,7 @@
 from fpdf import FPDF
 import os
 from datetime import datetime
+from utils.money import format_money
 
 class PDFInvoice(FPDF):
     def header(self):
@@ -47,8 +48,8 @@ def generate_invoice_pdf(repair_data, services, parts, expenses, invoice_number)
     total_services = 0
     for s in services:
         pdf.cell(140, 7, s['name'], 1)
-        pdf.cell(50, 7, f"${s['price_at_moment']:.2f}", 1, 1, 'R')
-        total_services += s['price_at_moment']
+        pdf.cell(50, 7, format_money(s['price_at_moment_cents']), 1, 1, 'R')
+        total_services += s['price_at_moment_cents']
         
     pdf.ln(5)
     
@@ -64,11 +65,11 @@ def generate_invoice_pdf(repair_data, services, parts, expenses, invoice_number)
     pdf.set_font('Arial', '', 10)
     total_parts = 0
     for p in parts:
-        subtotal = p['quantity'] * p['price_at_moment']
+        subtotal = p['quantity'] * p['price_at_moment_cents']
         pdf.cell(100, 7, p['name'], 1)
         pdf.cell(20, 7, str(p['quantity']), 1, 0, 'C')
-        pdf.cell(30, 7, f"${p['price_at_moment']:.2f}", 1, 0, 'R')
-        pdf.cell(40, 7, f"${subtotal:.2f}", 1, 1, 'R')
+        pdf.cell(30, 7, format_money(p['price_at_moment_cents']), 1, 0, 'R')
+        pdf.cell(40, 7, format_money(subtotal), 1, 1, 'R')
         total_parts += subtotal
         
     pdf.ln(10)
@@ -85,16 +86,16 @@ def generate_invoice_pdf(repair_data, services, parts, expenses, invoice_number)
         pdf.set_font('Arial', '', 10)
         for ex in expenses:
             pdf.cell(140, 7, ex['description'], 1)
-            pdf.cell(50, 7, f"${ex['amount']:.2f}", 1, 1, 'R')
-            total_expenses += ex['amount']
+            pdf.cell(50, 7, format_money(ex['amount_cents']), 1, 1, 'R')
+            total_expenses += ex['amount_cents']
         
         pdf.ln(10)
     
-    # Totals
+    # Totals (integer cents, so they match the repair's total exactly)
     grand_total = total_services + total_parts + total_expenses
     pdf.set_font('Arial', 'B', 12)
     pdf.cell(140, 10, 'Total a Pagar:', 0, 0, 'R')
-    pdf.cell(50, 10, f"${grand_total:.2f}", 0, 1, 'R')
+    pdf.cell(50, 10, format_money(grand_total), 0, 1, 'R')
     
     pdf.ln(20)
     pdf.set_font('Arial', 'I', 10)
@@ -0,0 +1,71 @@
+import glob
+import hashlib
+import os
+from database import db
+
+# Photos are stored once per distinct content, as blobs/ab/cd/abcd....jpg named
+# by their SHA-256. Two levels of two hex digits keep each folder small.
+STORE_DIR = os.path.join("assets", "vehicle_photos", "blobs")
+
+# Unreferenced blobs younger than this are kept: a photo just received from
+# the phone has no vehicle row until the user saves the dialog.
+GC_GRACE_SECONDS = 24 * 60 * 60
+
+# Blobs no row references anymore, older than the grace period (parameter: '-N seconds')
+GARBAGE_QUERY = '''
+    SELECT sha256, path, size FROM photo_blobs
+    WHERE refcount = 0 AND stored_at < datetime('now', ?)
+'''
+
+def blob_path(digest):
+    return os.path.join(STORE_DIR, digest[:2], digest[2:4], f"{digest}.jpg")
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def store_photo(path):
+    """
+    Moves a photo into the store and returns its blob path, the value to save
+    in photo_path. When the same content is already stored, the incoming file
+    is deleted and the existing blob is returned, so duplicates take no space.
+    """
+    digest = file_digest(path)
+    target = blob_path(digest)
+    # The file is placed while holding the write lock, so the garbage
+    # collector cannot delete the blob between the upsert and the move
+    with db.write() as cursor:
+        cursor.execute('''
+            INSERT INTO photo_blobs (sha256, path, size) VALUES (?, ?, ?)
+            ON CONFLICT (sha256) DO UPDATE SET stored_at = CURRENT_TIMESTAMP
+        ''', (digest, target, os.path.getsize(path)))
+        if os.path.abspath(path) == os.path.abspath(target):
+            pass
+        elif os.path.exists(target):
+            os.remove(path)
+        else:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.replace(path, target)
+    return target
+
+def collect_garbage(grace_seconds=GC_GRACE_SECONDS):
+    """
+    Deletes the blobs no row references anymore, with their thumbnails.
+    :return: (blobs deleted, bytes freed)
+    """
+    with db.write() as cursor:
+        cursor.execute(GARBAGE_QUERY, (f"-{int(grace_seconds)} seconds",))
+        garbage = cursor.fetchall()
+        cursor.executemany("DELETE FROM photo_blobs WHERE sha256 = ?", [(row["sha256"],) for row in garbage])
+        for row in garbage:
+            # Thumbnails live in thumbs/ next to the blob, named <sha256>_<size>.jpg
+            thumbs = glob.glob(os.path.join(os.path.dirname(row["path"]), "thumbs", f"{row['sha256']}_*.jpg"))
+            for path in [row["path"]] + thumbs:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+    return len(garbage), sum(row["size"] for row in garbage)
@@ -0,0 +1,115 @@
+import calendar
+import heapq
+from datetime import date, timedelta
+from database import db, RECURRING_EXPENSE_PERIODS_SQL as _RECURRING_SQL
+
+WEEKLY = "Semanal"
+MONTHLY = "Mensual"
+
+# Expenses whose dates are real YYYY-MM-DD dates. Older rows may hold free
+# text that _migration_iso_expense_dates could not read; they are left out of
+# every expansion and total instead of breaking it.
+def iso_dates(row):
+    return (f"date({row}.date) = {row}.date"
+            f" AND ({row}.end_date IS NULL OR date({row}.end_date) = {row}.end_date)")
+
+# Expenses in a date range (:start, :end) as one scalar expression: one-time
+# expenses by their date, recurring ones once per calendar day they fall on.
+# A monthly expense dated the 31st falls on the last day of shorter months.
+EXPENSE_TOTAL = f'''
+    (SELECT COALESCE(SUM(amount_cents), 0) FROM expenses
+     WHERE period_type NOT IN ({_RECURRING_SQL}) AND date >= :start AND date <= :end
+       AND {iso_dates("expenses")})
+    + (SELECT COALESCE(SUM(x.amount_cents), 0) FROM expenses x
+       JOIN calendar c ON c.date >= MAX(x.date, :start) AND c.date <= MIN(COALESCE(x.end_date, :end), :end)
+       WHERE x.period_type IN ({_RECURRING_SQL}) AND x.date <= :end AND {iso_dates("x")}
+         AND CASE x.period_type
+             WHEN '{WEEKLY}' THEN c.weekday = CAST(strftime('%w', x.date) AS INTEGER)
+             ELSE c.day = MIN(CAST(strftime('%d', x.date) AS INTEGER), c.month_days)
+         END)
+'''
+
+def days(start, end):
+    """Every date from start to end, inclusive, one at a time."""
+    day = start
+    while day <= end:
+        yield day
+        day += timedelta(days=1)
+
+def ensure_calendar(start_date, end_date):
+    """Makes sure the calendar table has a row for every day of the range."""
+    start, end = date.fromisoformat(start_date), date.fromisoformat(end_date)
+    with db.read() as cursor:
+        cursor.execute("SELECT COUNT(*) FROM calendar WHERE date >= ? AND date <= ?", (start_date, end_date))
+        if cursor.fetchone()[0] == (end - start).days + 1:
+            return
+
+    # executemany pulls the rows from the generator as it inserts them
+    with db.write() as cursor:
+        cursor.executemany(
+            "INSERT OR IGNORE INTO calendar (date, weekday, day, month_days) VALUES (?, ?, ?, ?)",
+            (
+                (day.isoformat(), day.isoweekday() % 7, day.day, calendar.monthrange(day.year, day.month)[1])
+                for day in days(start, end)
+            )
+        )
+
+def occurrences(expense, start, end):
+    """
+    Dates on which one expense is due between start and end (dates), in order.
+    One-time expenses are due on their own date only.
+    """
+    first = date.fromisoformat(expense["date"])
+    if expense.get("end_date"):
+        end = min(end, date.fromisoformat(expense["end_date"]))
+
+    if expense["period_type"] == WEEKLY:
+        # First weekly date on or after `start`
+        skip = max(0, (start - first).days + 6) // 7
+        day = first + timedelta(weeks=skip)
+        while day <= end:
+            yield day
+            day += timedelta(weeks=1)
+    elif expense["period_type"] == MONTHLY:
+        year, month = max(first, start).year, max(first, start).month
+        while True:
+            due = date(year, month, min(first.day, calendar.monthrange(year, month)[1]))
+            if due > end:
+                return
+            if due >= start and due >= first:
+                yield due
+            year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    elif start <= first <= end:
+        yield first
+
+def expand_expenses(start_date, end_date):
+    """
+    Every expense due between two dates, one dict per occurrence with its
+    due date in 'date' and the expense's own date in 'first_date', ordered
+    by date. Occurrences are generated as they are consumed, so a long range
+    never holds more than one pending date per expense in memory.
+    """
+    start, end = date.fromisoformat(start_date), date.fromisoformat(end_date)
+    with db.read() as cursor:
+        cursor.execute(f'''
+            SELECT * FROM expenses
+            WHERE {iso_dates("expenses")}
+              AND ((period_type NOT IN ({_RECURRING_SQL}) AND date >= :start AND date <= :end)
+                   OR (period_type IN ({_RECURRING_SQL}) AND date <= :end
+                       AND (end_date IS NULL OR end_date >= :start)))
+            ORDER BY date, id
+        ''', {"start": start_date, "end": end_date})
+        expenses = [dict(row) for row in cursor.fetchall()]
+
+    def due(expense):
+        for day in occurrences(expense, start, end):
+            yield {**expense, "date": day.isoformat(), "first_date": expense["date"]}
+
+    return heapq.merge(*(due(expense) for expense in expenses), key=lambda occurrence: occurrence["date"])
+
+def expense_total(start_date, end_date):
+    """Expenses due between two dates in cents, recurring ones once per occurrence."""
+    ensure_calendar(start_date, end_date)
+    with db.read() as cursor:
+        cursor.execute(f"SELECT {EXPENSE_TOTAL}", {"start": start_date, "end": end_date})
+        return cursor.fetchone()[0]
@@ -0,0 +1,48 @@
+import json
+
+# A repair with its vehicle, client and every line item, in one statement.
+# Each child table is folded into a JSON array by a correlated subquery that
+# searches its repair_id index, so one round-trip returns the whole aggregate.
+REPAIR_AGGREGATE = '''
+    SELECT r.*, v.brand, v.model, v.year, v.plate, c.first_name, c.last_name,
+        (SELECT json_group_array(json_object(
+                    'service_id', service_id, 'name', name, 'price_at_moment_cents', price_at_moment_cents))
+         FROM (SELECT rs.service_id, s.name, rs.price_at_moment_cents
+               FROM repair_services rs JOIN services s ON rs.service_id = s.id
+               WHERE rs.repair_id = r.id ORDER BY rs.rowid)) AS services,
+        (SELECT json_group_array(json_object(
+                    'part_id', part_id, 'name', name, 'quantity', quantity, 'price_at_moment_cents', price_at_moment_cents))
+         FROM (SELECT rp.part_id, p.name, rp.quantity, rp.price_at_moment_cents
+               FROM repair_parts rp JOIN parts p ON rp.part_id = p.id
+               WHERE rp.repair_id = r.id ORDER BY rp.rowid)) AS parts,
+        (SELECT json_group_array(json_object(
+                    'id', id, 'description', description, 'amount_cents', amount_cents))
+         FROM (SELECT id, description, amount_cents
+               FROM repair_expenses
+               WHERE repair_id = r.id ORDER BY id)) AS expenses
+    FROM repairs r
+    JOIN vehicles v ON r.vehicle_id = v.id
+    JOIN clients c ON v.client_id = c.id
+'''
+
+_CHILDREN = ("services", "parts", "expenses")
+
+def _to_aggregate(row):
+    repair = dict(row)
+    for name in _CHILDREN:
+        repair[name] = json.loads(repair[name])
+    return repair
+
+def load_repairs(cursor, where, params=()):
+    """
+    Repairs matching a WHERE clause over `r` (repairs), `v` (vehicles) and
+    `c` (clients), as plain dicts with 'services', 'parts' and 'expenses'
+    lists, ordered by repair id. Plain dicts can be sent to worker processes.
+    """
+    cursor.execute(f"{REPAIR_AGGREGATE} WHERE {where} ORDER BY r.id", params)
+    return [_to_aggregate(row) for row in cursor.fetchall()]
+
+def load_repair(cursor, repair_id):
+    """One repair with all its line items (see load_repairs), or None."""
+    repairs = load_repairs(cursor, "r.id = ?", (repair_id,))
+    return repairs[0] if repairs else None
@@ -0,0 +1,129 @@
+from datetime import date, timedelta
+from database import db, REPORT_METRICS
+from utils.recurrence import EXPENSE_TOTAL, ensure_calendar, expand_expenses
+
+METRICS = [metric for metric, *_ in REPORT_METRICS]
+
+# Each metric of a period (:start, :end) as a scalar expression; each subquery
+# is a range search on its table's date index
+_METRIC_SUMS = {
+    metric: f'''(SELECT COALESCE(SUM({amount}), 0) FROM {table}
+         WHERE {condition.format(row=table)} AND {date_column} >= :start AND {date_column} <= :end)'''
+    for metric, table, date_column, amount, condition, _ in REPORT_METRICS
+}
+# Recurring expenses count once per week or month they fall in
+_METRIC_SUMS["expenses"] = EXPENSE_TOTAL
+
+# Every metric of one period in a single statement
+PERIOD_TOTALS = "SELECT " + ", ".join(f"{_METRIC_SUMS[metric]} AS {metric}" for metric in METRICS)
+
+ROLLUPS_QUERY = '''
+    SELECT period_start, period_end, metric, amount_cents FROM report_rollups
+    WHERE period_start >= ? AND period_end <= ?
+'''
+
+INVOICE_ENTRIES_QUERY = '''
+    SELECT i.issue_date as date, i.total_amount_cents as amount_cents, i.id,
+           c.first_name, c.last_name, v.brand, v.model
+    FROM invoices i
+    JOIN repairs r ON i.repair_id = r.id
+    JOIN vehicles v ON r.vehicle_id = v.id
+    JOIN clients c ON v.client_id = c.id
+    WHERE i.issue_date >= ? AND i.issue_date <= ?
+    ORDER BY i.issue_date, i.id
+'''
+
+# Income tied to a repair is already counted through its invoice
+OTHER_INCOME_QUERY = '''
+    SELECT date, description, amount_cents FROM transactions
+    WHERE type = 'Income' AND related_repair_id IS NULL AND date >= ? AND date <= ?
+    ORDER BY date, id
+'''
+
+def report_periods(start_date, end_date):
+    """
+    Splits a date range into the calendar months it touches, clamped to the
+    range. A range that is exactly one Monday-Sunday week stays one period.
+    :return: [(start, end, whole)], where `whole` marks a full month or week.
+    """
+    start, end = date.fromisoformat(start_date), date.fromisoformat(end_date)
+    if start.weekday() == 0 and end - start == timedelta(days=6):
+        return [(start_date, end_date, True)]
+
+    periods = []
+    month_start = start.replace(day=1)
+    while month_start <= end:
+        next_month = (month_start + timedelta(days=32)).replace(day=1)
+        month_end = next_month - timedelta(days=1)
+        periods.append((
+            max(month_start, start).isoformat(),
+            min(month_end, end).isoformat(),
+            month_start >= start and month_end <= end,
+        ))
+        month_start = next_month
+    return periods
+
+def _cached_rollups(cursor, start_date, end_date):
+    cursor.execute(ROLLUPS_QUERY, (start_date, end_date))
+    cached = {}
+    for row in cursor.fetchall():
+        cached.setdefault((row["period_start"], row["period_end"]), {})[row["metric"]] = row["amount_cents"]
+    return {key: totals for key, totals in cached.items() if len(totals) == len(METRICS)}
+
+def totals_by_period(start_date, end_date):
+    """
+    Income and expense totals in cents for each period of report_periods().
+    Closed whole periods (ended before today) are read from report_rollups,
+    and the ones missing there are computed once and stored; the rest are
+    summed by SQLite over the date indexes. A yearly report therefore reads
+    at most one or two open months from the source tables.
+    :return: [{"start", "end", "invoices", "other_income", "expenses"}]
+    """
+    periods = report_periods(start_date, end_date)
+    today = date.today().isoformat()
+    ensure_calendar(start_date, end_date)
+    closed = [(start, end) for start, end, whole in periods if whole and end < today]
+
+    with db.read() as cursor:
+        cached = _cached_rollups(cursor, start_date, end_date)
+
+    missing = [period for period in closed if period not in cached]
+    if missing:
+        # Computed under the write lock, so no write can land in a period
+        # between summing it and storing its rollup
+        with db.write() as cursor:
+            for metric in METRICS:
+                cursor.executemany(f'''
+                    INSERT OR REPLACE INTO report_rollups (period_start, period_end, metric, amount_cents)
+                    SELECT :start, :end, '{metric}', {_METRIC_SUMS[metric]}
+                ''', [{"start": start, "end": end} for start, end in missing])
+            cached = _cached_rollups(cursor, start_date, end_date)
+
+    results = []
+    with db.read() as cursor:
+        for start, end, _ in periods:
+            totals = cached.get((start, end))
+            if totals is None:
+                cursor.execute(PERIOD_TOTALS, {"start": start, "end": end})
+                totals = dict(cursor.fetchone())
+            results.append({"start": start, "end": end, **{metric: totals[metric] for metric in METRICS}})
+    return results
+
+def report_totals(start_date, end_date):
+    """Totals in cents of the whole range: {"invoices", "other_income", "expenses"}."""
+    periods = totals_by_period(start_date, end_date)
+    return {metric: sum(period[metric] for period in periods) for metric in METRICS}
+
+def report_entries(start_date, end_date):
+    """
+    The rows behind a period's totals, for the detail sections of a report.
+    Recurring expenses appear once per occurrence, dated when they are due.
+    :return: (invoices, other income transactions, expenses) as lists of dicts.
+    """
+    with db.read() as cursor:
+        cursor.execute(INVOICE_ENTRIES_QUERY, (start_date, end_date))
+        invoices = [dict(row) for row in cursor.fetchall()]
+
+        cursor.execute(OTHER_INCOME_QUERY, (start_date, end_date))
+        other_income = [dict(row) for row in cursor.fetchall()]
+    return invoices, other_income, list(expand_expenses(start_date, end_date))
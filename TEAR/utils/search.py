@@ -0,0 +1,126 @@
+import re
+from database import (
+    db,
+    SEARCH_KIND_SLOTS,
+    SEARCH_KIND_CLIENT,
+    SEARCH_KIND_VEHICLE,
+    SEARCH_KIND_REPAIR,
+    SEARCH_KIND_HISTORY,
+    SEARCH_KIND_PART,
+    SEARCH_KIND_SERVICE,
+)
+
+# Best matches taken from the full-text index before mapping them to a scope
+MAX_HITS = 500
+
+_HITS = f'''
+    WITH hits AS (
+        SELECT rowid / {SEARCH_KIND_SLOTS} AS ref_id, rowid % {SEARCH_KIND_SLOTS} AS kind, rank
+        FROM search_index
+        WHERE search_index MATCH ? AND {{kinds}}
+        ORDER BY {{order}}
+        LIMIT ?
+    )
+'''
+
+_REPAIR_MATCHES = f'''
+    SELECT ref_id AS id, rank FROM hits WHERE kind = {SEARCH_KIND_REPAIR}
+    UNION ALL
+    SELECT r.id, h.rank FROM hits h
+    JOIN repairs r ON r.vehicle_id = h.ref_id
+    WHERE h.kind = {SEARCH_KIND_VEHICLE}
+    UNION ALL
+    SELECT r.id, h.rank FROM hits h
+    JOIN vehicles v ON v.client_id = h.ref_id
+    JOIN repairs r ON r.vehicle_id = v.id
+    WHERE h.kind = {SEARCH_KIND_CLIENT}
+'''
+
+# How full-text hits on clients, vehicles, repairs and history entries map to
+# the ids listed by each view. Every join below goes through an index.
+_SCOPES = {
+    "clients": f'''
+        SELECT ref_id AS id, rank FROM hits WHERE kind = {SEARCH_KIND_CLIENT}
+        UNION ALL
+        SELECT v.client_id, h.rank FROM hits h
+        JOIN vehicles v ON v.id = h.ref_id
+        WHERE h.kind = {SEARCH_KIND_VEHICLE}
+    ''',
+    "vehicles": f'''
+        SELECT ref_id AS id, rank FROM hits WHERE kind = {SEARCH_KIND_VEHICLE}
+        UNION ALL
+        SELECT v.id, h.rank FROM hits h
+        JOIN vehicles v ON v.client_id = h.ref_id
+        WHERE h.kind = {SEARCH_KIND_CLIENT}
+        UNION ALL
+        SELECT vh.vehicle_id, h.rank FROM hits h
+        JOIN vehicle_history vh ON vh.id = h.ref_id
+        WHERE h.kind = {SEARCH_KIND_HISTORY}
+    ''',
+    "repairs": _REPAIR_MATCHES,
+    "invoices": f'''
+        SELECT i.id, m.rank FROM ({_REPAIR_MATCHES}) m
+        JOIN invoices i ON i.repair_id = m.id
+    ''',
+    "parts": f"SELECT ref_id AS id, rank FROM hits WHERE kind = {SEARCH_KIND_PART}",
+    "services": f"SELECT ref_id AS id, rank FROM hits WHERE kind = {SEARCH_KIND_SERVICE}",
+}
+
+# Kinds of index entries each scope can use. Filtering on them before the
+# MAX_HITS cut keeps, say, part names from crowding out plates.
+_REPAIR_KINDS = (SEARCH_KIND_CLIENT, SEARCH_KIND_VEHICLE, SEARCH_KIND_REPAIR)
+_SCOPE_KINDS = {
+    "clients": (SEARCH_KIND_CLIENT, SEARCH_KIND_VEHICLE),
+    "vehicles": (SEARCH_KIND_CLIENT, SEARCH_KIND_VEHICLE, SEARCH_KIND_HISTORY),
+    "repairs": _REPAIR_KINDS,
+    "invoices": _REPAIR_KINDS,
+    "parts": (SEARCH_KIND_PART,),
+    "services": (SEARCH_KIND_SERVICE,),
+}
+
+def _kind_filter(scope):
+    kinds = ", ".join(str(kind) for kind in _SCOPE_KINDS[scope])
+    return f"rowid % {SEARCH_KIND_SLOTS} IN ({kinds})"
+
+def build_match_query(term):
+    """
+    Turns free text typed by the user into an FTS5 query where every word is
+    a prefix, e.g. 'abc-12 juan' -> '"abc"* "12"* "juan"*'.
+    Returns None when the text has nothing searchable.
+    """
+    tokens = re.findall(r"\w+", term or "")
+    if not tokens:
+        return None
+    return " ".join(f'"{token}"*' for token in tokens)
+
+def search(term, scope, limit=200):
+    """
+    Ranked full-text search over clients, vehicles, repairs, vehicle history,
+    parts and services.
+    :param term: Text typed in a search box.
+    :param scope: 'clients', 'vehicles', 'repairs', 'invoices', 'parts' or 'services'.
+    :return: Ids of the scope's table, best match first.
+    """
+    match_query = build_match_query(term)
+    if match_query is None:
+        return []
+
+    kinds = _kind_filter(scope)
+    with db.read() as cursor:
+        # Ranking every match of a very broad prefix ('a', '5') costs far more
+        # than finding them, so bm25 only orders small match sets; broad ones
+        # keep the newest MAX_HITS entries, which FTS5 reads straight off the index.
+        cursor.execute(
+            f"SELECT COUNT(*) FROM (SELECT 1 FROM search_index WHERE search_index MATCH ? AND {kinds} LIMIT ?)",
+            (match_query, MAX_HITS + 1)
+        )
+        order = "rank" if cursor.fetchone()[0] <= MAX_HITS else "rowid DESC"
+
+        query = _HITS.format(kinds=kinds, order=order) + f'''
+            SELECT id FROM ({_SCOPES[scope]})
+            GROUP BY id
+            ORDER BY MIN(rank)
+            LIMIT ?
+        '''
+        cursor.execute(query, (match_query, MAX_HITS, limit))
+        return [row["id"] for row in cursor.fetchall()]
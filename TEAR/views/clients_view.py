@@ -1,62 +1,71 @@
 import flet as ft
-from database import get_db_connection
+import json
+from database import db
+from components.search_controller import SearchController
+from components.paginated_table import PaginatedTable, keyset_query
+from utils.search import search
 
 def ClientsView(page):
     # Search field
-    search_field = ft.TextField(label="Buscar por teléfono", suffix_icon="search", width=300)
-
-    # Data Table
-    clients_table = ft.DataTable(
-        columns=[
-            ft.DataColumn(ft.Text("ID")),
-            ft.DataColumn(ft.Text("Nombre")),
-            ft.DataColumn(ft.Text("Apellido")),
-            ft.DataColumn(ft.Text("Teléfono")),
-            ft.DataColumn(ft.Text("Dirección")),
-            ft.DataColumn(ft.Text("Acciones")),
-        ],
-        rows=[]
-    )
+    search_field = ft.TextField(label="Buscar por nombre, teléfono o placa", suffix_icon="search", width=300)
 
-    def load_clients(search_query=None):
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        if search_query:
-            cursor.execute("SELECT * FROM clients WHERE phone LIKE ?", (f"%{search_query}%",))
-        else:
-            cursor.execute("SELECT * FROM clients")
-        rows = cursor.fetchall()
-        conn.close()
-
-        clients_table.rows.clear()
-        for row in rows:
-            clients_table.rows.append(
-                ft.DataRow(
-                    cells=[
-                        ft.DataCell(ft.Text(str(row["id"]))),
-                        ft.DataCell(ft.Text(row["first_name"])),
-                        ft.DataCell(ft.Text(row["last_name"])),
-                        ft.DataCell(ft.Text(row["phone"])),
-                        ft.DataCell(ft.Text(row["address"])),
-                        ft.DataCell(
-                            ft.Row([
-                                ft.IconButton("edit", icon_color="blue", tooltip="Editar", on_click=lambda e, r=row: open_edit_dialog(r)),
-                                ft.IconButton("delete", icon_color="red", tooltip="Eliminar", on_click=lambda e, id=row["id"]: delete_client(id))
-                            ])
-                        ),
-                    ]
+    def fetch_clients(sort, after, limit, search_query=None):
+        with db.read() as cursor:
+            if search_query:
+                # Keep the ranking returned by the search index
+                cursor.execute(
+                    "SELECT c.* FROM json_each(?) hit JOIN clients c ON c.id = hit.value ORDER BY hit.key",
+                    (json.dumps(search(search_query, "clients", limit)),)
                 )
-            )
-        page.update()
+            else:
+                cursor.execute(*keyset_query("SELECT * FROM clients", sort, after, limit))
+            return cursor.fetchall()
+
+    def fetch_client(client_id):
+        with db.read() as cursor:
+            cursor.execute("SELECT * FROM clients WHERE id = ?", (client_id,))
+            return cursor.fetchone()
+
+    def build_client_row(row):
+        return ft.DataRow(
+            cells=[
+                ft.DataCell(ft.Text(str(row["id"]))),
+                ft.DataCell(ft.Text(row["first_name"])),
+                ft.DataCell(ft.Text(row["last_name"])),
+                ft.DataCell(ft.Text(row["phone"])),
+                ft.DataCell(ft.Text(row["address"])),
+                ft.DataCell(
+                    ft.Row([
+                        ft.IconButton("edit", icon_color="blue", tooltip="Editar", on_click=lambda e, r=row: open_edit_dialog(r)),
+                        ft.IconButton("delete", icon_color="red", tooltip="Eliminar", on_click=lambda e, id=row["id"]: delete_client(id))
+                    ])
+                ),
+            ]
+        )
+
+    # Data Table (one page at a time, sorted by the database)
+    clients_table = PaginatedTable(
+        page,
+        columns=["ID", "Nombre", "Apellido", "Teléfono", "Dirección", "Acciones"],
+        fetch_page=fetch_clients,
+        build_row=build_client_row,
+        fetch_row=fetch_client,
+        sort_columns={
+            0: ("id", "id"),
+            1: ("first_name", "first_name"),
+            2: ("last_name", "last_name"),
+            3: ("phone", "phone"),
+        },
+    )
+
+    def load_clients():
+        clients_table.reload()
 
     def delete_client(client_id):
         try:
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            cursor.execute("DELETE FROM clients WHERE id = ?", (client_id,))
-            conn.commit()
-            conn.close()
-            load_clients()
+            with db.write() as cursor:
+                cursor.execute("DELETE FROM clients WHERE id = ?", (client_id,))
+            clients_table.remove(client_id)
             page.open(ft.SnackBar(ft.Text("Cliente eliminado")))
         except Exception as ex:
             page.open(ft.SnackBar(ft.Text(f"Error al eliminar: {str(ex)}")))
@@ -77,16 +86,13 @@ def ClientsView(page):
 
     def update_client(client_id):
         try:
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            cursor.execute(
-                "UPDATE clients SET first_name=?, last_name=?, phone=?, address=? WHERE id=?",
-                (first_name.value, last_name.value, phone.value, address.value, client_id)
-            )
-            conn.commit()
-            conn.close()
+            with db.write() as cursor:
+                cursor.execute(
+                    "UPDATE clients SET first_name=?, last_name=?, phone=?, address=? WHERE id=?",
+                    (first_name.value, last_name.value, phone.value, address.value, client_id)
+                )
             page.close(dialog)
-            load_clients()
+            clients_table.refresh(client_id)
             page.open(ft.SnackBar(ft.Text("Cliente actualizado")))
         except Exception as ex:
             page.open(ft.SnackBar(ft.Text(f"Error: {str(ex)}")))
@@ -103,16 +109,14 @@ def ClientsView(page):
             return
 
         try:
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            cursor.execute(
-                "INSERT INTO clients (first_name, last_name, phone, address) VALUES (?, ?, ?, ?)",
-                (first_name.value, last_name.value, phone.value, address.value)
-            )
-            conn.commit()
-            conn.close()
+            with db.write() as cursor:
+                cursor.execute(
+                    "INSERT INTO clients (first_name, last_name, phone, address) VALUES (?, ?, ?, ?)",
+                    (first_name.value, last_name.value, phone.value, address.value)
+                )
+                client_id = cursor.lastrowid
             page.close(dialog)
-            load_clients()
+            clients_table.refresh(client_id)
             page.open(ft.SnackBar(ft.Text("Cliente registrado")))
         except Exception as ex:
             page.open(ft.SnackBar(ft.Text(f"Error: {str(ex)}")))
@@ -143,11 +147,8 @@ def ClientsView(page):
         # Flet 0.28.3 correct way to open dialogs
         page.open(dialog)
 
-    # Search handler
-    def on_search(e):
-        load_clients(search_field.value)
-
-    search_field.on_change = on_search
+    # Search runs debounced on a worker thread
+    SearchController(search_field, clients_table.fetch, clients_table.show)
 
     load_clients()
 
@@ -171,7 +172,7 @@ def ClientsView(page):
                 ft.Divider(),
                 ft.Row([search_field], alignment=ft.MainAxisAlignment.END),
                 ft.Container(
-                    content=clients_table,
+                    content=clients_table.control,
                     border=ft.border.all(1, "outline"),
                     border_radius=10,
                     padding=10,
@@ -180,6 +181,7 @@ def ClientsView(page):
                 )
             ],
             scroll=ft.ScrollMode.AUTO,
+            on_scroll=clients_table.on_scroll,
             expand=True
         )
     )
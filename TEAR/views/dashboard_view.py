@@ -1,35 +1,25 @@
 import flet as ft
-from database import get_db_connection
+from database import db
 import datetime
+from utils.money import format_money
+
+# Also checked by check_indexes.py
+KPI_QUERY = "SELECT name, value FROM kpi_counters"
+MONTHLY_INCOME_QUERY = "SELECT month, amount_cents / 100.0 FROM monthly_income ORDER BY month DESC LIMIT 6"
 
 def DashboardView(page):
-    # Fetch Data
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    cursor.execute("SELECT COUNT(*) FROM clients")
-    clients_count = cursor.fetchone()[0]
-    
-    cursor.execute("SELECT COUNT(*) FROM vehicles")
-    vehicles_count = cursor.fetchone()[0]
-    
-    cursor.execute("SELECT COUNT(*) FROM repairs WHERE status='En Proceso'")
-    active_repairs_count = cursor.fetchone()[0]
-    
-    cursor.execute("SELECT SUM(amount) FROM transactions WHERE type='Income'")
-    total_income = cursor.fetchone()[0] or 0.0
-    
-    # Chart Data (Last 6 months income)
-    cursor.execute("""
-        SELECT strftime('%Y-%m', date) as month, SUM(amount) 
-        FROM transactions 
-        WHERE type='Income' 
-        GROUP BY month 
-        ORDER BY month DESC 
-        LIMIT 6
-    """)
-    chart_data = cursor.fetchall()
-    conn.close()
+    # Fetch Data (precomputed by triggers, see _migration_kpis in database.py)
+    with db.read() as cursor:
+        cursor.execute(KPI_QUERY)
+        kpis = {row["name"]: row["value"] for row in cursor.fetchall()}
+        clients_count = kpis.get("clients", 0)
+        vehicles_count = kpis.get("vehicles", 0)
+        active_repairs_count = kpis.get("active_repairs", 0)
+        total_income = kpis.get("income", 0)
+
+        # Chart Data (Last 6 months income)
+        cursor.execute(MONTHLY_INCOME_QUERY)
+        chart_data = cursor.fetchall()
 
     # Prepare Chart Groups
     chart_groups = []
@@ -73,7 +63,7 @@ def DashboardView(page):
                         _build_summary_card("Clientes", str(clients_count), "people", "blue"),
                         _build_summary_card("Autos", str(vehicles_count), "directions_car", "orange"),
                         _build_summary_card("En Proceso", str(active_repairs_count), "build_circle", "red"),
-                        _build_summary_card("Ingresos", f"${total_income:,.2f}", "attach_money", "green"),
+                        _build_summary_card("Ingresos", format_money(total_income), "attach_money", "green"),
                     ],
                     alignment=ft.MainAxisAlignment.SPACE_BETWEEN,
                     wrap=True,
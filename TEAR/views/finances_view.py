@@ -1,7 +1,9 @@
 import flet as ft
-from database import get_db_connection
+from database import db
 from datetime import datetime, timedelta
 from utils.financial_report_generator import generate_financial_report
+from utils.money import to_cents, format_money
+from utils.recurrence import expense_total
 import os
 import threading
 import subprocess
@@ -46,27 +48,37 @@ def FinancesView(page):
     def load_data():
         try:
             # Fast DB query
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            cursor.execute("SELECT * FROM transactions WHERE type='Income' ORDER BY date DESC")
-            income_rows_data = [dict(row) for row in cursor.fetchall()]
-            
-            cursor.execute("SELECT * FROM expenses ORDER BY date DESC")
-            expense_rows_data = [dict(row) for row in cursor.fetchall()]
-            conn.close()
+            with db.read() as cursor:
+                cursor.execute("SELECT * FROM transactions WHERE type='Income' ORDER BY date DESC")
+                income_rows_data = [dict(row) for row in cursor.fetchall()]
+
+                cursor.execute("SELECT * FROM expenses ORDER BY date DESC")
+                expense_rows_data = [dict(row) for row in cursor.fetchall()]
+
+                # Exact totals in integer cents
+                cursor.execute('''
+                    SELECT
+                        (SELECT COALESCE(SUM(amount_cents), 0) FROM transactions WHERE type='Income'),
+                        (SELECT MIN(date) FROM expenses WHERE date(date) = date)
+                ''')
+                total_income, first_expense_date = cursor.fetchone()
+
+            # Recurring expenses count once per week or month elapsed so far
+            today = datetime.now().strftime("%Y-%m-%d")
+            if first_expense_date and first_expense_date <= today:
+                total_expense = expense_total(first_expense_date, today)
+            else:
+                total_expense = 0
 
             # Build UI rows
             new_income_rows = []
-            total_income = 0
             for row in income_rows_data:
-                amount = row["amount"]
-                total_income += amount
                 new_income_rows.append(
                     ft.DataRow(
                         cells=[
                             ft.DataCell(ft.Text(row["date"])),
                             ft.DataCell(ft.Text(row["description"])),
-                            ft.DataCell(ft.Text(f"${amount:.2f}")),
+                            ft.DataCell(ft.Text(format_money(row["amount_cents"]))),
                             ft.DataCell(
                                 ft.IconButton(
                                     "delete", 
@@ -81,18 +93,17 @@ def FinancesView(page):
                 )
 
             new_expense_rows = []
-            total_expense = 0
             for row in expense_rows_data:
-                amount = row["amount"]
-                total_expense += amount
                 new_expense_rows.append(
                     ft.DataRow(
                         cells=[
                             ft.DataCell(ft.Text(str(row["id"]))),
                             ft.DataCell(ft.Text(row["date"])),
-                            ft.DataCell(ft.Text(row["period_type"])),
+                            ft.DataCell(ft.Text(
+                                f"{row['period_type']} (hasta {row['end_date']})" if row["end_date"] else row["period_type"]
+                            )),
                             ft.DataCell(ft.Text(row["description"])),
-                            ft.DataCell(ft.Text(f"${amount:.2f}")),
+                            ft.DataCell(ft.Text(format_money(row["amount_cents"]))),
                             ft.DataCell(
                                 ft.IconButton(
                                     "delete", 
@@ -109,9 +120,9 @@ def FinancesView(page):
             try:
                 income_table.rows = new_income_rows
                 expenses_table.rows = new_expense_rows
-                income_text.value = f"${total_income:.2f}"
-                expense_text.value = f"${total_expense:.2f}"
-                balance_text.value = f"${total_income - total_expense:.2f}"
+                income_text.value = format_money(total_income)
+                expense_text.value = format_money(total_expense)
+                balance_text.value = format_money(total_income - total_expense)
             except:
                 # View no longer active, silently ignore
                 pass
@@ -121,11 +132,8 @@ def FinancesView(page):
 
     # --- Deletion Logic ---
     def handle_delete_income(item_id, e):
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM transactions WHERE id = ?", (item_id,))
-        conn.commit()
-        conn.close()
+        with db.write() as cursor:
+            cursor.execute("DELETE FROM transactions WHERE id = ?", (item_id,))
         load_data()
         try:
             page.update()
@@ -133,11 +141,8 @@ def FinancesView(page):
             pass
 
     def handle_delete_expense(item_id, e):
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM expenses WHERE id = ?", (item_id,))
-        conn.commit()
-        conn.close()
+        with db.write() as cursor:
+            cursor.execute("DELETE FROM expenses WHERE id = ?", (item_id,))
         load_data()
         try:
             page.update()
@@ -154,19 +159,20 @@ def FinancesView(page):
             page.open(ft.SnackBar(ft.Text("Monto y Descripción son obligatorios")))
             return
         
-        amt = float(inc_amount_field.value)
+        try:
+            amt = to_cents(inc_amount_field.value)
+        except ValueError as ex:
+            page.open(ft.SnackBar(ft.Text(str(ex))))
+            return
         desc = inc_desc_field.value
         dt = inc_date_field.value
         
         # Save to DB (fast operation)
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute(
-            "INSERT INTO transactions (type, amount, description, date) VALUES (?, ?, ?, ?)",
-            ("Income", amt, desc, dt)
-        )
-        conn.commit()
-        conn.close()
+        with db.write() as cursor:
+            cursor.execute(
+                "INSERT INTO transactions (type, amount_cents, description, date) VALUES (?, ?, ?, ?)",
+                ("Income", amt, desc, dt)
+            )
         
         # Reset fields
         inc_amount_field.value = ""
@@ -202,30 +208,52 @@ def FinancesView(page):
         value="Único"
     )
     exp_date_field = ft.TextField(label="Fecha (YYYY-MM-DD)", value=datetime.now().strftime("%Y-%m-%d"))
+    exp_end_date_field = ft.TextField(label="Hasta (YYYY-MM-DD, opcional)", visible=False)
+    exp_period_dropdown.on_change = lambda e: toggle_end_date()
+
+    def toggle_end_date():
+        # Only weekly and monthly expenses repeat until an end date
+        exp_end_date_field.visible = exp_period_dropdown.value != "Único"
+        page.update()
 
     def add_expense(e):
         if not exp_amount_field.value or not exp_desc_field.value:
             page.open(ft.SnackBar(ft.Text("Monto y Descripción son obligatorios")))
             return
         
-        amt = float(exp_amount_field.value)
+        try:
+            amt = to_cents(exp_amount_field.value)
+        except ValueError as ex:
+            page.open(ft.SnackBar(ft.Text(str(ex))))
+            return
         desc = exp_desc_field.value
         period = exp_period_dropdown.value
         dt = exp_date_field.value
+        end_dt = (exp_end_date_field.value or None) if period != "Único" else None
+
+        # Recurring expenses are expanded day by day, so the dates must be real ones
+        try:
+            for value in [dt, end_dt]:
+                if value:
+                    datetime.strptime(value, "%Y-%m-%d")
+        except ValueError:
+            page.open(ft.SnackBar(ft.Text("Las fechas deben tener el formato YYYY-MM-DD")))
+            return
+        if end_dt and end_dt < dt:
+            page.open(ft.SnackBar(ft.Text("La fecha final no puede ser anterior a la inicial")))
+            return
         
         # Save to DB (fast operation)
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute(
-            "INSERT INTO expenses (amount, period_type, description, date) VALUES (?, ?, ?, ?)",
-            (amt, period, desc, dt)
-        )
-        conn.commit()
-        conn.close()
+        with db.write() as cursor:
+            cursor.execute(
+                "INSERT INTO expenses (amount_cents, period_type, description, date, end_date) VALUES (?, ?, ?, ?, ?)",
+                (amt, period, desc, dt, end_dt)
+            )
         
         # Reset fields
         exp_amount_field.value = ""
         exp_desc_field.value = ""
+        exp_end_date_field.value = ""
         page.close(expense_dialog)
         
         # Reload and update (single batch update)
@@ -237,7 +265,7 @@ def FinancesView(page):
 
     expense_dialog = ft.AlertDialog(
         title=ft.Text("Registrar Gasto"),
-        content=ft.Column([exp_amount_field, exp_period_dropdown, exp_desc_field, exp_date_field], tight=True),
+        content=ft.Column([exp_amount_field, exp_period_dropdown, exp_desc_field, exp_date_field, exp_end_date_field], tight=True),
         actions=[
             ft.TextButton("Cancelar", on_click=lambda e: (setattr(expense_dialog, 'open', False), page.update())),
             ft.ElevatedButton("Guardar", on_click=add_expense),
@@ -257,7 +285,7 @@ def FinancesView(page):
     # --- Report Generation (only threading here, for PDF generation) ---
     report_type_dropdown = ft.Dropdown(
         label="Tipo de Reporte",
-        options=[ft.dropdown.Option("Semanal"), ft.dropdown.Option("Mensual")],
+        options=[ft.dropdown.Option("Semanal"), ft.dropdown.Option("Mensual"), ft.dropdown.Option("Anual")],
         value="Mensual",
         on_change=lambda e: toggle_report_inputs(e)
     )
@@ -279,10 +307,10 @@ def FinancesView(page):
     report_week_date = ft.TextField(label="Fecha (YYYY-MM-DD)", value=datetime.now().strftime("%Y-%m-%d"), visible=False)
 
     def toggle_report_inputs(e):
-        is_monthly = report_type_dropdown.value == "Mensual"
-        report_month_dropdown.visible = is_monthly
-        report_year_field.visible = is_monthly
-        report_week_date.visible = not is_monthly
+        is_weekly = report_type_dropdown.value == "Semanal"
+        report_month_dropdown.visible = report_type_dropdown.value == "Mensual"
+        report_year_field.visible = not is_weekly
+        report_week_date.visible = is_weekly
         page.update()
 
     def open_pdf_report(path):
@@ -310,6 +338,11 @@ def FinancesView(page):
                 end_date_obj = datetime(int(year), int(month)+1, 1)
             end_date = (end_date_obj - timedelta(days=1)).strftime("%Y-%m-%d")
             period_name = f"Mensual - {month}/{year}"
+        elif report_type == "Anual":
+            year = report_year_field.value
+            start_date = f"{year}-01-01"
+            end_date = f"{year}-12-31"
+            period_name = f"Anual - {year}"
         else:
             try:
                 ref_date = datetime.strptime(report_week_date.value, "%Y-%m-%d")
@@ -323,26 +356,8 @@ def FinancesView(page):
 
         def run_generation():
             try:
-                conn = get_db_connection()
-                cursor = conn.cursor()
-                cursor.execute("SELECT * FROM transactions WHERE type='Income' AND date >= ? AND date <= ?", (start_date, end_date))
-                transactions = [dict(row) for row in cursor.fetchall()]
-                
-                cursor.execute('''
-                    SELECT r.total_cost, r.start_date, r.end_date, v.plate, v.brand, v.model, c.first_name, c.last_name
-                    FROM repairs r
-                    JOIN vehicles v ON r.vehicle_id = v.id
-                    JOIN clients c ON v.client_id = c.id
-                    WHERE r.status = 'Completada' 
-                    AND (r.end_date >= ? AND r.end_date <= ?)
-                ''', (start_date, end_date))
-                repair_income = [dict(row) for row in cursor.fetchall()]
-
-                cursor.execute("SELECT * FROM expenses WHERE date >= ? AND date <= ?", (start_date, end_date))
-                expenses = [dict(row) for row in cursor.fetchall()]
-                conn.close()
-
-                pdf_path = generate_financial_report(start_date, end_date, repair_income, transactions, expenses, period_name)
+                # The report reads its own totals and rows
+                pdf_path = generate_financial_report(start_date, end_date, period_name)
                 
                 page.open(ft.SnackBar(
                     content=ft.Text("Reporte generado exitosamente"),
@@ -395,7 +410,7 @@ def FinancesView(page):
                 ft.Row(
                     [
                         ft.Container(content=ft.Column([ft.Text("Ingresos Extras"), income_text]), bgcolor="surfacevariant", padding=15, border_radius=10, expand=True),
-                        ft.Container(content=ft.Column([ft.Text("Gastos Totales"), expense_text]), bgcolor="surfacevariant", padding=15, border_radius=10, expand=True),
+                        ft.Container(content=ft.Column([ft.Text("Gastos a la Fecha"), expense_text]), bgcolor="surfacevariant", padding=15, border_radius=10, expand=True),
                         ft.Container(content=ft.Column([ft.Text("Balance (Extras - Gastos)"), balance_text]), bgcolor="surfacevariant", padding=15, border_radius=10, expand=True),
                     ],
                     spacing=20
@@ -1,64 +1,112 @@
 import flet as ft
-from database import get_db_connection
-from utils.pdf_generator import generate_invoice_pdf
+import json
+from database import db
+from components.search_controller import SearchController
+from components.paginated_table import PaginatedTable, keyset_query
+from utils.search import search
+from utils.invoice_jobs import (
+    enqueue_invoice_pdf,
+    retry_invoice_pdf,
+    resume_pending,
+    count_uninvoiced,
+    issue_all_uninvoiced,
+    PDF_READY,
+    PDF_FAILED,
+)
+from utils.money import format_money
 import os
+import threading
 from datetime import datetime
 
+# Rows of the invoices list, and the repairs that can still be invoiced;
+# both are also checked by check_indexes.py
+INVOICES_QUERY = '''
+    SELECT i.*, c.first_name, c.last_name, v.brand, v.model 
+    FROM invoices i
+    JOIN repairs r ON i.repair_id = r.id
+    JOIN vehicles v ON r.vehicle_id = v.id
+    JOIN clients c ON v.client_id = c.id
+'''
+UNINVOICED_REPAIRS_QUERY = '''
+    SELECT r.id, v.brand, v.model, c.first_name, c.last_name, r.total_cost_cents
+    FROM repairs r
+    JOIN vehicles v ON r.vehicle_id = v.id
+    JOIN clients c ON v.client_id = c.id
+    LEFT JOIN invoices i ON r.id = i.repair_id
+    WHERE r.status = 'Completada' AND i.id IS NULL
+'''
+
 def InvoicesView(page):
     # Search field
     search_field = ft.TextField(label="Buscar por cliente o vehículo", suffix_icon="search", width=400)
 
-    # Data Table
-    invoices_table = ft.DataTable(
-        columns=[
-            ft.DataColumn(ft.Text("ID")),
-            ft.DataColumn(ft.Text("Fecha")),
-            ft.DataColumn(ft.Text("Cliente")),
-            ft.DataColumn(ft.Text("Monto Total")),
-            ft.DataColumn(ft.Text("Acciones")),
-        ],
-        rows=[]
-    )
+    invoices_query = INVOICES_QUERY
 
-    def load_invoices(search_query=None):
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        query = '''
-            SELECT i.*, c.first_name, c.last_name, v.brand, v.model 
-            FROM invoices i
-            JOIN repairs r ON i.repair_id = r.id
-            JOIN vehicles v ON r.vehicle_id = v.id
-            JOIN clients c ON v.client_id = c.id
-        '''
-        
-        if search_query:
-            query += " WHERE c.first_name LIKE ? OR c.last_name LIKE ? OR v.plate LIKE ?"
-            cursor.execute(query, (f"%{search_query}%", f"%{search_query}%", f"%{search_query}%"))
-        else:
-            cursor.execute(query)
-            
-        rows = cursor.fetchall()
-        conn.close()
-
-        invoices_table.rows.clear()
-        for row in rows:
-            invoices_table.rows.append(
-                ft.DataRow(
-                    cells=[
-                        ft.DataCell(ft.Text(str(row["id"]))),
-                        ft.DataCell(ft.Text(row["issue_date"])),
-                        ft.DataCell(ft.Text(f"{row['first_name']} {row['last_name']}")),
-                        ft.DataCell(ft.Text(f"${row['total_amount']:.2f}")),
-                        ft.DataCell(
-                            ft.Row([
-                                ft.IconButton("picture_as_pdf", icon_color="red", tooltip="Ver PDF", on_click=lambda e, path=row["pdf_path"]: open_pdf(path)),
-                            ])
-                        ),
-                    ]
+    def fetch_invoices(sort, after, limit, search_query=None):
+        with db.read() as cursor:
+            if search_query:
+                # Keep the ranking returned by the search index
+                cursor.execute(
+                    invoices_query + " JOIN json_each(?) hit ON hit.value = i.id ORDER BY hit.key",
+                    (json.dumps(search(search_query, "invoices", limit)),)
                 )
+            else:
+                cursor.execute(*keyset_query(invoices_query, sort, after, limit, id_column="i.id"))
+            return cursor.fetchall()
+
+    def fetch_invoice(invoice_id):
+        with db.read() as cursor:
+            cursor.execute(invoices_query + " WHERE i.id = ?", (invoice_id,))
+            return cursor.fetchone()
+
+    def build_pdf_action(row):
+        if row["pdf_status"] == PDF_READY:
+            return ft.IconButton("picture_as_pdf", icon_color="red", tooltip="Ver PDF", on_click=lambda e, path=row["pdf_path"]: open_pdf(path))
+        if row["pdf_status"] == PDF_FAILED:
+            return ft.IconButton(
+                "refresh",
+                icon_color="orange",
+                tooltip=f"Reintentar PDF ({row['pdf_error']})",
+                on_click=lambda e, id=row["id"]: retry_pdf(id)
             )
-        page.update()
+        return ft.ProgressRing(width=16, height=16, stroke_width=2, tooltip="Generando PDF...")
+
+    def build_invoice_id(row):
+        # Second invoices of a repair issued before the unique index existed
+        if row["duplicate_of"]:
+            return ft.Text(f"{row['id']} (duplicada de #{row['duplicate_of']})", color="orange")
+        return ft.Text(str(row["id"]))
+
+    def build_invoice_row(row):
+        status_colors = {PDF_READY: "green", PDF_FAILED: "red"}
+        return ft.DataRow(
+            cells=[
+                ft.DataCell(build_invoice_id(row)),
+                ft.DataCell(ft.Text(row["issue_date"])),
+                ft.DataCell(ft.Text(f"{row['first_name']} {row['last_name']}")),
+                ft.DataCell(ft.Text(format_money(row["total_amount_cents"]))),
+                ft.DataCell(ft.Text(row["pdf_status"], color=status_colors.get(row["pdf_status"], "orange"))),
+                ft.DataCell(ft.Row([build_pdf_action(row)])),
+            ]
+        )
+
+    # Data Table (one page at a time, sorted by the database)
+    invoices_table = PaginatedTable(
+        page,
+        columns=["ID", "Fecha", "Cliente", "Monto Total", "PDF", "Acciones"],
+        fetch_page=fetch_invoices,
+        build_row=build_invoice_row,
+        fetch_row=fetch_invoice,
+        sort_columns={
+            0: ("i.id", "id"),
+            1: ("i.issue_date", "issue_date"),
+            2: ("c.first_name", "first_name"),
+            3: ("i.total_amount_cents", "total_amount_cents"),
+        },
+    )
+
+    def load_invoices():
+        invoices_table.reload()
 
     def open_pdf(path):
         if path and os.path.exists(path):
@@ -66,26 +114,39 @@ def InvoicesView(page):
         else:
             page.open(ft.SnackBar(ft.Text("El archivo PDF no existe")))
 
+    def on_pdf_done(invoice_id, status):
+        # Runs on the PDF worker thread; the view may no longer be on screen
+        if invoices_table.table.page is None:
+            return
+        invoices_table.refresh(invoice_id)
+        if status == PDF_READY:
+            page.open(ft.SnackBar(ft.Text(f"PDF de la factura #{invoice_id} listo")))
+        else:
+            page.open(ft.SnackBar(ft.Text(f"No se pudo generar el PDF de la factura #{invoice_id}")))
+
+    def on_new_invoice_pdf_done(invoice_id, status):
+        on_pdf_done(invoice_id, status)
+        if status == PDF_READY and invoices_table.table.page is not None:
+            # Open the PDF automatically
+            with db.read() as cursor:
+                cursor.execute("SELECT pdf_path FROM invoices WHERE id = ?", (invoice_id,))
+                open_pdf(cursor.fetchone()["pdf_path"])
+
+    def retry_pdf(invoice_id):
+        retry_invoice_pdf(invoice_id, on_pdf_done)
+        invoices_table.refresh(invoice_id)
+
     # Dialog for generating new invoice
     repair_dropdown = ft.Dropdown(label="Seleccionar Reparación Completada", width=400)
 
     def load_completed_repairs():
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        # Only show completed repairs that don't have an invoice yet
-        cursor.execute('''
-            SELECT r.id, v.brand, v.model, c.first_name, c.last_name, r.total_cost
-            FROM repairs r
-            JOIN vehicles v ON r.vehicle_id = v.id
-            JOIN clients c ON v.client_id = c.id
-            LEFT JOIN invoices i ON r.id = i.repair_id
-            WHERE r.status = 'Completada' AND i.id IS NULL
-        ''')
-        repairs = cursor.fetchall()
-        conn.close()
+        with db.read() as cursor:
+            # Only show completed repairs that don't have an invoice yet
+            cursor.execute(UNINVOICED_REPAIRS_QUERY)
+            repairs = cursor.fetchall()
         
         repair_dropdown.options = [
-            ft.dropdown.Option(key=str(r["id"]), text=f"#{r['id']} - {r['brand']} {r['model']} ({r['first_name']}) - ${r['total_cost']:.2f}")
+            ft.dropdown.Option(key=str(r["id"]), text=f"#{r['id']} - {r['brand']} {r['model']} ({r['first_name']}) - {format_money(r['total_cost_cents'])}")
             for r in repairs
         ]
 
@@ -96,74 +157,33 @@ def InvoicesView(page):
 
         repair_id = int(repair_dropdown.value)
         
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Get Repair Data
-        cursor.execute('''
-            SELECT r.*, v.brand, v.model, v.year, v.plate, c.first_name, c.last_name
-            FROM repairs r
-            JOIN vehicles v ON r.vehicle_id = v.id
-            JOIN clients c ON v.client_id = c.id
-            WHERE r.id = ?
-        ''', (repair_id,))
-        repair_data = cursor.fetchone()
-        
-        # Get Services
-        cursor.execute('''
-            SELECT s.name, rs.price_at_moment 
-            FROM repair_services rs 
-            JOIN services s ON rs.service_id = s.id 
-            WHERE rs.repair_id = ?
-        ''', (repair_id,))
-        services = cursor.fetchall()
-        
-        # Get Parts
-        cursor.execute('''
-            SELECT p.name, rp.quantity, rp.price_at_moment 
-            FROM repair_parts rp 
-            JOIN parts p ON rp.part_id = p.id 
-            WHERE rp.repair_id = ?
-        ''', (repair_id,))
-        parts = cursor.fetchall()
-
-        # Get Expenses
-        cursor.execute('''
-            SELECT description, amount 
-            FROM repair_expenses 
-            WHERE repair_id = ?
-        ''', (repair_id,))
-        expenses = cursor.fetchall()
-        
-        # Create Invoice Record
-        issue_date = datetime.now().strftime("%Y-%m-%d")
-        cursor.execute(
-            "INSERT INTO invoices (repair_id, issue_date, total_amount) VALUES (?, ?, ?)",
-            (repair_id, issue_date, repair_data["total_cost"])
-        )
-        invoice_id = cursor.lastrowid
-        
-        # Generate PDF
-        pdf_path = generate_invoice_pdf(repair_data, services, parts, expenses, invoice_id)
-        
-        # Update Invoice with PDF Path
-        cursor.execute("UPDATE invoices SET pdf_path = ? WHERE id = ?", (pdf_path, invoice_id))
-        
-        # Add Income Transaction
-        cursor.execute(
-            "INSERT INTO transactions (type, amount, description, date, related_repair_id) VALUES (?, ?, ?, ?, ?)",
-            ('Income', repair_data["total_cost"], f"Factura #{invoice_id} - Reparación #{repair_id}", issue_date, repair_id)
-        )
-        
-        conn.commit()
-        conn.close()
-        
+        # Only the invoice and its income are written here; the PDF is rendered
+        # by the background queue once this transaction has committed
+        with db.write() as cursor:
+            # Create Invoice Record (pdf_status starts as 'Pendiente'), unless
+            # "Facturar Todas" invoiced this repair since the dialog was opened
+            issue_date = datetime.now().strftime("%Y-%m-%d")
+            cursor.execute('''
+                INSERT INTO invoices (repair_id, issue_date, total_amount_cents)
+                SELECT id, ?, total_cost_cents FROM repairs
+                WHERE id = ? AND NOT EXISTS (SELECT 1 FROM invoices WHERE repair_id = repairs.id)
+            ''', (issue_date, repair_id))
+            invoice_id = cursor.lastrowid if cursor.rowcount else None
+
+            # Add Income Transaction
+            if invoice_id:
+                cursor.execute('''
+                    INSERT INTO transactions (type, amount_cents, description, date, related_repair_id)
+                    SELECT 'Income', total_amount_cents, ?, issue_date, repair_id FROM invoices WHERE id = ?
+                ''', (f"Factura #{invoice_id} - Reparación #{repair_id}", invoice_id))
+
         page.close(dialog)
-        load_invoices()
-        page.open(ft.SnackBar(ft.Text("Factura generada exitosamente")))
-        
-        # Open the PDF automatically
-        open_pdf(pdf_path)
+        if invoice_id is None:
+            page.open(ft.SnackBar(ft.Text("La reparación ya tiene factura")))
+            return
+        invoices_table.refresh(invoice_id)
+        page.open(ft.SnackBar(ft.Text("Factura generada, preparando PDF...")))
+        enqueue_invoice_pdf(invoice_id, on_new_invoice_pdf_done)
 
     generate_button = ft.ElevatedButton("Generar Factura", on_click=generate_invoice)
     
@@ -180,18 +200,68 @@ def InvoicesView(page):
         actions_alignment=ft.MainAxisAlignment.END,
     )
 
+    # Bulk invoicing of every completed repair without an invoice
+    bulk_text = ft.Text()
+    bulk_progress = ft.ProgressBar(width=400, value=0, visible=False)
+
+    def run_bulk_invoicing():
+        def on_progress(done, total):
+            bulk_progress.value = done / total
+            bulk_text.value = f"Generando PDFs... {done} de {total}"
+            page.update()
+
+        try:
+            issued, failed = issue_all_uninvoiced(on_progress)
+            message = f"{issued} facturas generadas"
+            if failed:
+                message += f" ({failed} PDF no se pudieron generar)"
+        except Exception as ex:
+            message = f"Error al facturar: {str(ex)}"
+        page.close(bulk_dialog)
+        load_invoices()
+        page.open(ft.SnackBar(ft.Text(message)))
+
+    def start_bulk_invoicing(e):
+        bulk_confirm_button.disabled = True
+        bulk_cancel_button.disabled = True
+        bulk_progress.visible = True
+        bulk_progress.value = None # Indeterminate while the invoices are written
+        bulk_text.value = "Registrando facturas..."
+        page.update()
+        threading.Thread(target=run_bulk_invoicing, daemon=True).start()
+
+    bulk_confirm_button = ft.ElevatedButton("Facturar", on_click=start_bulk_invoicing)
+    bulk_cancel_button = ft.TextButton("Cancelar", on_click=lambda e: page.close(bulk_dialog))
+    bulk_dialog = ft.AlertDialog(
+        modal=True,
+        title=ft.Text("Facturar Reparaciones Completadas"),
+        content=ft.Column([bulk_text, bulk_progress], tight=True),
+        actions=[bulk_cancel_button, bulk_confirm_button],
+        actions_alignment=ft.MainAxisAlignment.END,
+    )
+
+    def open_bulk_dialog(e):
+        pending = count_uninvoiced()
+        if not pending:
+            page.open(ft.SnackBar(ft.Text("No hay reparaciones completadas sin facturar")))
+            return
+        bulk_text.value = f"Se generarán {pending} facturas, una por cada reparación completada sin facturar."
+        bulk_progress.visible = False
+        bulk_confirm_button.disabled = False
+        bulk_cancel_button.disabled = False
+        page.open(bulk_dialog)
+
     def open_add_dialog(e):
         load_completed_repairs()
         repair_dropdown.value = None
         page.open(dialog)
 
-    # Search handler
-    def on_search(e):
-        load_invoices(search_field.value)
-
-    search_field.on_change = on_search
+    # Search runs debounced on a worker thread
+    SearchController(search_field, invoices_table.fetch, invoices_table.show)
 
     load_invoices()
+    # PDFs left pending when the app was closed
+    resume_pending(on_pdf_done)
 
     return ft.Container(
         padding=20,
@@ -200,20 +270,27 @@ def InvoicesView(page):
                 ft.Row(
                     [
                         ft.Text("Gestión de Facturas", size=30, weight=ft.FontWeight.BOLD),
-                        ft.ElevatedButton(
-                            "Nueva Factura",
-                            icon="add",
-                            on_click=open_add_dialog,
-                            bgcolor="primary",
-                            color="black"
-                        )
+                        ft.Row([
+                            ft.OutlinedButton(
+                                "Facturar Todas",
+                                icon="playlist_add_check",
+                                on_click=open_bulk_dialog,
+                            ),
+                            ft.ElevatedButton(
+                                "Nueva Factura",
+                                icon="add",
+                                on_click=open_add_dialog,
+                                bgcolor="primary",
+                                color="black"
+                            ),
+                        ]),
                     ],
                     alignment=ft.MainAxisAlignment.SPACE_BETWEEN
                 ),
                 ft.Divider(),
                 ft.Row([search_field], alignment=ft.MainAxisAlignment.END),
                 ft.Container(
-                    content=invoices_table,
+                    content=invoices_table.control,
                     border=ft.border.all(1, "outline"),
                     border_radius=10,
                     padding=10,
@@ -221,6 +298,7 @@ def InvoicesView(page):
                 )
             ],
             scroll=ft.ScrollMode.AUTO,
+            on_scroll=invoices_table.on_scroll,
             expand=True
         )
     )
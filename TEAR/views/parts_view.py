@@ -1,5 +1,9 @@
 import flet as ft
-from database import get_db_connection
+from database import db
+from components.search_controller import SearchController
+from components.keyed_rows import KeyedRows
+from utils.money import to_cents, format_money, money_input
+from utils.inventory import adjust_stock
 
 def PartsView(page):
     # Search field
@@ -11,63 +15,73 @@ def PartsView(page):
             ft.DataColumn(ft.Text("ID")),
             ft.DataColumn(ft.Text("Nombre")),
             ft.DataColumn(ft.Text("Stock")),
+            ft.DataColumn(ft.Text("Reservado")),
+            ft.DataColumn(ft.Text("Disponible")),
             ft.DataColumn(ft.Text("Precio Base")),
             ft.DataColumn(ft.Text("Acciones")),
         ],
         rows=[]
     )
 
-    def load_parts(search_query=None):
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        if search_query:
-            cursor.execute("SELECT * FROM parts WHERE name LIKE ?", (f"%{search_query}%",))
-        else:
-            cursor.execute("SELECT * FROM parts")
-        rows = cursor.fetchall()
-        conn.close()
-
-        parts_table.rows.clear()
-        for row in rows:
-            parts_table.rows.append(
-                ft.DataRow(
-                    cells=[
-                        ft.DataCell(ft.Text(str(row["id"]))),
-                        ft.DataCell(ft.Text(row["name"])),
-                        ft.DataCell(ft.Text(str(row["stock"]))),
-                        ft.DataCell(ft.Text(f"${row['base_price']:.2f}")),
-                        ft.DataCell(
-                            ft.Row([
-                                ft.IconButton("edit", icon_color="blue", tooltip="Editar", on_click=lambda e, r=row: open_edit_dialog(r)),
-                                ft.IconButton("delete", icon_color="red", tooltip="Eliminar", on_click=lambda e, id=row["id"]: delete_part(id))
-                            ])
-                        ),
-                    ]
-                )
-            )
+    def fetch_parts(search_query=None):
+        with db.read() as cursor:
+            if search_query:
+                cursor.execute("SELECT * FROM parts WHERE name LIKE ?", (f"%{search_query}%",))
+            else:
+                cursor.execute("SELECT * FROM parts")
+            return cursor.fetchall()
+
+    def fetch_part(part_id):
+        with db.read() as cursor:
+            cursor.execute("SELECT * FROM parts WHERE id = ?", (part_id,))
+            return cursor.fetchone()
+
+    def build_part_row(row):
+        return ft.DataRow(
+            cells=[
+                ft.DataCell(ft.Text(str(row["id"]))),
+                ft.DataCell(ft.Text(row["name"])),
+                ft.DataCell(ft.Text(str(row["stock"]))),
+                ft.DataCell(ft.Text(str(row["reserved"]))),
+                ft.DataCell(ft.Text(str(row["stock"] - row["reserved"]))),
+                ft.DataCell(ft.Text(format_money(row["base_price_cents"]))),
+                ft.DataCell(
+                    ft.Row([
+                        ft.IconButton("edit", icon_color="blue", tooltip="Editar", on_click=lambda e, r=row: open_edit_dialog(r)),
+                        ft.IconButton("delete", icon_color="red", tooltip="Eliminar", on_click=lambda e, id=row["id"]: delete_part(id))
+                    ])
+                ),
+            ]
+        )
+
+    # Rows are patched by id after single edits instead of rebuilt
+    part_rows = KeyedRows(parts_table, build_part_row, fetch_part)
+
+    def render_parts(rows):
+        part_rows.replace(rows)
         page.update()
 
+    def load_parts(search_query=None):
+        render_parts(fetch_parts(search_query))
+
     def delete_part(part_id):
         try:
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            cursor.execute("DELETE FROM parts WHERE id = ?", (part_id,))
-            conn.commit()
-            conn.close()
-            load_parts()
+            with db.write() as cursor:
+                cursor.execute("DELETE FROM parts WHERE id = ?", (part_id,))
+            part_rows.remove(part_id)
             page.open(ft.SnackBar(ft.Text("Refacción eliminada")))
         except Exception as ex:
             page.open(ft.SnackBar(ft.Text(f"Error al eliminar: {str(ex)}")))
 
     # Dialog components
     name = ft.TextField(label="Nombre de la Refacción")
-    stock = ft.TextField(label="Stock", input_filter=ft.InputFilter(allow=True, regex_string=r"[0-9]"))
+    stock = ft.TextField(label="Stock en almacén", input_filter=ft.InputFilter(allow=True, regex_string=r"[0-9]"))
     base_price = ft.TextField(label="Precio Base", input_filter=ft.InputFilter(allow=True, regex_string=r"[0-9.]"))
     
     def open_edit_dialog(row):
         name.value = row["name"]
         stock.value = str(row["stock"])
-        base_price.value = str(row["base_price"])
+        base_price.value = money_input(row["base_price_cents"])
         
         dialog.title = ft.Text("Editar Refacción")
         save_button.on_click = lambda e: update_part(row["id"])
@@ -75,16 +89,15 @@ def PartsView(page):
 
     def update_part(part_id):
         try:
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            cursor.execute(
-                "UPDATE parts SET name=?, stock=?, base_price=? WHERE id=?",
-                (name.value, int(stock.value), float(base_price.value), part_id)
-            )
-            conn.commit()
-            conn.close()
+            with db.write() as cursor:
+                cursor.execute(
+                    "UPDATE parts SET name=?, base_price_cents=? WHERE id=?",
+                    (name.value, to_cents(base_price.value), part_id)
+                )
+                # The count goes through the ledger, so rebuild_stock() keeps it
+                adjust_stock(cursor, part_id, int(stock.value))
             page.close(dialog)
-            load_parts()
+            part_rows.refresh(part_id)
             page.open(ft.SnackBar(ft.Text("Refacción actualizada")))
         except Exception as ex:
             page.open(ft.SnackBar(ft.Text(f"Error: {str(ex)}")))
@@ -95,16 +108,15 @@ def PartsView(page):
             return
 
         try:
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            cursor.execute(
-                "INSERT INTO parts (name, stock, base_price) VALUES (?, ?, ?)",
-                (name.value, int(stock.value or 0), float(base_price.value))
-            )
-            conn.commit()
-            conn.close()
+            with db.write() as cursor:
+                cursor.execute(
+                    "INSERT INTO parts (name, base_price_cents) VALUES (?, ?)",
+                    (name.value, to_cents(base_price.value))
+                )
+                part_id = cursor.lastrowid
+                adjust_stock(cursor, part_id, int(stock.value or 0), "Saldo inicial")
             page.close(dialog)
-            load_parts()
+            part_rows.refresh(part_id)
             page.open(ft.SnackBar(ft.Text("Refacción registrada")))
         except Exception as ex:
             page.open(ft.SnackBar(ft.Text(f"Error: {str(ex)}")))
@@ -130,11 +142,8 @@ def PartsView(page):
         save_button.on_click = save_new_part
         page.open(dialog)
 
-    # Search handler
-    def on_search(e):
-        load_parts(search_field.value)
-
-    search_field.on_change = on_search
+    # Search runs debounced on a worker thread
+    SearchController(search_field, fetch_parts, render_parts)
 
     load_parts()
 
@@ -1,85 +1,116 @@
 import flet as ft
-from database import get_db_connection
+import json
+from database import db, sync_children
+from components.search_controller import SearchController
+from components.paginated_table import PaginatedTable, keyset_query
+from components.autocomplete import Autocomplete
+from utils.search import search
+from utils.money import to_cents, format_money, money_input
+from utils.repair_loader import load_repair
+from utils import catalog
 from datetime import datetime
 
+# Rows of the repairs list; also checked by check_indexes.py
+REPAIRS_QUERY = '''
+    SELECT r.*, v.plate, v.brand, v.model, c.first_name, c.last_name 
+    FROM repairs r
+    JOIN vehicles v ON r.vehicle_id = v.id
+    JOIN clients c ON v.client_id = c.id
+'''
+
 def RepairsView(page):
     # Search field
-    search_field = ft.TextField(label="Buscar por placa o cliente", suffix_icon="search", width=400)
-
-    # Data Table
-    repairs_table = ft.DataTable(
-        columns=[
-            ft.DataColumn(ft.Text("ID")),
-            ft.DataColumn(ft.Text("Vehículo")),
-            ft.DataColumn(ft.Text("Cliente")),
-            ft.DataColumn(ft.Text("Detalles Generales")),
-            ft.DataColumn(ft.Text("Estado")),
-            ft.DataColumn(ft.Text("Costo Total")),
-            ft.DataColumn(ft.Text("Acciones")),
-        ],
-        rows=[]
-    )
+    search_field = ft.TextField(label="Buscar por placa, cliente o detalles", suffix_icon="search", width=400)
 
-    def load_repairs(search_query=None):
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        query = '''
-            SELECT r.*, v.plate, v.brand, v.model, c.first_name, c.last_name 
-            FROM repairs r
-            JOIN vehicles v ON r.vehicle_id = v.id
-            JOIN clients c ON v.client_id = c.id
-        '''
-        
-        if search_query:
-            query += " WHERE v.plate LIKE ? OR c.first_name LIKE ? OR c.last_name LIKE ?"
-            cursor.execute(query, (f"%{search_query}%", f"%{search_query}%", f"%{search_query}%"))
-        else:
-            cursor.execute(query)
-            
-        rows = cursor.fetchall()
-        conn.close()
-
-        repairs_table.rows.clear()
-        for row in rows:
-            status_color = "orange" if row["status"] == "En Proceso" else ("green" if row["status"] == "Completada" else "red")
-            repairs_table.rows.append(
-                ft.DataRow(
-                    cells=[
-                        ft.DataCell(ft.Text(str(row["id"]))),
-                        ft.DataCell(ft.Text(f"{row['brand']} {row['model']} ({row['plate']})")),
-                        ft.DataCell(ft.Text(f"{row['first_name']} {row['last_name']}")),
-                        ft.DataCell(ft.Text(row["general_details"])),
-                        ft.DataCell(ft.Container(content=ft.Text(row["status"], color="white"), bgcolor=status_color, padding=5, border_radius=5)),
-                        ft.DataCell(ft.Text(f"${row['total_cost']:.2f}")),
-                        ft.DataCell(
-                            ft.Row([
-                                ft.IconButton("edit", icon_color="blue", tooltip="Editar/Detalles", on_click=lambda e, r=row: open_edit_dialog(r)),
-                                ft.IconButton("delete", icon_color="red", tooltip="Eliminar", on_click=lambda e, id=row["id"]: delete_repair(id))
-                            ])
-                        ),
-                    ]
+    repairs_query = REPAIRS_QUERY
+
+    def fetch_repairs(sort, after, limit, search_query=None):
+        with db.read() as cursor:
+            if search_query:
+                # Keep the ranking returned by the search index
+                cursor.execute(
+                    repairs_query + " JOIN json_each(?) hit ON hit.value = r.id ORDER BY hit.key",
+                    (json.dumps(search(search_query, "repairs", limit)),)
                 )
-            )
-        page.update()
+            else:
+                cursor.execute(*keyset_query(repairs_query, sort, after, limit, id_column="r.id"))
+            return cursor.fetchall()
+
+    def fetch_repair(repair_id):
+        with db.read() as cursor:
+            cursor.execute(repairs_query + " WHERE r.id = ?", (repair_id,))
+            return cursor.fetchone()
+
+    def build_repair_row(row):
+        status_color = "orange" if row["status"] == "En Proceso" else ("green" if row["status"] == "Completada" else "red")
+        return ft.DataRow(
+            cells=[
+                ft.DataCell(ft.Text(str(row["id"]))),
+                ft.DataCell(ft.Text(f"{row['brand']} {row['model']} ({row['plate']})")),
+                ft.DataCell(ft.Text(f"{row['first_name']} {row['last_name']}")),
+                ft.DataCell(ft.Text(row["general_details"])),
+                ft.DataCell(ft.Container(content=ft.Text(row["status"], color="white"), bgcolor=status_color, padding=5, border_radius=5)),
+                ft.DataCell(ft.Text(format_money(row["total_cost_cents"]))),
+                ft.DataCell(
+                    ft.Row([
+                        ft.IconButton("edit", icon_color="blue", tooltip="Editar/Detalles", on_click=lambda e, r=row: open_edit_dialog(r)),
+                        ft.IconButton("delete", icon_color="red", tooltip="Eliminar", on_click=lambda e, id=row["id"]: delete_repair(id))
+                    ])
+                ),
+            ]
+        )
+
+    # Data Table (one page at a time, sorted by the database)
+    repairs_table = PaginatedTable(
+        page,
+        columns=["ID", "Vehículo", "Cliente", "Detalles Generales", "Estado", "Costo Total", "Acciones"],
+        fetch_page=fetch_repairs,
+        build_row=build_repair_row,
+        fetch_row=fetch_repair,
+        sort_columns={
+            0: ("r.id", "id"),
+            1: ("v.plate", "plate"),
+            2: ("c.first_name", "first_name"),
+            4: ("r.status", "status"),
+            5: ("r.total_cost_cents", "total_cost_cents"),
+        },
+    )
+
+    def load_repairs():
+        repairs_table.reload()
 
     def delete_repair(repair_id):
         try:
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            cursor.execute("DELETE FROM repairs WHERE id = ?", (repair_id,))
-            cursor.execute("DELETE FROM repair_services WHERE repair_id = ?", (repair_id,))
-            cursor.execute("DELETE FROM repair_parts WHERE repair_id = ?", (repair_id,))
-            cursor.execute("DELETE FROM repair_expenses WHERE repair_id = ?", (repair_id,))
-            conn.commit()
-            conn.close()
-            load_repairs()
+            with db.write() as cursor:
+                cursor.execute("DELETE FROM repairs WHERE id = ?", (repair_id,))
+                cursor.execute("DELETE FROM repair_services WHERE repair_id = ?", (repair_id,))
+                cursor.execute("DELETE FROM repair_parts WHERE repair_id = ?", (repair_id,))
+                cursor.execute("DELETE FROM repair_expenses WHERE repair_id = ?", (repair_id,))
+            repairs_table.remove(repair_id)
             page.open(ft.SnackBar(ft.Text("Reparación eliminada")))
         except Exception as ex:
             page.open(ft.SnackBar(ft.Text(f"Error al eliminar: {str(ex)}")))
 
     # --- Dialog Components ---
-    vehicle_dropdown = ft.Dropdown(label="Vehículo")
+    # Vehicles, services and parts are picked by typing: only the best matches
+    # of the search index become options, never the whole catalog
+    def describe_vehicle(key):
+        v = catalog.vehicles.get(key)
+        return f"{v['brand']} {v['model']} - {v['plate']} ({v['first_name']})" if v else None
+
+    def describe_service(key):
+        s = catalog.services.get(key)
+        return f"{s['name']} ({format_money(s['price_cents'])})" if s else None
+
+    def describe_part(key):
+        p = catalog.parts.get(key)
+        return f"{p['name']} ({format_money(p['base_price_cents'])}) - Disponible: {p['available']}" if p else None
+
+    vehicle_picker = Autocomplete(
+        "Vehículo (placa, cliente o teléfono)",
+        lambda text, limit: search(text, "vehicles", limit),
+        describe_vehicle,
+    )
     technician_dropdown = ft.Dropdown(label="Técnico Responsable")
     status_dropdown = ft.Dropdown(
         label="Estado",
@@ -101,95 +132,86 @@ def RepairsView(page):
     parts_list_view = ft.ListView(expand=True, height=150, spacing=10)
     expenses_list_view = ft.ListView(expand=True, height=150, spacing=10)
     
-    service_dropdown = ft.Dropdown(label="Agregar Servicio", expand=True)
-    part_dropdown = ft.Dropdown(label="Agregar Refacción", expand=True, on_change=lambda e: update_part_price_field(e))
+    service_picker = Autocomplete(
+        "Agregar Servicio",
+        lambda text, limit: search(text, "services", limit),
+        describe_service,
+        expand=True,
+    )
+    part_picker = Autocomplete(
+        "Agregar Refacción",
+        lambda text, limit: search(text, "parts", limit),
+        describe_part,
+        on_change=lambda key: update_part_price_field(key),
+        expand=True,
+    )
     part_qty = ft.TextField(label="Cant.", width=60, value="1")
     part_price = ft.TextField(label="Precio Unit.", width=100, value="0.00")
 
     expense_desc = ft.TextField(label="Descripción Gasto", expand=True)
     expense_amount = ft.TextField(label="Monto", width=100, value="0.00")
 
-    def update_part_price_field(e):
-        if not part_dropdown.value: return
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT base_price FROM parts WHERE id = ?", (part_dropdown.value,))
-        res = cursor.fetchone()
-        conn.close()
-        if res:
-            part_price.value = str(res["base_price"])
-            page.update()
+    def update_part_price_field(key):
+        if not key: return
+        part = catalog.parts.get(key)
+        if part is None:
+            not_found(part_picker, "Refacción no encontrada")
+            return
+        part_price.value = money_input(part["base_price_cents"])
+        page.update()
+
+    # Catalog rows each dropdown's options were last built from
+    options_built_from = {}
+
+    def set_options(dropdown, catalog_rows, build_option):
+        # Catalogs return the same list until their data changes
+        if options_built_from.get(id(dropdown)) is not catalog_rows:
+            dropdown.options = [build_option(row) for row in catalog_rows]
+            options_built_from[id(dropdown)] = catalog_rows
 
     def load_dropdowns():
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Vehicles
-        cursor.execute("SELECT v.id, v.brand, v.model, v.plate, c.first_name, c.last_name FROM vehicles v JOIN clients c ON v.client_id = c.id")
-        vehicles = cursor.fetchall()
-        vehicle_dropdown.options = [
-            ft.dropdown.Option(key=str(v["id"]), text=f"{v['brand']} {v['model']} - {v['plate']} ({v['first_name']})")
-            for v in vehicles
-        ]
-        
-        # Technicians
-        cursor.execute("SELECT id, first_name, last_name FROM technicians")
-        techs = cursor.fetchall()
-        technician_dropdown.options = [
-            ft.dropdown.Option(key=str(t["id"]), text=f"{t['first_name']} {t['last_name']}")
-            for t in techs
-        ]
-        
-        # Services
-        cursor.execute("SELECT id, name, price FROM services")
-        services = cursor.fetchall()
-        service_dropdown.options = [
-            ft.dropdown.Option(key=str(s["id"]), text=f"{s['name']} (${s['price']})")
-            for s in services
-        ]
-        
-        # Parts
-        cursor.execute("SELECT id, name, base_price, stock FROM parts")
-        parts = cursor.fetchall()
-        part_dropdown.options = [
-            ft.dropdown.Option(key=str(p["id"]), text=f"{p['name']} (${p['base_price']}) - Stock: {p['stock']}")
-            for p in parts
-        ]
-        
-        conn.close()
+        # Served from the in-process catalog; SQLite is only read after a change.
+        # The technician list stays a dropdown: a shop has a handful of them.
+        set_options(
+            technician_dropdown, catalog.technicians.rows(),
+            lambda t: ft.dropdown.Option(key=str(t["id"]), text=f"{t['first_name']} {t['last_name']}")
+        )
+
+    def not_found(picker, message):
+        # The row was deleted after the catalog was loaded or the suggestion shown
+        picker.value = None
+        page.open(ft.SnackBar(ft.Text(message)))
 
     def add_service_to_list(e):
-        if not service_dropdown.value: return
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM services WHERE id = ?", (service_dropdown.value,))
-        service = cursor.fetchone()
-        conn.close()
+        if not service_picker.value: return
+        service = catalog.services.get(service_picker.value)
+        if service is None:
+            not_found(service_picker, "Servicio no encontrado")
+            return
         
         selected_services.append({
             "id": service["id"],
             "name": service["name"],
-            "price": service["price"]
+            "price_cents": service["price_cents"]
         })
         update_services_list()
 
     def add_part_to_list(e):
-        if not part_dropdown.value: return
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM parts WHERE id = ?", (part_dropdown.value,))
-        part = cursor.fetchone()
-        conn.close()
+        if not part_picker.value: return
+        part = catalog.parts.get(part_picker.value)
+        if part is None:
+            not_found(part_picker, "Refacción no encontrada")
+            return
         
         try:
-            price = float(part_price.value)
+            price_cents = to_cents(part_price.value)
         except ValueError:
-            price = part["base_price"]
+            price_cents = part["base_price_cents"]
 
         selected_parts.append({
             "id": part["id"],
             "name": part["name"],
-            "price": price,
+            "price_cents": price_cents,
             "quantity": int(part_qty.value)
         })
         update_parts_list()
@@ -197,13 +219,13 @@ def RepairsView(page):
     def add_expense_to_list(e):
         if not expense_desc.value or not expense_amount.value: return
         try:
-            amount = float(expense_amount.value)
+            amount_cents = to_cents(expense_amount.value)
         except ValueError:
             return
             
         selected_expenses.append({
             "description": expense_desc.value,
-            "amount": amount
+            "amount_cents": amount_cents
         })
         expense_desc.value = ""
         expense_amount.value = "0.00"
@@ -217,7 +239,7 @@ def RepairsView(page):
             expenses_list_view.controls.append(
                 ft.ListTile(
                     title=ft.Text(ex["description"]),
-                    subtitle=ft.Text(f"${ex['amount']:.2f}"),
+                    subtitle=ft.Text(format_money(ex["amount_cents"])),
                     trailing=ft.IconButton("delete", on_click=lambda e, x=ex: remove_expense(x))
                 )
             )
@@ -229,7 +251,7 @@ def RepairsView(page):
             services_list_view.controls.append(
                 ft.ListTile(
                     title=ft.Text(s["name"]),
-                    subtitle=ft.Text(f"${s['price']}"),
+                    subtitle=ft.Text(format_money(s["price_cents"])),
                     trailing=ft.IconButton("delete", on_click=lambda e, x=s: remove_service(x))
                 )
             )
@@ -241,7 +263,7 @@ def RepairsView(page):
             parts_list_view.controls.append(
                 ft.ListTile(
                     title=ft.Text(f"{p['name']} (x{p['quantity']})"),
-                    subtitle=ft.Text(f"${p['price'] * p['quantity']}"),
+                    subtitle=ft.Text(format_money(p["price_cents"] * p["quantity"])),
                     trailing=ft.IconButton("delete", on_click=lambda e, x=p: remove_part(x))
                 )
             )
@@ -259,68 +281,54 @@ def RepairsView(page):
         selected_expenses.remove(ex)
         update_expenses_list()
 
-    def calculate_total():
-        total = 0
-        for s in selected_services:
-            total += s["price"]
-        for p in selected_parts:
-            total += p["price"] * p["quantity"]
-        for ex in selected_expenses:
-            total += ex["amount"]
-        return total
-
     def save_repair(repair_id=None):
-        if not vehicle_dropdown.value or not technician_dropdown.value:
+        if not vehicle_picker.value or not technician_dropdown.value:
             page.open(ft.SnackBar(ft.Text("Vehículo y Técnico son obligatorios")))
             return
+        if catalog.vehicles.get(vehicle_picker.value) is None:
+            not_found(vehicle_picker, "Vehículo no encontrado")
+            return
 
-        total_cost = calculate_total()
         current_date = datetime.now().strftime("%Y-%m-%d")
         
         try:
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            
-            if repair_id:
-                # Update existing
-                cursor.execute(
-                    "UPDATE repairs SET vehicle_id=?, technician_id=?, status=?, general_details=?, total_cost=? WHERE id=?",
-                    (vehicle_dropdown.value, technician_dropdown.value, status_dropdown.value, general_details.value, total_cost, repair_id)
-                )
-                # Clear old relations to re-insert (simplest way)
-                cursor.execute("DELETE FROM repair_services WHERE repair_id=?", (repair_id,))
-                cursor.execute("DELETE FROM repair_parts WHERE repair_id=?", (repair_id,))
-                cursor.execute("DELETE FROM repair_expenses WHERE repair_id=?", (repair_id,))
-                new_id = repair_id
-            else:
-                # Insert new
-                cursor.execute(
-                    "INSERT INTO repairs (vehicle_id, technician_id, status, general_details, start_date, total_cost) VALUES (?, ?, ?, ?, ?, ?)",
-                    (vehicle_dropdown.value, technician_dropdown.value, status_dropdown.value, general_details.value, current_date, total_cost)
-                )
-                new_id = cursor.lastrowid
-
-            # Insert Services
-            for s in selected_services:
-                cursor.execute("INSERT INTO repair_services (repair_id, service_id, price_at_moment) VALUES (?, ?, ?)",
-                               (new_id, s["id"], s["price"]))
-            
-            # Insert Parts
-            for p in selected_parts:
-                cursor.execute("INSERT INTO repair_parts (repair_id, part_id, quantity, price_at_moment) VALUES (?, ?, ?, ?)",
-                               (new_id, p["id"], p["quantity"], p["price"]))
-                # Update stock ? (Optional logic: decrease stock)
-                # cursor.execute("UPDATE parts SET stock = stock - ? WHERE id = ?", (p["quantity"], p["id"]))
-
-            # Insert Expenses
-            for ex in selected_expenses:
-                cursor.execute("INSERT INTO repair_expenses (repair_id, description, amount) VALUES (?, ?, ?)",
-                               (new_id, ex["description"], ex["amount"]))
-
-            conn.commit()
-            conn.close()
+            with db.write() as cursor:
+                if repair_id:
+                    # Update existing
+                    cursor.execute(
+                        "UPDATE repairs SET vehicle_id=?, technician_id=?, status=?, general_details=? WHERE id=?",
+                        (vehicle_picker.value, technician_dropdown.value, status_dropdown.value, general_details.value, repair_id)
+                    )
+                    new_id = repair_id
+                else:
+                    # Insert new
+                    cursor.execute(
+                        "INSERT INTO repairs (vehicle_id, technician_id, status, general_details, start_date) VALUES (?, ?, ?, ?, ?)",
+                        (vehicle_picker.value, technician_dropdown.value, status_dropdown.value, general_details.value, current_date)
+                    )
+                    new_id = cursor.lastrowid
+
+                # Write only the services, parts and expenses that changed
+                sync_children(cursor, "repair_services", "repair_id", new_id,
+                              ["service_id", "price_at_moment_cents"],
+                              [(s["id"], s["price_cents"]) for s in selected_services])
+                sync_children(cursor, "repair_parts", "repair_id", new_id,
+                              ["part_id", "quantity", "price_at_moment_cents"],
+                              [(p["id"], p["quantity"], p["price_cents"]) for p in selected_parts])
+                sync_children(cursor, "repair_expenses", "repair_id", new_id,
+                              ["description", "amount_cents"],
+                              [(ex["description"], ex["amount_cents"]) for ex in selected_expenses])
+
+                # Total in exact integer cents, summed by SQLite from the saved lines
+                cursor.execute('''
+                    UPDATE repairs SET total_cost_cents =
+                        (SELECT COALESCE(SUM(price_at_moment_cents), 0) FROM repair_services WHERE repair_id = :id)
+                        + (SELECT COALESCE(SUM(quantity * price_at_moment_cents), 0) FROM repair_parts WHERE repair_id = :id)
+                        + (SELECT COALESCE(SUM(amount_cents), 0) FROM repair_expenses WHERE repair_id = :id)
+                    WHERE id = :id
+                ''', {"id": new_id})
             page.close(dialog)
-            load_repairs()
+            repairs_table.refresh(new_id)
             page.open(ft.SnackBar(ft.Text("Reparación guardada")))
         except Exception as ex:
             page.open(ft.SnackBar(ft.Text(f"Error: {str(ex)}")))
@@ -332,18 +340,18 @@ def RepairsView(page):
         content=ft.Container(
             width=600,
             content=ft.Column([
-                vehicle_dropdown,
+                vehicle_picker.control,
                 technician_dropdown,
                 status_dropdown,
                 general_details,
                 ft.Divider(),
                 ft.Text("Servicios", weight=ft.FontWeight.BOLD),
-                ft.Row([service_dropdown, ft.IconButton("add", on_click=add_service_to_list)]),
+                ft.Row([service_picker.control, ft.IconButton("add", on_click=add_service_to_list)], vertical_alignment=ft.CrossAxisAlignment.START),
                 services_list_view,
                 ft.Divider(),
                 ft.Divider(),
                 ft.Text("Refacciones", weight=ft.FontWeight.BOLD),
-                ft.Row([part_dropdown, part_qty, part_price, ft.IconButton("add", on_click=add_part_to_list)]),
+                ft.Row([part_picker.control, part_qty, part_price, ft.IconButton("add", on_click=add_part_to_list)], vertical_alignment=ft.CrossAxisAlignment.START),
                 parts_list_view,
                 ft.Divider(),
                 ft.Text("Gastos Extra", weight=ft.FontWeight.BOLD),
@@ -364,7 +372,9 @@ def RepairsView(page):
         nonlocal current_repair_id
         current_repair_id = None
         load_dropdowns()
-        vehicle_dropdown.value = None
+        vehicle_picker.value = None
+        service_picker.value = None
+        part_picker.value = None
         technician_dropdown.value = None
         status_dropdown.value = "En Proceso"
         general_details.value = ""
@@ -382,51 +392,43 @@ def RepairsView(page):
         nonlocal current_repair_id
         current_repair_id = row["id"]
         load_dropdowns()
+
+        # The repair and all its services, parts and expenses in one query
+        with db.read() as cursor:
+            repair = load_repair(cursor, row["id"])
+        if repair is None:
+            repairs_table.remove(row["id"])
+            page.open(ft.SnackBar(ft.Text("La reparación ya no existe")))
+            return
         
-        vehicle_dropdown.value = str(row["vehicle_id"])
-        technician_dropdown.value = str(row["technician_id"])
-        status_dropdown.value = row["status"]
-        general_details.value = row["general_details"]
-        
-        # Load existing services/parts for this repair
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        vehicle_picker.value = repair["vehicle_id"]
+        service_picker.value = None
+        part_picker.value = None
+        technician_dropdown.value = str(repair["technician_id"])
+        status_dropdown.value = repair["status"]
+        general_details.value = repair["general_details"]
         
-        cursor.execute("SELECT rs.*, s.name FROM repair_services rs JOIN services s ON rs.service_id = s.id WHERE rs.repair_id = ?", (row["id"],))
-        db_services = cursor.fetchall()
         selected_services.clear()
-        for s in db_services:
-            selected_services.append({"id": s["service_id"], "name": s["name"], "price": s["price_at_moment"]})
-            
-        cursor.execute("SELECT rp.*, p.name FROM repair_parts rp JOIN parts p ON rp.part_id = p.id WHERE rp.repair_id = ?", (row["id"],))
-        db_parts = cursor.fetchall()
+        for s in repair["services"]:
+            selected_services.append({"id": s["service_id"], "name": s["name"], "price_cents": s["price_at_moment_cents"]})
+
         selected_parts.clear()
-        for p in db_parts:
-            selected_parts.append({"id": p["part_id"], "name": p["name"], "price": p["price_at_moment"], "quantity": p["quantity"]})
-            
-        conn.close()
-        
-        update_services_list()
-        update_parts_list()
+        for p in repair["parts"]:
+            selected_parts.append({"id": p["part_id"], "name": p["name"], "price_cents": p["price_at_moment_cents"], "quantity": p["quantity"]})
 
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM repair_expenses WHERE repair_id = ?", (row["id"],))
-        db_expenses = cursor.fetchall()
         selected_expenses.clear()
-        for ex in db_expenses:
-            selected_expenses.append({"description": ex["description"], "amount": ex["amount"]})
-        conn.close()
+        for ex in repair["expenses"]:
+            selected_expenses.append({"description": ex["description"], "amount_cents": ex["amount_cents"]})
+
+        update_services_list()
+        update_parts_list()
         update_expenses_list()
         
         dialog.title = ft.Text(f"Editar Reparación #{row['id']}")
         page.open(dialog)
 
-    # Search handler
-    def on_search(e):
-        load_repairs(search_field.value)
-
-    search_field.on_change = on_search
+    # Search runs debounced on a worker thread
+    SearchController(search_field, repairs_table.fetch, repairs_table.show)
 
     load_repairs()
 
@@ -450,7 +452,7 @@ def RepairsView(page):
                 ft.Divider(),
                 ft.Row([search_field], alignment=ft.MainAxisAlignment.END),
                 ft.Container(
-                    content=repairs_table,
+                    content=repairs_table.control,
                     border=ft.border.all(1, "outline"),
                     border_radius=10,
                     padding=10,
@@ -458,6 +460,7 @@ def RepairsView(page):
                 )
             ],
             scroll=ft.ScrollMode.AUTO,
+            on_scroll=repairs_table.on_scroll,
             expand=True
         )
     )
@@ -1,5 +1,8 @@
 import flet as ft
-from database import get_db_connection
+from database import db
+from components.search_controller import SearchController
+from components.keyed_rows import KeyedRows
+from utils.money import to_cents, format_money, money_input
 
 def ServicesView(page):
     # Search field
@@ -17,44 +20,50 @@ def ServicesView(page):
         rows=[]
     )
 
-    def load_services(search_query=None):
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        if search_query:
-            cursor.execute("SELECT * FROM services WHERE name LIKE ?", (f"%{search_query}%",))
-        else:
-            cursor.execute("SELECT * FROM services")
-        rows = cursor.fetchall()
-        conn.close()
-
-        services_table.rows.clear()
-        for row in rows:
-            services_table.rows.append(
-                ft.DataRow(
-                    cells=[
-                        ft.DataCell(ft.Text(str(row["id"]))),
-                        ft.DataCell(ft.Text(row["name"])),
-                        ft.DataCell(ft.Text(row["description"])),
-                        ft.DataCell(ft.Text(f"${row['price']:.2f}")),
-                        ft.DataCell(
-                            ft.Row([
-                                ft.IconButton("edit", icon_color="blue", tooltip="Editar", on_click=lambda e, r=row: open_edit_dialog(r)),
-                                ft.IconButton("delete", icon_color="red", tooltip="Eliminar", on_click=lambda e, id=row["id"]: delete_service(id))
-                            ])
-                        ),
-                    ]
-                )
-            )
+    def fetch_services(search_query=None):
+        with db.read() as cursor:
+            if search_query:
+                cursor.execute("SELECT * FROM services WHERE name LIKE ?", (f"%{search_query}%",))
+            else:
+                cursor.execute("SELECT * FROM services")
+            return cursor.fetchall()
+
+    def fetch_service(service_id):
+        with db.read() as cursor:
+            cursor.execute("SELECT * FROM services WHERE id = ?", (service_id,))
+            return cursor.fetchone()
+
+    def build_service_row(row):
+        return ft.DataRow(
+            cells=[
+                ft.DataCell(ft.Text(str(row["id"]))),
+                ft.DataCell(ft.Text(row["name"])),
+                ft.DataCell(ft.Text(row["description"])),
+                ft.DataCell(ft.Text(format_money(row["price_cents"]))),
+                ft.DataCell(
+                    ft.Row([
+                        ft.IconButton("edit", icon_color="blue", tooltip="Editar", on_click=lambda e, r=row: open_edit_dialog(r)),
+                        ft.IconButton("delete", icon_color="red", tooltip="Eliminar", on_click=lambda e, id=row["id"]: delete_service(id))
+                    ])
+                ),
+            ]
+        )
+
+    # Rows are patched by id after single edits instead of rebuilt
+    service_rows = KeyedRows(services_table, build_service_row, fetch_service)
+
+    def render_services(rows):
+        service_rows.replace(rows)
         page.update()
 
+    def load_services(search_query=None):
+        render_services(fetch_services(search_query))
+
     def delete_service(service_id):
         try:
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            cursor.execute("DELETE FROM services WHERE id = ?", (service_id,))
-            conn.commit()
-            conn.close()
-            load_services()
+            with db.write() as cursor:
+                cursor.execute("DELETE FROM services WHERE id = ?", (service_id,))
+            service_rows.remove(service_id)
             page.open(ft.SnackBar(ft.Text("Servicio eliminado")))
         except Exception as ex:
             page.open(ft.SnackBar(ft.Text(f"Error al eliminar: {str(ex)}")))
@@ -67,7 +76,7 @@ def ServicesView(page):
     def open_edit_dialog(row):
         name.value = row["name"]
         description.value = row["description"]
-        price.value = str(row["price"])
+        price.value = money_input(row["price_cents"])
         
         dialog.title = ft.Text("Editar Servicio")
         save_button.on_click = lambda e: update_service(row["id"])
@@ -75,16 +84,13 @@ def ServicesView(page):
 
     def update_service(service_id):
         try:
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            cursor.execute(
-                "UPDATE services SET name=?, description=?, price=? WHERE id=?",
-                (name.value, description.value, float(price.value), service_id)
-            )
-            conn.commit()
-            conn.close()
+            with db.write() as cursor:
+                cursor.execute(
+                    "UPDATE services SET name=?, description=?, price_cents=? WHERE id=?",
+                    (name.value, description.value, to_cents(price.value), service_id)
+                )
             page.close(dialog)
-            load_services()
+            service_rows.refresh(service_id)
             page.open(ft.SnackBar(ft.Text("Servicio actualizado")))
         except Exception as ex:
             page.open(ft.SnackBar(ft.Text(f"Error: {str(ex)}")))
@@ -95,16 +101,14 @@ def ServicesView(page):
             return
 
         try:
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            cursor.execute(
-                "INSERT INTO services (name, description, price) VALUES (?, ?, ?)",
-                (name.value, description.value, float(price.value))
-            )
-            conn.commit()
-            conn.close()
+            with db.write() as cursor:
+                cursor.execute(
+                    "INSERT INTO services (name, description, price_cents) VALUES (?, ?, ?)",
+                    (name.value, description.value, to_cents(price.value))
+                )
+                service_id = cursor.lastrowid
             page.close(dialog)
-            load_services()
+            service_rows.refresh(service_id)
             page.open(ft.SnackBar(ft.Text("Servicio registrado")))
         except Exception as ex:
             page.open(ft.SnackBar(ft.Text(f"Error: {str(ex)}")))
@@ -130,11 +134,8 @@ def ServicesView(page):
         save_button.on_click = save_new_service
         page.open(dialog)
 
-    # Search handler
-    def on_search(e):
-        load_services(search_field.value)
-
-    search_field.on_change = on_search
+    # Search runs debounced on a worker thread
+    SearchController(search_field, fetch_services, render_services)
 
     load_services()
 
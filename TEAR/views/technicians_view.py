@@ -1,5 +1,7 @@
 import flet as ft
-from database import get_db_connection
+from database import db
+from components.search_controller import SearchController
+from components.keyed_rows import KeyedRows
 
 def TechniciansView(page):
     # Search field
@@ -17,44 +19,50 @@ def TechniciansView(page):
         rows=[]
     )
 
-    def load_technicians(search_query=None):
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        if search_query:
-            cursor.execute("SELECT * FROM technicians WHERE first_name LIKE ? OR last_name LIKE ?", (f"%{search_query}%", f"%{search_query}%"))
-        else:
-            cursor.execute("SELECT * FROM technicians")
-        rows = cursor.fetchall()
-        conn.close()
-
-        technicians_table.rows.clear()
-        for row in rows:
-            technicians_table.rows.append(
-                ft.DataRow(
-                    cells=[
-                        ft.DataCell(ft.Text(str(row["id"]))),
-                        ft.DataCell(ft.Text(row["first_name"])),
-                        ft.DataCell(ft.Text(row["last_name"])),
-                        ft.DataCell(ft.Text(row["phone"])),
-                        ft.DataCell(
-                            ft.Row([
-                                ft.IconButton("edit", icon_color="blue", tooltip="Editar", on_click=lambda e, r=row: open_edit_dialog(r)),
-                                ft.IconButton("delete", icon_color="red", tooltip="Eliminar", on_click=lambda e, id=row["id"]: delete_technician(id))
-                            ])
-                        ),
-                    ]
-                )
-            )
+    def fetch_technicians(search_query=None):
+        with db.read() as cursor:
+            if search_query:
+                cursor.execute("SELECT * FROM technicians WHERE first_name LIKE ? OR last_name LIKE ?", (f"%{search_query}%", f"%{search_query}%"))
+            else:
+                cursor.execute("SELECT * FROM technicians")
+            return cursor.fetchall()
+
+    def fetch_technician(tech_id):
+        with db.read() as cursor:
+            cursor.execute("SELECT * FROM technicians WHERE id = ?", (tech_id,))
+            return cursor.fetchone()
+
+    def build_technician_row(row):
+        return ft.DataRow(
+            cells=[
+                ft.DataCell(ft.Text(str(row["id"]))),
+                ft.DataCell(ft.Text(row["first_name"])),
+                ft.DataCell(ft.Text(row["last_name"])),
+                ft.DataCell(ft.Text(row["phone"])),
+                ft.DataCell(
+                    ft.Row([
+                        ft.IconButton("edit", icon_color="blue", tooltip="Editar", on_click=lambda e, r=row: open_edit_dialog(r)),
+                        ft.IconButton("delete", icon_color="red", tooltip="Eliminar", on_click=lambda e, id=row["id"]: delete_technician(id))
+                    ])
+                ),
+            ]
+        )
+
+    # Rows are patched by id after single edits instead of rebuilt
+    technician_rows = KeyedRows(technicians_table, build_technician_row, fetch_technician)
+
+    def render_technicians(rows):
+        technician_rows.replace(rows)
         page.update()
 
+    def load_technicians(search_query=None):
+        render_technicians(fetch_technicians(search_query))
+
     def delete_technician(tech_id):
         try:
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            cursor.execute("DELETE FROM technicians WHERE id = ?", (tech_id,))
-            conn.commit()
-            conn.close()
-            load_technicians()
+            with db.write() as cursor:
+                cursor.execute("DELETE FROM technicians WHERE id = ?", (tech_id,))
+            technician_rows.remove(tech_id)
             page.open(ft.SnackBar(ft.Text("Técnico eliminado")))
         except Exception as ex:
             page.open(ft.SnackBar(ft.Text(f"Error al eliminar: {str(ex)}")))
@@ -75,16 +83,13 @@ def TechniciansView(page):
 
     def update_technician(tech_id):
         try:
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            cursor.execute(
-                "UPDATE technicians SET first_name=?, last_name=?, phone=? WHERE id=?",
-                (first_name.value, last_name.value, phone.value, tech_id)
-            )
-            conn.commit()
-            conn.close()
+            with db.write() as cursor:
+                cursor.execute(
+                    "UPDATE technicians SET first_name=?, last_name=?, phone=? WHERE id=?",
+                    (first_name.value, last_name.value, phone.value, tech_id)
+                )
             page.close(dialog)
-            load_technicians()
+            technician_rows.refresh(tech_id)
             page.open(ft.SnackBar(ft.Text("Técnico actualizado")))
         except Exception as ex:
             page.open(ft.SnackBar(ft.Text(f"Error: {str(ex)}")))
@@ -95,16 +100,14 @@ def TechniciansView(page):
             return
 
         try:
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            cursor.execute(
-                "INSERT INTO technicians (first_name, last_name, phone) VALUES (?, ?, ?)",
-                (first_name.value, last_name.value, phone.value)
-            )
-            conn.commit()
-            conn.close()
+            with db.write() as cursor:
+                cursor.execute(
+                    "INSERT INTO technicians (first_name, last_name, phone) VALUES (?, ?, ?)",
+                    (first_name.value, last_name.value, phone.value)
+                )
+                tech_id = cursor.lastrowid
             page.close(dialog)
-            load_technicians()
+            technician_rows.refresh(tech_id)
             page.open(ft.SnackBar(ft.Text("Técnico registrado")))
         except Exception as ex:
             page.open(ft.SnackBar(ft.Text(f"Error: {str(ex)}")))
@@ -130,11 +133,8 @@ def TechniciansView(page):
         save_button.on_click = save_new_technician
         page.open(dialog)
 
-    # Search handler
-    def on_search(e):
-        load_technicians(search_field.value)
-
-    search_field.on_change = on_search
+    # Search runs debounced on a worker thread
+    SearchController(search_field, fetch_technicians, render_technicians)
 
     load_technicians()
 
@@ -1,5 +1,7 @@
 import flet as ft
-from database import get_db_connection
+from database import db
+from components.search_controller import SearchController
+from components.keyed_rows import KeyedRows
 
 def ToolsView(page):
     # Search field
@@ -17,44 +19,50 @@ def ToolsView(page):
         rows=[]
     )
 
-    def load_tools(search_query=None):
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        if search_query:
-            cursor.execute("SELECT * FROM tools WHERE name LIKE ?", (f"%{search_query}%",))
-        else:
-            cursor.execute("SELECT * FROM tools")
-        rows = cursor.fetchall()
-        conn.close()
-
-        tools_table.rows.clear()
-        for row in rows:
-            tools_table.rows.append(
-                ft.DataRow(
-                    cells=[
-                        ft.DataCell(ft.Text(str(row["id"]))),
-                        ft.DataCell(ft.Text(row["name"])),
-                        ft.DataCell(ft.Text(row["description"])),
-                        ft.DataCell(ft.Text(str(row["quantity"]))),
-                        ft.DataCell(
-                            ft.Row([
-                                ft.IconButton("edit", icon_color="blue", tooltip="Editar", on_click=lambda e, r=row: open_edit_dialog(r)),
-                                ft.IconButton("delete", icon_color="red", tooltip="Eliminar", on_click=lambda e, id=row["id"]: delete_tool(id))
-                            ])
-                        ),
-                    ]
-                )
-            )
+    def fetch_tools(search_query=None):
+        with db.read() as cursor:
+            if search_query:
+                cursor.execute("SELECT * FROM tools WHERE name LIKE ?", (f"%{search_query}%",))
+            else:
+                cursor.execute("SELECT * FROM tools")
+            return cursor.fetchall()
+
+    def fetch_tool(tool_id):
+        with db.read() as cursor:
+            cursor.execute("SELECT * FROM tools WHERE id = ?", (tool_id,))
+            return cursor.fetchone()
+
+    def build_tool_row(row):
+        return ft.DataRow(
+            cells=[
+                ft.DataCell(ft.Text(str(row["id"]))),
+                ft.DataCell(ft.Text(row["name"])),
+                ft.DataCell(ft.Text(row["description"])),
+                ft.DataCell(ft.Text(str(row["quantity"]))),
+                ft.DataCell(
+                    ft.Row([
+                        ft.IconButton("edit", icon_color="blue", tooltip="Editar", on_click=lambda e, r=row: open_edit_dialog(r)),
+                        ft.IconButton("delete", icon_color="red", tooltip="Eliminar", on_click=lambda e, id=row["id"]: delete_tool(id))
+                    ])
+                ),
+            ]
+        )
+
+    # Rows are patched by id after single edits instead of rebuilt
+    tool_rows = KeyedRows(tools_table, build_tool_row, fetch_tool)
+
+    def render_tools(rows):
+        tool_rows.replace(rows)
         page.update()
 
+    def load_tools(search_query=None):
+        render_tools(fetch_tools(search_query))
+
     def delete_tool(tool_id):
         try:
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            cursor.execute("DELETE FROM tools WHERE id = ?", (tool_id,))
-            conn.commit()
-            conn.close()
-            load_tools()
+            with db.write() as cursor:
+                cursor.execute("DELETE FROM tools WHERE id = ?", (tool_id,))
+            tool_rows.remove(tool_id)
             page.open(ft.SnackBar(ft.Text("Herramienta eliminada")))
         except Exception as ex:
             page.open(ft.SnackBar(ft.Text(f"Error al eliminar: {str(ex)}")))
@@ -75,16 +83,13 @@ def ToolsView(page):
 
     def update_tool(tool_id):
         try:
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            cursor.execute(
-                "UPDATE tools SET name=?, description=?, quantity=? WHERE id=?",
-                (name.value, description.value, int(quantity.value), tool_id)
-            )
-            conn.commit()
-            conn.close()
+            with db.write() as cursor:
+                cursor.execute(
+                    "UPDATE tools SET name=?, description=?, quantity=? WHERE id=?",
+                    (name.value, description.value, int(quantity.value), tool_id)
+                )
             page.close(dialog)
-            load_tools()
+            tool_rows.refresh(tool_id)
             page.open(ft.SnackBar(ft.Text("Herramienta actualizada")))
         except Exception as ex:
             page.open(ft.SnackBar(ft.Text(f"Error: {str(ex)}")))
@@ -95,16 +100,14 @@ def ToolsView(page):
             return
 
         try:
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            cursor.execute(
-                "INSERT INTO tools (name, description, quantity) VALUES (?, ?, ?)",
-                (name.value, description.value, int(quantity.value or 1))
-            )
-            conn.commit()
-            conn.close()
+            with db.write() as cursor:
+                cursor.execute(
+                    "INSERT INTO tools (name, description, quantity) VALUES (?, ?, ?)",
+                    (name.value, description.value, int(quantity.value or 1))
+                )
+                tool_id = cursor.lastrowid
             page.close(dialog)
-            load_tools()
+            tool_rows.refresh(tool_id)
             page.open(ft.SnackBar(ft.Text("Herramienta registrada")))
         except Exception as ex:
             page.open(ft.SnackBar(ft.Text(f"Error: {str(ex)}")))
@@ -130,11 +133,8 @@ def ToolsView(page):
         save_button.on_click = save_new_tool
         page.open(dialog)
 
-    # Search handler
-    def on_search(e):
-        load_tools(search_field.value)
-
-    search_field.on_change = on_search
+    # Search runs debounced on a worker thread
+    SearchController(search_field, fetch_tools, render_tools)
 
     load_tools()
 
@@ -1,5 +1,5 @@
 import flet as ft
-from database import get_db_connection
+from database import db
 
 def UsersView(page):
     # State for the data table
@@ -15,11 +15,9 @@ def UsersView(page):
     )
 
     def load_users():
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM users")
-        rows = cursor.fetchall()
-        conn.close()
+        with db.read() as cursor:
+            cursor.execute("SELECT * FROM users")
+            rows = cursor.fetchall()
 
         users_table.rows.clear()
         for row in rows:
@@ -62,14 +60,11 @@ def UsersView(page):
                 import hashlib
                 hashed_password = hashlib.sha256(password_field.value.encode()).hexdigest()
                 
-                conn = get_db_connection()
-                cursor = conn.cursor()
-                cursor.execute(
-                    "INSERT INTO users (username, password_hash, role, full_name) VALUES (?, ?, ?, ?)",
-                    (username_field.value, hashed_password, role_dropdown.value, fullname_field.value)
-                )
-                conn.commit()
-                conn.close()
+                with db.write() as cursor:
+                    cursor.execute(
+                        "INSERT INTO users (username, password_hash, role, full_name) VALUES (?, ?, ?, ?)",
+                        (username_field.value, hashed_password, role_dropdown.value, fullname_field.value)
+                    )
                 page.close(dlg)
                 load_users()
                 page.open(ft.SnackBar(ft.Text("Usuario registrado exitosamente")))
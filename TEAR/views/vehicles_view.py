@@ -1,140 +1,213 @@
 import flet as ft
-from database import get_db_connection
-from utils.camera_bridge import GestorCamaraMovil
+import json
+from database import db
+from components.search_controller import SearchController
+from components.paginated_table import PaginatedTable, keyset_query
+from components.autocomplete import Autocomplete
+from utils.search import search
+from utils.camera_bridge import obtener_gestor
+from utils.image_pipeline import thumbnail_path, thumbnail_file
+from utils import catalog
+import threading
 import time
 import os
 from datetime import datetime, timedelta
 
+# Rows of the vehicles list; this and the history queries are also checked by check_indexes.py
+VEHICLES_QUERY = '''
+    SELECT v.*, c.first_name, c.last_name, c.phone 
+    FROM vehicles v
+    JOIN clients c ON v.client_id = c.id
+'''
+
+# History entries, newest first. A photo counts as present when its blob is
+# in the photo store, so the timeline never has to stat files on disk; photos
+# from before the store are imported by _migration_import_legacy_photos.
+_HISTORY_QUERY = '''
+    SELECT h.id, h.description, h.photo_path, h.created_at, b.path IS NOT NULL AS has_photo
+    FROM vehicle_history h
+    LEFT JOIN photo_blobs b ON b.path = h.photo_path
+    WHERE h.vehicle_id = ?
+'''
+HISTORY_FIRST_PAGE = _HISTORY_QUERY + " ORDER BY h.created_at DESC, h.id DESC LIMIT ?"
+HISTORY_NEXT_PAGE = _HISTORY_QUERY + " AND (h.created_at, h.id) < (?, ?) ORDER BY h.created_at DESC, h.id DESC LIMIT ?"
+HISTORY_PAGE_SIZE = 20
+
 def VehiclesView(page):
-    # Initialize Camera Manager
+    # Camera bridge shared by the whole app; each capture opens its own session.
     # Photos will be saved in 'assets/vehicle_photos'
-    camera_manager = GestorCamaraMovil(directorio_guardado="assets/vehicle_photos")
+    camera_manager = obtener_gestor()
+    camera_token = None
 
     # Search field
     search_field = ft.TextField(label="Buscar por placa o teléfono de cliente", suffix_icon="search", width=400)
 
-    # Data Table
-    vehicles_table = ft.DataTable(
-        columns=[
-            ft.DataColumn(ft.Text("ID")),
-            ft.DataColumn(ft.Text("Marca")),
-            ft.DataColumn(ft.Text("Modelo")),
-            ft.DataColumn(ft.Text("Año")),
-            ft.DataColumn(ft.Text("Placa")),
-            ft.DataColumn(ft.Text("Cliente")),
-            ft.DataColumn(ft.Text("Foto")), # New column
-            ft.DataColumn(ft.Text("Acciones")),
-        ],
-        rows=[]
-    )
+    vehicles_query = VEHICLES_QUERY
 
-    def load_vehicles(search_query=None):
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        query = '''
-            SELECT v.*, c.first_name, c.last_name, c.phone 
-            FROM vehicles v
-            JOIN clients c ON v.client_id = c.id
-        '''
-        
-        if search_query:
-            query += " WHERE v.plate LIKE ? OR c.phone LIKE ?"
-            cursor.execute(query, (f"%{search_query}%", f"%{search_query}%"))
-        else:
-            cursor.execute(query)
-            
-        rows = cursor.fetchall()
-        conn.close()
-
-        vehicles_table.rows.clear()
-        for row in rows:
-            photo_icon = ft.Icon("photo_camera", color="grey")
-            # Check if photo_path exists and is not None
-            has_photo = False
-            try:
-                if row["photo_path"]:
-                    has_photo = True
-            except IndexError:
-                pass
-
-            if has_photo: # Check if photo exists
-                photo_icon = ft.IconButton(
-                    "photo", 
-                    icon_color="blue", 
-                    tooltip="Ver Foto",
-                    on_click=lambda e, path=row["photo_path"]: show_photo_dialog(path)
+    def fetch_vehicles(sort, after, limit, search_query=None):
+        with db.read() as cursor:
+            if search_query:
+                # Keep the ranking returned by the search index
+                cursor.execute(
+                    vehicles_query + " JOIN json_each(?) hit ON hit.value = v.id ORDER BY hit.key",
+                    (json.dumps(search(search_query, "vehicles", limit)),)
                 )
+            else:
+                cursor.execute(*keyset_query(vehicles_query, sort, after, limit, id_column="v.id"))
+            return cursor.fetchall()
 
-            vehicles_table.rows.append(
-                ft.DataRow(
-                    cells=[
-                        ft.DataCell(ft.Text(str(row["id"]))),
-                        ft.DataCell(ft.Text(row["brand"])),
-                        ft.DataCell(ft.Text(row["model"])),
-                        ft.DataCell(ft.Text(str(row["year"]))),
-                        ft.DataCell(ft.Text(row["plate"])),
-                        ft.DataCell(ft.Text(f"{row['first_name']} {row['last_name']}")),
-                        ft.DataCell(photo_icon),
-                        ft.DataCell(
-                            ft.Row([
-                                ft.IconButton("history", icon_color="orange", tooltip="Historial", on_click=lambda e, id=row["id"]: show_history_dialog(id)),
-                                ft.IconButton("edit", icon_color="blue", tooltip="Editar", on_click=lambda e, r=row: open_edit_dialog(r)),
-                                ft.IconButton("delete", icon_color="red", tooltip="Eliminar", on_click=lambda e, id=row["id"]: delete_vehicle(id))
-                            ])
-                        ),
-                    ]
-                )
+    def fetch_vehicle(vehicle_id):
+        with db.read() as cursor:
+            cursor.execute(vehicles_query + " WHERE v.id = ?", (vehicle_id,))
+            return cursor.fetchone()
+
+    def build_vehicle_row(row):
+        photo_icon = ft.Icon("photo_camera", color="grey")
+        # Check if photo_path exists and is not None
+        has_photo = False
+        try:
+            if row["photo_path"]:
+                has_photo = True
+        except IndexError:
+            pass
+
+        if has_photo: # Check if photo exists
+            photo_icon = ft.IconButton(
+                "photo", 
+                icon_color="blue", 
+                tooltip="Ver Foto",
+                on_click=lambda e, path=row["photo_path"]: show_photo_dialog(path)
             )
-        page.update()
+
+        return ft.DataRow(
+            cells=[
+                ft.DataCell(ft.Text(str(row["id"]))),
+                ft.DataCell(ft.Text(row["brand"])),
+                ft.DataCell(ft.Text(row["model"])),
+                ft.DataCell(ft.Text(str(row["year"]))),
+                ft.DataCell(ft.Text(row["plate"])),
+                ft.DataCell(ft.Text(f"{row['first_name']} {row['last_name']}")),
+                ft.DataCell(photo_icon),
+                ft.DataCell(
+                    ft.Row([
+                        ft.IconButton("history", icon_color="orange", tooltip="Historial", on_click=lambda e, id=row["id"]: show_history_dialog(id)),
+                        ft.IconButton("edit", icon_color="blue", tooltip="Editar", on_click=lambda e, r=row: open_edit_dialog(r)),
+                        ft.IconButton("delete", icon_color="red", tooltip="Eliminar", on_click=lambda e, id=row["id"]: delete_vehicle(id))
+                    ])
+                ),
+            ]
+        )
+
+    # Data Table (one page at a time, sorted by the database)
+    vehicles_table = PaginatedTable(
+        page,
+        columns=["ID", "Marca", "Modelo", "Año", "Placa", "Cliente", "Foto", "Acciones"],
+        fetch_page=fetch_vehicles,
+        build_row=build_vehicle_row,
+        fetch_row=fetch_vehicle,
+        sort_columns={
+            0: ("v.id", "id"),
+            1: ("v.brand", "brand"),
+            2: ("v.model", "model"),
+            3: ("v.year", "year"),
+            4: ("v.plate", "plate"),
+            5: ("c.first_name", "first_name"),
+        },
+    )
+
+    def load_vehicles():
+        vehicles_table.reload()
+
+    def open_original_photo(path):
+        # The full-size photo only leaves the disk when the user asks for it
+        if path and os.path.exists(path):
+            os.startfile(os.path.abspath(path))
+        else:
+            page.open(ft.SnackBar(ft.Text("La foto original no existe")))
 
     def show_photo_dialog(path):
-        # Dialog to show the photo
+        # Dialog to show the photo (400px thumbnail)
         photo_dlg = ft.AlertDialog(
             title=ft.Text("Evidencia Fotográfica"),
-            content=ft.Image(src=path, width=400, height=400, fit=ft.ImageFit.CONTAIN),
-            actions=[ft.TextButton("Cerrar", on_click=lambda e: page.close(photo_dlg))],
+            content=ft.Image(src=thumbnail_path(path, 400), width=400, height=400, fit=ft.ImageFit.CONTAIN),
+            actions=[
+                ft.TextButton("Ver original", on_click=lambda e: open_original_photo(path)),
+                ft.TextButton("Cerrar", on_click=lambda e: page.close(photo_dlg)),
+            ],
         )
         page.open(photo_dlg)
 
-    def show_history_dialog(vehicle_id):
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM vehicle_history WHERE vehicle_id = ? ORDER BY created_at DESC", (vehicle_id,))
-        history_rows = cursor.fetchall()
-        conn.close()
+    def fetch_history_page(vehicle_id, after=None, limit=HISTORY_PAGE_SIZE):
+        """One page of a vehicle's history, starting right after the row `after`."""
+        with db.read() as cursor:
+            if after is None:
+                cursor.execute(HISTORY_FIRST_PAGE, (vehicle_id, limit))
+            else:
+                cursor.execute(HISTORY_NEXT_PAGE, (vehicle_id, after["created_at"], after["id"], limit))
+            return cursor.fetchall()
 
-        history_list = ft.ListView(expand=True, spacing=10, padding=20)
-        
-        if not history_rows:
-            history_list.controls.append(ft.Text("No hay historial registrado para este vehículo."))
+    def build_history_entry(row):
+        img_control = ft.Container()
+        if row["has_photo"]:
+            img_control = ft.Container(
+                content=ft.Image(
+                    src=thumbnail_file(row["photo_path"], 200),
+                    width=200, height=200, fit=ft.ImageFit.CONTAIN, border_radius=10,
+                    error_content=ft.Icon("broken_image", color="grey"),
+                ),
+                tooltip="Ver original",
+                on_click=lambda e, path=row["photo_path"]: open_original_photo(path),
+            )
         
-        for row in history_rows:
-            img_control = ft.Container()
-            if row["photo_path"] and os.path.exists(row["photo_path"]):
-                img_control = ft.Image(src=row["photo_path"], width=200, height=200, fit=ft.ImageFit.CONTAIN, border_radius=10)
-            
-            # Convert UTC to Mexico City time (UTC-6)
-            # SQLite stores as "YYYY-MM-DD HH:MM:SS"
+        # Convert UTC to Mexico City time (UTC-6)
+        # SQLite stores as "YYYY-MM-DD HH:MM:SS"
+        try:
+            utc_time = datetime.strptime(row['created_at'], "%Y-%m-%d %H:%M:%S")
+            mexico_time = utc_time - timedelta(hours=6)
+            formatted_time = mexico_time.strftime("%d/%m/%Y %I:%M %p")
+        except ValueError:
+            formatted_time = row['created_at'] # Fallback if format is different
+
+        return ft.Container(
+            padding=10,
+            bgcolor="surfacevariant",
+            border_radius=10,
+            content=ft.Column([
+                ft.Text(f"Fecha: {formatted_time}", weight=ft.FontWeight.BOLD),
+                ft.Text(f"Detalles: {row['description']}"),
+                img_control
+            ])
+        )
+
+    def show_history_dialog(vehicle_id):
+        # ListView only builds the entries on screen, so thumbnails further down
+        # are requested as the user scrolls; older pages are fetched near the end
+        history_list = ft.ListView(expand=True, spacing=10, padding=20, on_scroll_interval=100)
+        last_row = None
+        has_more = True
+        loading = threading.Lock()
+
+        def load_more_history():
+            nonlocal last_row, has_more
+            if not has_more or not loading.acquire(blocking=False):
+                return
             try:
-                utc_time = datetime.strptime(row['created_at'], "%Y-%m-%d %H:%M:%S")
-                mexico_time = utc_time - timedelta(hours=6)
-                formatted_time = mexico_time.strftime("%d/%m/%Y %I:%M %p")
-            except ValueError:
-                formatted_time = row['created_at'] # Fallback if format is different
+                rows = fetch_history_page(vehicle_id, last_row)
+                history_list.controls.extend(build_history_entry(row) for row in rows)
+                last_row = rows[-1] if rows else last_row
+                has_more = len(rows) == HISTORY_PAGE_SIZE
+            finally:
+                loading.release()
 
-            history_list.controls.append(
-                ft.Container(
-                    padding=10,
-                    bgcolor="surfacevariant",
-                    border_radius=10,
-                    content=ft.Column([
-                        ft.Text(f"Fecha: {formatted_time}", weight=ft.FontWeight.BOLD),
-                        ft.Text(f"Detalles: {row['description']}"),
-                        img_control
-                    ])
-                )
-            )
+        def on_history_scroll(e):
+            if e.max_scroll_extent and e.pixels >= e.max_scroll_extent - 300:
+                load_more_history()
+                history_list.update()
+
+        history_list.on_scroll = on_history_scroll
+        load_more_history()
+        if not history_list.controls:
+            history_list.controls.append(ft.Text("No hay historial registrado para este vehículo."))
 
         history_dlg = ft.AlertDialog(
             title=ft.Text("Historial de Detalles"),
@@ -145,13 +218,10 @@ def VehiclesView(page):
 
     def delete_vehicle(vehicle_id):
         try:
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            cursor.execute("DELETE FROM vehicles WHERE id = ?", (vehicle_id,))
-            cursor.execute("DELETE FROM vehicle_history WHERE vehicle_id = ?", (vehicle_id,)) # Clean history
-            conn.commit()
-            conn.close()
-            load_vehicles()
+            with db.write() as cursor:
+                cursor.execute("DELETE FROM vehicles WHERE id = ?", (vehicle_id,))
+                cursor.execute("DELETE FROM vehicle_history WHERE vehicle_id = ?", (vehicle_id,)) # Clean history
+            vehicles_table.remove(vehicle_id)
             page.open(ft.SnackBar(ft.Text("Vehículo eliminado")))
         except Exception as ex:
             page.open(ft.SnackBar(ft.Text(f"Error al eliminar: {str(ex)}")))
@@ -162,7 +232,16 @@ def VehiclesView(page):
     year = ft.TextField(label="Año", input_filter=ft.InputFilter(allow=True, regex_string=r"[0-9]"))
     plate = ft.TextField(label="Placa")
     details = ft.TextField(label="Detalles (Golpes, rayones, etc.)", multiline=True)
-    client_dropdown = ft.Dropdown(label="Cliente Propietario")
+    def describe_client(key):
+        c = catalog.clients.get(key)
+        return f"{c['first_name']} {c['last_name']} ({c['phone']})" if c else None
+
+    # Owners are found by name, phone or the plate of a car they already own
+    client_picker = Autocomplete(
+        "Cliente Propietario (nombre, teléfono o placa)",
+        lambda text, limit: search(text, "clients", limit),
+        describe_client,
+    )
     
     # Camera UI components
     img_qr = ft.Image(width=150, height=150, visible=False)
@@ -170,6 +249,12 @@ def VehiclesView(page):
     img_resultado = ft.Image(width=200, height=200, fit=ft.ImageFit.CONTAIN, visible=False)
     current_photo_path = None # Variable to store the path of the taken photo
 
+    def close_camera_session():
+        nonlocal camera_token
+        if camera_token:
+            camera_manager.cerrar_sesion(camera_token)
+            camera_token = None
+
     def on_photo_received(path):
         nonlocal current_photo_path
         current_photo_path = path
@@ -181,11 +266,12 @@ def VehiclesView(page):
         txt_instrucciones.color = "green"
         
         # Refresh image with timestamp to avoid cache
-        img_resultado.src = f"{path}?v={time.time()}"
+        img_resultado.src = f"{thumbnail_path(path, 200)}?v={time.time()}"
         img_resultado.visible = True
         page.update()
 
     def btn_vincular_click(e):
+        nonlocal camera_token
         if not plate.value:
             page.open(ft.SnackBar(ft.Text("Primero ingresa la placa para nombrar la foto")))
             return
@@ -193,12 +279,14 @@ def VehiclesView(page):
         # Use timestamp to ensure unique filename for history
         filename = f"{plate.value}_{int(time.time())}_evidencia.jpg"
         
-        ruta_qr, url = camera_manager.iniciar_servicio(
+        close_camera_session()
+        qr_base64, url, camera_token = camera_manager.iniciar_servicio(
             nombre_archivo_destino=filename,
-            callback=on_photo_received
+            callback=on_photo_received,
+            directorio="assets/vehicle_photos"
         )
         
-        img_qr.src = ruta_qr
+        img_qr.src_base64 = qr_base64
         img_qr.visible = True
         txt_instrucciones.value = f"Escanea el QR con tu celular.\nO entra a: {url}"
         txt_instrucciones.color = "black"
@@ -213,27 +301,14 @@ def VehiclesView(page):
         color="black"
     )
 
-    def load_clients_for_dropdown():
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT id, first_name, last_name, phone FROM clients")
-        clients = cursor.fetchall()
-        conn.close()
-        
-        client_dropdown.options = [
-            ft.dropdown.Option(key=str(c["id"]), text=f"{c['first_name']} {c['last_name']} ({c['phone']})")
-            for c in clients
-        ]
-
     def open_edit_dialog(row):
         nonlocal current_photo_path
-        load_clients_for_dropdown()
         brand.value = row["brand"]
         model.value = row["model"]
         year.value = str(row["year"])
         plate.value = row["plate"]
         details.value = row["details"]
-        client_dropdown.value = str(row["client_id"])
+        client_picker.value = row["client_id"]
         
         # Load existing photo if any
         try:
@@ -241,65 +316,77 @@ def VehiclesView(page):
         except IndexError:
             current_photo_path = None
         if current_photo_path and os.path.exists(current_photo_path):
-            img_resultado.src = current_photo_path
+            img_resultado.src = thumbnail_path(current_photo_path, 200)
             img_resultado.visible = True
             txt_instrucciones.value = "Foto actual cargada."
         else:
             img_resultado.visible = False
             txt_instrucciones.value = "Sin foto registrada."
             
+        close_camera_session()
         img_qr.visible = False
         
         dialog.title = ft.Text("Editar Vehículo")
         save_button.on_click = lambda e: update_vehicle(row["id"])
         page.open(dialog)
 
+    def client_exists():
+        # The owner may have been deleted after the catalog was loaded
+        if catalog.clients.get(client_picker.value) is None:
+            client_picker.value = None
+            page.open(ft.SnackBar(ft.Text("Cliente no encontrado")))
+            return False
+        return True
+
     def update_vehicle(vehicle_id):
+        if not client_picker.value:
+            page.open(ft.SnackBar(ft.Text("El cliente es obligatorio")))
+            return
+        if not client_exists():
+            return
         try:
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            cursor.execute(
-                "UPDATE vehicles SET client_id=?, brand=?, model=?, year=?, plate=?, details=?, photo_path=? WHERE id=?",
-                (client_dropdown.value, brand.value, model.value, year.value, plate.value, details.value, current_photo_path, vehicle_id)
-            )
-            
-            # Add to history if there are details or a photo
-            # We add to history on every edit to track state changes
-            cursor.execute(
-                "INSERT INTO vehicle_history (vehicle_id, description, photo_path) VALUES (?, ?, ?)",
-                (vehicle_id, details.value, current_photo_path)
-            )
-            conn.commit()
-            conn.close()
+            with db.write() as cursor:
+                cursor.execute(
+                    "UPDATE vehicles SET client_id=?, brand=?, model=?, year=?, plate=?, details=?, photo_path=? WHERE id=?",
+                    (client_picker.value, brand.value, model.value, year.value, plate.value, details.value, current_photo_path, vehicle_id)
+                )
+
+                # Add to history if there are details or a photo
+                # We add to history on every edit to track state changes
+                cursor.execute(
+                    "INSERT INTO vehicle_history (vehicle_id, description, photo_path) VALUES (?, ?, ?)",
+                    (vehicle_id, details.value, current_photo_path)
+                )
+            close_camera_session()
             page.close(dialog)
-            load_vehicles()
+            vehicles_table.refresh(vehicle_id)
             page.open(ft.SnackBar(ft.Text("Vehículo actualizado")))
         except Exception as ex:
             page.open(ft.SnackBar(ft.Text(f"Error: {str(ex)}")))
 
     def save_new_vehicle(e):
-        if not brand.value or not model.value or not plate.value or not client_dropdown.value:
+        if not brand.value or not model.value or not plate.value or not client_picker.value:
             page.open(ft.SnackBar(ft.Text("Marca, Modelo, Placa y Cliente son obligatorios")))
             return
+        if not client_exists():
+            return
 
         try:
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            cursor.execute(
-                "INSERT INTO vehicles (client_id, brand, model, year, plate, details, photo_path) VALUES (?, ?, ?, ?, ?, ?, ?)",
-                (client_dropdown.value, brand.value, model.value, year.value, plate.value, details.value, current_photo_path)
-            )
-            new_id = cursor.lastrowid
-            
-            # Insert initial history
-            cursor.execute(
-                "INSERT INTO vehicle_history (vehicle_id, description, photo_path) VALUES (?, ?, ?)",
-                (new_id, details.value, current_photo_path)
-            )
-            conn.commit()
-            conn.close()
+            with db.write() as cursor:
+                cursor.execute(
+                    "INSERT INTO vehicles (client_id, brand, model, year, plate, details, photo_path) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (client_picker.value, brand.value, model.value, year.value, plate.value, details.value, current_photo_path)
+                )
+                new_id = cursor.lastrowid
+
+                # Insert initial history
+                cursor.execute(
+                    "INSERT INTO vehicle_history (vehicle_id, description, photo_path) VALUES (?, ?, ?)",
+                    (new_id, details.value, current_photo_path)
+                )
+            close_camera_session()
             page.close(dialog)
-            load_vehicles()
+            vehicles_table.refresh(new_id)
             page.open(ft.SnackBar(ft.Text("Vehículo registrado")))
         except Exception as ex:
             page.open(ft.SnackBar(ft.Text(f"Error: {str(ex)}")))
@@ -311,7 +398,7 @@ def VehiclesView(page):
         content=ft.Container(
             width=500,
             content=ft.Column([
-                client_dropdown, 
+                client_picker.control, 
                 brand, 
                 model, 
                 year, 
@@ -334,15 +421,15 @@ def VehiclesView(page):
 
     def open_add_dialog(e):
         nonlocal current_photo_path
-        load_clients_for_dropdown()
         brand.value = ""
         model.value = ""
         year.value = ""
         plate.value = ""
         details.value = ""
-        client_dropdown.value = None
+        client_picker.value = None
         
         # Reset camera UI
+        close_camera_session()
         current_photo_path = None
         img_qr.visible = False
         img_resultado.visible = False
@@ -353,11 +440,8 @@ def VehiclesView(page):
         save_button.on_click = save_new_vehicle
         page.open(dialog)
 
-    # Search handler
-    def on_search(e):
-        load_vehicles(search_field.value)
-
-    search_field.on_change = on_search
+    # Search runs debounced on a worker thread
+    SearchController(search_field, vehicles_table.fetch, vehicles_table.show)
 
     load_vehicles()
 
@@ -381,7 +465,7 @@ def VehiclesView(page):
                 ft.Divider(),
                 ft.Row([search_field], alignment=ft.MainAxisAlignment.END),
                 ft.Container(
-                    content=vehicles_table,
+                    content=vehicles_table.control,
                     border=ft.border.all(1, "outline"),
                     border_radius=10,
                     padding=10,
@@ -389,6 +473,7 @@ def VehiclesView(page):
                 )
             ],
             scroll=ft.ScrollMode.AUTO,
+            on_scroll=vehicles_table.on_scroll,
             expand=True
         )
     )